@@ -0,0 +1,417 @@
+# Benchmarks for the generation, layout and rendering hot paths.
+#
+# Each benchmark is timed as the best of several repeats (seconds per call),
+# then run once more under tracemalloc for its peak Python allocation; the
+# rendering ones also report PDF bytes. Results are compared against a
+# baseline saved per machine, and the run exits non-zero when anything
+# regresses past the tolerances.
+#
+#   python benchmarks.py                      # run and compare with the baseline
+#   python benchmarks.py --save               # run and store as the new baseline
+#   python benchmarks.py -k render batch      # only names containing these
+#
+# Benchmarks whose module cannot be imported here are reported as skipped.
+# The startup.* entries time fresh interpreters and must also stay inside
+# STARTUP_BUDGET whatever the baseline says.
+
+import argparse
+import gc
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+
+import mathtest as mt
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(HERE, ".benchmarks", "baseline.json")
+
+TOLERANCE = {"time": 0.25, "peak_kb": 0.25, "bytes": 0.05}   # allowed growth over the baseline
+# Microsecond-scale calls swing by half on a busy machine; only flag a doubling.
+TIME_TOLERANCE = {"gen.": 1.0}
+
+# Cold-start budget, seconds per invocation (a bare interpreter is ~20 ms here).
+# Heavy dependencies must be imported where they are used, not at module level.
+STARTUP_BUDGET = {"startup.mathtest_help": 0.1, "startup.mathtest_key_only": 0.1, "startup.langtest_help": 0.1}
+HEAVY_MODULES = ("reportlab.pdfgen", "reportlab.lib.colors", "openai", "PIL", "numpy")
+
+
+class Skip(Exception):
+    pass
+
+
+class Failed(Exception):
+    pass
+
+
+# -----------------------
+# Benchmarks
+# -----------------------
+# Each entry builds its workload and returns (fn, number, bytes_of) where fn()
+# is one call, number is calls per timing repeat, and bytes_of (or None)
+# gives the PDF size fn() produced.
+BENCHMARKS = {}
+
+
+def bench(name):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def _generator(fn, *args):
+    def setup():
+        rng = random.Random(0)
+        return (lambda: fn(*args, rng)), 2000, None
+    return setup
+
+
+for _name, _fn, _args in [
+    ("addition", mt.make_addition, ()),
+    ("subtraction", mt.make_subtraction, ()),
+    ("multiplication", mt.make_multiplication, ()),
+    ("division_exact", mt.make_division_exact, ()),
+    ("simplify_fraction", mt.make_simplify_fraction, ()),
+    ("fraction_sum", mt.make_fraction_sum, ()),
+    ("prime_factor_targets", mt.make_prime_factor_targets, (None,)),
+    ("mixed_number", mt.make_mixed_number, ()),
+    ("improper_fraction", mt.make_improper_fraction, ()),
+    ("hcf_lcm_pair", mt.make_hcf_lcm_pair, ()),
+    ("area_figure", mt.make_area_figure, ("l_shape",)),
+    ("problem_set", mt.make_problem_set, ()),
+]:
+    bench(f"gen.{_name}")(_generator(_fn, *_args))
+
+
+def _scratch_canvas():
+    from reportlab.pdfgen.canvas import Canvas
+    return Canvas(io.BytesIO(), pagesize=mt.letter)
+
+
+@bench("draw.vertical_arithmetic")
+def _():
+    c = _scratch_canvas()
+    nums = mt.make_addition(random.Random(0))
+    return (lambda: mt.draw_vertical_arithmetic(c, 100, 600, nums, op="+", result_blanks=True)), 500, None
+
+
+@bench("draw.area_figures")
+def _():
+    c = _scratch_canvas()
+    rng = random.Random(0)
+    areas = [mt.make_area_figure(kind, rng) for kind in mt.AREA_KINDS]
+    return (lambda: mt.draw_area_figures(c, 300, areas)), 500, None
+
+
+@bench("draw.long_multiplication")
+def _():
+    c = _scratch_canvas()
+    top, bottom = mt.make_multiplication(random.Random(0))
+    return (lambda: mt.draw_long_multiplication_template(c, 100, 600, top, bottom)), 500, None
+
+
+def _langtest():
+    try:
+        import langtest
+    except ImportError as e:
+        raise Skip(f"langtest not importable: {e}")
+    return langtest
+
+
+@bench("layout.draw_wrapped_long")
+def _():
+    langtest = _langtest()
+    words = "The river carries small stones and sand down to the wide sea every single day".split()
+    rng = random.Random(0)
+    texts = [" ".join(rng.choice(words) for _ in range(1500)) + f" ({i})" for i in range(64)]
+    it = iter(range(10 ** 9))
+    c = _scratch_canvas()
+
+    def run():
+        # a different passage each call, so the layout cache does not hide the work
+        langtest.draw_wrapped(c, 50, 700, texts[next(it) % len(texts)], width=500)
+    return run, 64, None
+
+
+@bench("layout.math_worksheet")
+def _():
+    # the full pagination pass, bypassing the per-shape cache
+    shape = mt.worksheet_shape(mt.default_profile())
+    return (lambda: mt._layout.__wrapped__(mt.WORKSHEET_SPEC, shape)), 200, None
+
+
+@bench("layout.math_cached")
+def _():
+    # what each seed pays: a cache lookup keyed by the set's item counts
+    ps = mt.make_problem_set(random.Random(0))
+    return (lambda: mt.worksheet_layout(ps)), 20000, None
+
+
+@bench("gen.reading_test_local")
+def _():
+    langtest = _langtest()
+    provider = langtest.make_provider("local")
+    it = iter(range(10 ** 9))
+
+    def run():
+        i = next(it)
+        langtest.generate_reading_test(provider, topic=langtest.TOPIC_POOL[i % len(langtest.TOPIC_POOL)],
+                                       variant=i)
+    return run, 500, None
+
+
+@bench("render.math_test")
+def _():
+    out = io.BytesIO()
+
+    def run():
+        out.seek(0)
+        out.truncate()
+        mt.render_seed(out, 1, "January 11, 2026")
+    return run, 20, lambda: len(out.getvalue())
+
+
+@bench("render.reading_test")
+def _():
+    langtest = _langtest()
+    import langbulk
+    test = langbulk.fake_test("volcanoes")
+    out = os.path.join(tempfile.mkdtemp(), "reading.pdf")
+    return (lambda: langtest.render_pdf(test, out_pdf=out, today=date(2026, 1, 11))), 20, \
+        lambda: os.path.getsize(out)
+
+
+def _preview():
+    try:
+        import PIL  # noqa: F401
+        import preview
+    except ImportError as e:
+        raise Skip(f"preview needs pillow: {e}")
+    return preview
+
+
+@bench("preview.math_sheet")
+def _():
+    preview = _preview()
+    ps = mt.make_problem_set(random.Random(0))
+    return (lambda: [preview.to_png(p) for p in preview.math_pages(ps, "January 11, 2026")]), 10, None
+
+
+@bench("preview.cache_hit")
+def _():
+    preview = _preview()
+    cache = preview.PreviewCache(tempfile.mkdtemp())
+    ws_id = mt.worksheet_id(0, today_str="January 11, 2026")
+    preview.math_preview(ws_id, cache)
+    return (lambda: preview.math_preview(ws_id, cache)), 200, None
+
+
+@bench("scangrade.sheet")
+def _():
+    _preview()
+    import scangrade
+    ws_id = mt.worksheet_id(0, today_str="January 11, 2026")
+    pages = scangrade.synthetic_scan(ws_id, wrong={"3", "p2-1a"})
+    scangrade.grade_sheet(ws_id, pages, samples=None)
+    return (lambda: scangrade.grade_sheet(ws_id, pages, samples=None)), 20, None
+
+
+def _startup(*args):
+    def setup():
+        cmd = [sys.executable, *args]
+        # bytecode caching on, as in normal use; the first (warm-up) call writes it
+        env = {k: v for k, v in os.environ.items() if k != "PYTHONDONTWRITEBYTECODE"}
+
+        def run():
+            proc = subprocess.run(cmd, cwd=HERE, env=env, capture_output=True, text=True)
+            if proc.returncode:
+                raise Failed(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "non-zero exit")
+        return run, 1, None
+    return setup
+
+
+bench("startup.mathtest_help")(_startup("mathtest.py", "--help"))
+bench("startup.mathtest_key_only")(_startup("mathtest.py", "--regenerate", "M1-44534422223554-1-7JVR",
+                                            "--key-only"))
+bench("startup.langtest_help")(_startup("langtest.py", "--help"))
+bench("startup.imports")(_startup("-c", f"""
+import sys, mathtest, langtest, langbulk
+heavy = sorted(m for m in sys.modules if m.startswith({HEAVY_MODULES!r}))
+if heavy:
+    sys.exit("imported at module level: " + ", ".join(heavy))
+"""))
+
+
+def _batch(n):
+    def setup():
+        out_dir = tempfile.mkdtemp()
+        seeds = list(range(n))
+
+        def run():
+            shutil.rmtree(out_dir, ignore_errors=True)
+            mt.generate_batch(n, seeds=seeds, out_dir=out_dir, today_str="January 11, 2026")
+        return run, 1, lambda: sum(os.path.getsize(os.path.join(out_dir, f)) for f in os.listdir(out_dir))
+    return setup
+
+
+for _n in (1, 10, 1000):
+    bench(f"batch.{_n}")(_batch(_n))
+
+
+# -----------------------
+# Runner
+# -----------------------
+MIN_REPEAT_TIME = 0.1                               # seconds; short calls get batched up to this
+
+
+def measure(setup, repeat=5):
+    fn, number, bytes_of = setup()
+    t0 = time.perf_counter()
+    fn()                                            # warm caches and lazy imports
+    once = time.perf_counter() - t0
+    number = max(number, int(MIN_REPEAT_TIME / max(once, 1e-7)) if number > 1 else 1)
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - t0) / number)
+
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    result = {"time": best, "peak_kb": peak / 1024}
+    if bytes_of is not None:
+        result["bytes"] = bytes_of()
+    return result
+
+
+def run_all(patterns=None, repeat=5):
+    results, skipped, failed = {}, {}, {}
+    for name, setup in BENCHMARKS.items():
+        if patterns and not any(p in name for p in patterns):
+            continue
+        try:
+            results[name] = measure(setup, repeat=1 if name.startswith("batch.") else repeat)
+        except Skip as e:
+            skipped[name] = str(e)
+        except Failed as e:
+            failed[name] = str(e)
+    return results, skipped, failed
+
+
+def over_budget(results):
+    # [(name, budget, time)] for startup benchmarks slower than STARTUP_BUDGET
+    return [(name, STARTUP_BUDGET[name], res["time"]) for name, res in results.items()
+            if name in STARTUP_BUDGET and res["time"] > STARTUP_BUDGET[name]]
+
+
+def machine_id():
+    return f"{platform.node()}-{platform.machine()}-py{platform.python_version()}"
+
+
+def load_baseline(path):
+    try:
+        with open(path) as f:
+            return json.load(f).get(machine_id(), {})
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(path, results):
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        data = {}
+    data.setdefault(machine_id(), {}).update(results)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+
+
+def compare(results, baseline, time_tolerance=None):
+    # [(name, metric, old, new)] for every metric past its tolerance;
+    # time_tolerance overrides the time entries of TOLERANCE/TIME_TOLERANCE
+    regressions = []
+    for name, res in results.items():
+        old = baseline.get(name)
+        if not old:
+            continue
+        for metric, tol in TOLERANCE.items():
+            if metric == "time":
+                tol = next((t for prefix, t in TIME_TOLERANCE.items() if name.startswith(prefix)), tol)
+                tol = tol if time_tolerance is None else time_tolerance
+            if metric in res and old.get(metric) and res[metric] > old[metric] * (1 + tol):
+                regressions.append((name, metric, old[metric], res[metric]))
+    return regressions
+
+
+def _fmt_time(s):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if s >= scale:
+            return f"{s / scale:.2f} {unit}"
+    return f"{s / 1e-9:.0f} ns"
+
+
+def report(results, skipped, baseline):
+    print(f"{'benchmark':<28} {'time/call':>11} {'vs base':>8} {'peak KB':>9} {'PDF bytes':>11}")
+    for name, res in results.items():
+        old = baseline.get(name, {}).get("time")
+        delta = f"{res['time'] / old - 1:+.0%}" if old else "new"
+        size = f"{res['bytes']:,}" if "bytes" in res else ""
+        print(f"{name:<28} {_fmt_time(res['time']):>11} {delta:>8} {res['peak_kb']:>9.1f} {size:>11}")
+    for name, why in skipped.items():
+        print(f"{name:<28} skipped: {why}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark generation, layout and rendering.")
+    ap.add_argument("-k", nargs="+", metavar="TEXT", help="only benchmarks whose name contains TEXT")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--baseline", default=DEFAULT_BASELINE)
+    ap.add_argument("--save", action="store_true", help="store these results as the baseline")
+    ap.add_argument("--tolerance", type=float, help="allowed slowdown for time, e.g. 0.25")
+    ap.add_argument("--json", metavar="PATH", help="also write the results here")
+    args = ap.parse_args(argv)
+
+    baseline = load_baseline(args.baseline)
+    results, skipped, failed = run_all(args.k, args.repeat)
+    report(results, skipped, baseline)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"machine": machine_id(), "results": results, "skipped": skipped, "failed": failed},
+                      f, indent=1)
+    for name, why in failed.items():
+        print(f"FAILED {name}: {why}")
+    slow = over_budget(results)
+    for name, budget, t in slow:
+        print(f"OVER BUDGET {name}: {_fmt_time(t)} > {_fmt_time(budget)}")
+    if args.save:
+        save_baseline(args.baseline, results)
+        print(f"Saved baseline for {machine_id()} to {args.baseline}")
+        return 1 if failed or slow else 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    for name, metric, old, new in regressions:
+        print(f"REGRESSION {name} {metric}: {old:.6g} -> {new:.6g} ({new / old - 1:+.0%})")
+    if not baseline:
+        print("No baseline for this machine yet; run with --save to create one.")
+    return 1 if regressions or failed or slow else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
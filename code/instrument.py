@@ -0,0 +1,212 @@
+# Optional spans and counters for the generate -> layout -> render -> save
+# pipeline.
+#
+# Off by default: span() then returns one shared no-op context manager and
+# count()/observe() return after a single flag check, so the hooks can stay in
+# the hot paths. enable() (or HOMESCHOOL_TRACE=path, see from_env) turns on
+# recording; export() writes either a JSON summary with per-stage timing
+# histograms, counters and observed values (PDF bytes, draw calls per page),
+# or a Chrome trace (chrome://tracing, https://ui.perfetto.dev).
+#
+# Only the current process is recorded; trace batches with --workers 1.
+
+import atexit
+import json
+import math
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+
+enabled = False
+
+_t0 = time.perf_counter_ns()
+_events = []                                 # (name, start_ns, dur_ns, tid, args)
+_durations = defaultdict(list)               # span name -> [ns]
+_values = defaultdict(list)                  # observe() name -> [value]
+_counters = defaultdict(int)
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class _Span:
+    __slots__ = ("name", "args", "start")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        dur = time.perf_counter_ns() - self.start
+        _events.append((self.name, self.start - _t0, dur, _track(), self.args))
+        _durations[self.name].append(dur)
+        return False
+
+
+def _track():
+    # one trace row per thread, or per asyncio task so concurrent requests
+    # do not overlap on a single row
+    aio = sys.modules.get("asyncio")
+    if aio is not None:
+        try:
+            task = aio.current_task()
+        except RuntimeError:
+            task = None
+        if task is not None:
+            return id(task)
+    return threading.get_ident()
+
+
+def span(name, **args):
+    # with span("save", pages=2): ...
+    if not enabled:
+        return _NO_SPAN
+    return _Span(name, args)
+
+
+def count(name, n=1):
+    if enabled:
+        _counters[name] += n
+
+
+def observe(name, value):
+    # a sample for a value histogram (bytes written, draw calls per page, ...)
+    if enabled:
+        _values[name].append(value)
+
+
+def enable(on=True):
+    global enabled
+    enabled = on
+
+
+def reset():
+    _events.clear()
+    _durations.clear()
+    _values.clear()
+    _counters.clear()
+
+
+# -----------------------
+# Canvas draw calls
+# -----------------------
+DRAW_METHODS = ("drawString", "drawRightString", "drawCentredString", "drawText", "line", "lines",
+                "rect", "roundRect", "circle", "ellipse", "wedge", "polygon", "drawPath", "doForm")
+
+
+def count_draw_calls(c):
+    # Wrap the drawing methods of this one canvas so each call is counted and
+    # every showPage() records the page's total under "draw_calls/page".
+    # Does nothing while disabled, so untraced canvases are untouched.
+    if not enabled:
+        return c
+    per_page = [0]
+
+    def wrap(fn):
+        def counted(*a, **kw):
+            per_page[0] += 1
+            return fn(*a, **kw)
+        return counted
+
+    for name in DRAW_METHODS:
+        if hasattr(c, name):
+            setattr(c, name, wrap(getattr(c, name)))
+    show_page = c.showPage
+
+    def counted_show_page():
+        observe("draw_calls/page", per_page[0])
+        count("draw_calls", per_page[0])
+        count("pages")
+        per_page[0] = 0
+        return show_page()
+
+    c.showPage = counted_show_page
+    return c
+
+
+# -----------------------
+# Export
+# -----------------------
+def _quantile(sorted_vals, q):
+    return sorted_vals[min(len(sorted_vals) - 1, int(q * len(sorted_vals)))]
+
+
+def _histogram(values):
+    # power-of-two buckets, keyed by upper bound
+    buckets = defaultdict(int)
+    for v in values:
+        buckets[2 ** math.ceil(math.log2(v)) if v > 0 else 0] += 1
+    return {str(k): buckets[k] for k in sorted(buckets)}
+
+
+def _summary(values):
+    vals = sorted(values)
+    return {"count": len(vals), "total": sum(vals), "min": vals[0], "p50": _quantile(vals, 0.5),
+            "p90": _quantile(vals, 0.9), "p99": _quantile(vals, 0.99), "max": vals[-1]}
+
+
+def summary():
+    # span timings in microseconds
+    spans = {}
+    for name, durs in _durations.items():
+        us = [d / 1000 for d in durs]
+        spans[name] = dict(_summary(us), histogram_us=_histogram(us))
+    values = {name: dict(_summary(vals), histogram=_histogram(vals)) for name, vals in _values.items()}
+    return {"spans": spans, "values": values, "counters": dict(_counters)}
+
+
+def chrome_trace():
+    pid = os.getpid()
+    events = [{"name": name, "ph": "X", "ts": start / 1000, "dur": dur / 1000, "pid": pid, "tid": tid,
+               "args": args} for name, start, dur, tid, args in _events]
+    end = max((e["ts"] + e["dur"] for e in events), default=0)
+    events += [{"name": name, "ph": "C", "ts": end, "pid": pid, "args": {name: value}}
+               for name, value in _counters.items()]
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def export(path, fmt=None):
+    # fmt "chrome" or "json"; by default chrome for *.trace.json, json otherwise
+    fmt = fmt or ("chrome" if path.endswith(".trace.json") else "json")
+    data = chrome_trace() if fmt == "chrome" else summary()
+    with open(path, "w") as f:
+        json.dump(data, f, indent=1 if fmt == "json" else None)
+    return path
+
+
+def print_summary(file=None):
+    s = summary()
+    print(f"{'stage':<24} {'count':>7} {'total ms':>10} {'p50 us':>9} {'p90 us':>9} {'max us':>9}", file=file)
+    for name, st in sorted(s["spans"].items(), key=lambda kv: -kv[1]["total"]):
+        print(f"{name:<24} {st['count']:>7} {st['total'] / 1000:>10.1f} {st['p50']:>9.0f} "
+              f"{st['p90']:>9.0f} {st['max']:>9.0f}", file=file)
+    for name, st in s["values"].items():
+        print(f"{name:<24} {st['count']:>7} {'':>10} {st['p50']:>9.0f} {st['p90']:>9.0f} {st['max']:>9.0f}",
+              file=file)
+    for name, n in s["counters"].items():
+        print(f"{name:<24} {n:>7}", file=file)
+
+
+def from_env(var="HOMESCHOOL_TRACE"):
+    # HOMESCHOOL_TRACE=out.trace.json python mathtest.py ... records and writes at exit
+    path = os.environ.get(var)
+    if path and not enabled:
+        enable()
+        atexit.register(export, path)
+    return path
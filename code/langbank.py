@@ -0,0 +1,258 @@
+# Pre-generated reading-test bank in SQLite.
+#
+# "build" generates several tests per TOPIC_POOL entry and grade (concurrently,
+# via langbulk) and stores passages and questions in indexed tables. The daily
+# run is then a local lookup plus render: either a whole stored test, or one
+# assembled from a passage whose questions meet per-skill quotas.
+#
+#   python langbank.py build --per-topic 5 --grades 2-3 3-4
+#   python langbank.py today --grade 3-4 --out-pdf Daily_Reading_Test.pdf
+#   python langbank.py stats
+
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+import langtest
+from langcheck import check_test
+
+DEFAULT_BANK = os.environ.get("READING_BANK", "reading_bank.sqlite")
+
+DEFAULT_QUOTAS = {"author_intent": 2, "literal": 2, "non_literal": 2}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tests (
+    id      INTEGER PRIMARY KEY,
+    topic   TEXT NOT NULL,
+    grade   TEXT NOT NULL,
+    variant INTEGER NOT NULL,
+    title   TEXT NOT NULL,
+    passage TEXT NOT NULL,
+    created REAL NOT NULL,
+    UNIQUE (topic, grade, variant)
+);
+CREATE TABLE IF NOT EXISTS questions (
+    id      INTEGER PRIMARY KEY,
+    test_id INTEGER NOT NULL REFERENCES tests(id) ON DELETE CASCADE,
+    pos     INTEGER NOT NULL,
+    qid     TEXT NOT NULL,
+    type    TEXT NOT NULL,
+    skill   TEXT NOT NULL,
+    prompt  TEXT NOT NULL,
+    choices TEXT,
+    answer  TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tests_topic_grade ON tests (topic, grade);
+CREATE INDEX IF NOT EXISTS questions_test ON questions (test_id, pos);
+CREATE INDEX IF NOT EXISTS questions_skill_type ON questions (skill, type, test_id);
+"""
+
+
+def connect(path: str = DEFAULT_BANK) -> sqlite3.Connection:
+    db = sqlite3.connect(path)
+    db.execute("PRAGMA foreign_keys = ON")
+    db.execute("PRAGMA journal_mode = WAL")
+    db.executescript(SCHEMA)
+    return db
+
+
+def add_test(db: sqlite3.Connection, test: Dict[str, Any], *, topic: str, grade: str, variant: int) -> int:
+    with db:
+        db.execute("DELETE FROM tests WHERE topic = ? AND grade = ? AND variant = ?", (topic, grade, variant))
+        cur = db.execute(
+            "INSERT INTO tests (topic, grade, variant, title, passage, created) VALUES (?, ?, ?, ?, ?, ?)",
+            (topic, grade, variant, test["title"], test["passage"], time.time()),
+        )
+        test_id = cur.lastrowid
+        db.executemany(
+            "INSERT INTO questions (test_id, pos, qid, type, skill, prompt, choices, answer) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (test_id, pos, q["id"], q["type"], q["skill"], q["prompt"],
+                 json.dumps(q["choices"]) if q.get("choices") is not None else None,
+                 test["answer_key"].get(q["id"], ""))
+                for pos, q in enumerate(test["questions"])
+            ],
+        )
+    return test_id
+
+
+def load_test(db: sqlite3.Connection, test_id: int, question_ids: Optional[List[int]] = None) -> Dict[str, Any]:
+    # rebuild the generate_reading_test() dict, optionally from a subset of
+    # questions (renumbered Q1..Qn in their original order)
+    title, passage = db.execute("SELECT title, passage FROM tests WHERE id = ?", (test_id,)).fetchone()
+    rows = db.execute(
+        "SELECT id, type, skill, prompt, choices, answer FROM questions WHERE test_id = ? ORDER BY pos",
+        (test_id,),
+    ).fetchall()
+    if question_ids is not None:
+        keep = set(question_ids)
+        rows = [r for r in rows if r[0] in keep]
+    questions = []
+    answer_key = {}
+    for i, (_, qtype, skill, prompt, choices, answer) in enumerate(rows):
+        qid = f"Q{i + 1}"
+        questions.append({"id": qid, "type": qtype, "skill": skill, "prompt": prompt,
+                          "choices": json.loads(choices) if choices is not None else None})
+        answer_key[qid] = answer
+    return {"title": title, "passage": passage, "questions": questions, "answer_key": answer_key}
+
+
+def daily_test(db: sqlite3.Connection, *, today: date, grade: str) -> Dict[str, Any]:
+    # same topic rotation as langtest.main, then a date-stable pick among variants
+    topic = langtest.pick_daily_topic(today)
+    ids = [r[0] for r in db.execute(
+        "SELECT id FROM tests WHERE topic = ? AND grade = ? ORDER BY variant", (topic, grade))]
+    if not ids:
+        raise LookupError(f"no banked tests for {topic!r}, grade {grade}")
+    return load_test(db, ids[today.toordinal() // len(langtest.TOPIC_POOL) % len(ids)])
+
+
+def assemble_test(db: sqlite3.Connection, *, topic: str, grade: str,
+                  quotas: Dict[str, int] = DEFAULT_QUOTAS, total: int = 7,
+                  qtype: Optional[str] = None, pick: int = 0) -> Dict[str, Any]:
+    # Questions are tied to their passage, so pick one stored passage whose
+    # questions cover every skill quota, take the quota per skill, then fill
+    # up to `total` in original order. qtype limits questions to one type.
+    type_clause = "AND q.type = ?" if qtype else ""
+    having = " AND ".join(f"SUM(q.skill = '{skill}') >= {int(n)}" for skill, n in quotas.items()) or "1"
+    params = [topic, grade] + ([qtype] if qtype else [])
+    candidates = [r[0] for r in db.execute(
+        f"SELECT t.id FROM tests t JOIN questions q ON q.test_id = t.id "
+        f"WHERE t.topic = ? AND t.grade = ? {type_clause} "
+        f"GROUP BY t.id HAVING COUNT(*) >= {int(total)} AND {having} ORDER BY t.variant",
+        params,
+    )]
+    if not candidates:
+        raise LookupError(f"no banked passage for {topic!r}, grade {grade} meets {quotas}")
+    test_id = candidates[pick % len(candidates)]
+
+    rows = db.execute(
+        f"SELECT q.id, q.skill FROM questions q WHERE q.test_id = ? {type_clause} ORDER BY q.pos",
+        [test_id] + ([qtype] if qtype else []),
+    ).fetchall()
+    chosen = []
+    taken = dict.fromkeys(quotas, 0)
+    for qid, skill in rows:
+        if taken.get(skill, 0) < quotas.get(skill, 0):
+            taken[skill] += 1
+            chosen.append(qid)
+    for qid, _ in rows:
+        if len(chosen) >= total:
+            break
+        if qid not in chosen:
+            chosen.append(qid)
+    return load_test(db, test_id, chosen)
+
+
+def skill_counts(db: sqlite3.Connection) -> List[tuple]:
+    return db.execute(
+        "SELECT skill, type, COUNT(*) FROM questions GROUP BY skill, type ORDER BY skill, type").fetchall()
+
+
+async def build_bank(db: sqlite3.Connection, client, *, grades: List[str], per_topic: int,
+                     topics: Optional[List[str]] = None, concurrency: int = 8, rps: float = 4.0,
+                     cache=None) -> Dict[str, int]:
+    import langbulk
+
+    topics = topics or langtest.TOPIC_POOL
+    have = set(db.execute("SELECT topic, grade, variant FROM tests"))
+    jobs = [langbulk.Job(topic, grade, date.today(), None, variant)
+            for topic in topics for grade in grades for variant in range(per_topic)
+            if (topic, grade, variant) not in have]
+    sem = asyncio.Semaphore(concurrency)
+    bucket = langbulk.TokenBucket(rps)
+    stats = {"requests": 0, "retries": 0, "failed": 0, "invalid": 0, "stored": 0}
+    validate = langtest.reading_test_validator()
+
+    async def one(job):
+        # request_test only returns (and caches) tests that pass check_test,
+        # after repairs; one that cannot be stored is skipped, not fatal
+        where = f"{job.topic} (grade {job.grade}, variant {job.variant})"
+        try:
+            test = await langbulk.request_test(client, job, sem=sem, bucket=bucket, retries=4,
+                                               backoff=0.5, cache=cache, stats=stats)
+        except ValueError as e:
+            stats["invalid"] += 1
+            print(f"INVALID: {where}: {e}")
+            return
+        except Exception as e:
+            stats["failed"] += 1
+            print(f"FAILED: {where}: {e!r}")
+            return
+        problems = check_test(test, validate)
+        try:
+            if problems:
+                raise ValueError(problems)
+            add_test(db, test, topic=job.topic, grade=job.grade, variant=job.variant)
+        except (ValueError, KeyError, TypeError, sqlite3.Error) as e:
+            stats["invalid"] += 1
+            print(f"INVALID: {where}: {e!r}")
+            return
+        stats["stored"] += 1
+
+    await asyncio.gather(*(one(job) for job in jobs))
+    return stats
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Build and query the reading-test bank.")
+    ap.add_argument("--db", default=DEFAULT_BANK)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    b = sub.add_parser("build", help="generate tests for every topic and grade")
+    b.add_argument("--per-topic", type=int, default=5)
+    b.add_argument("--grades", nargs="+", default=["3-4"])
+    b.add_argument("--concurrency", type=int, default=8)
+    b.add_argument("--rps", type=float, default=4.0)
+    b.add_argument("--fake", action="store_true", help="use the offline FakeClient")
+
+    t = sub.add_parser("today", help="render today's test from the bank")
+    t.add_argument("--grade", default="3-4")
+    t.add_argument("--out-pdf", default=langtest.OUT_PDF)
+    t.add_argument("--assemble", action="store_true", help="build from per-skill quotas")
+
+    sub.add_parser("stats", help="questions per skill and type")
+    args = ap.parse_args()
+
+    db = connect(args.db)
+    if args.cmd == "build":
+        import langbulk
+        from langcache import ResponseCache
+        if args.fake:
+            client = langbulk.FakeClient()
+        else:
+            from openai import AsyncOpenAI
+            api_key = os.environ.get("OPENAI_API_KEY")
+            if not api_key:
+                raise SystemExit("Missing OPENAI_API_KEY environment variable.")
+            client = AsyncOpenAI(api_key=api_key)
+        t0 = time.perf_counter()
+        stats = asyncio.run(build_bank(db, client, grades=args.grades, per_topic=args.per_topic,
+                                       concurrency=args.concurrency, rps=args.rps,
+                                       cache=ResponseCache()))
+        print(f"Stored {stats['stored']} tests in {args.db} in {time.perf_counter() - t0:.2f}s "
+              f"({stats['requests']} requests, {stats['failed']} failed, {stats['invalid']} invalid)")
+    elif args.cmd == "today":
+        today = date.today()
+        t0 = time.perf_counter()
+        if args.assemble:
+            test = assemble_test(db, topic=langtest.pick_daily_topic(today), grade=args.grade,
+                                 pick=today.toordinal())
+        else:
+            test = daily_test(db, today=today, grade=args.grade)
+        t_lookup = time.perf_counter() - t0
+        langtest.render_pdf(test, out_pdf=args.out_pdf, today=today)
+        print(f"Wrote: {args.out_pdf}  (lookup {t_lookup * 1000:.1f} ms)")
+    else:
+        for skill, qtype, n in skill_counts(db):
+            print(f"{skill:<14} {qtype:<16} {n:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+# Bulk reading-test generation: many model requests in flight at once.
+#
+# Requests run on asyncio with a concurrency cap, a token-bucket rate limit and
+# exponential-backoff retries. Each finished test goes straight to a process
+# pool for PDF rendering, so total time is roughly the slowest request plus one
+# render rather than the sum of all of them. Responses are checked and
+# repaired exactly as in langtest (checked_test) before they are cached.
+#
+#   python langbulk.py --days 7 --grades 2-3 3-4 --out-dir week
+#   python langbulk.py --days 30 --fake           # offline, no API key needed
+
+import argparse
+import asyncio
+import functools
+import json
+import os
+import random
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional
+
+import instrument
+import langtest
+from instrument import span
+from langcache import ResponseCache
+from langcheck import strip_fences
+
+
+class TokenBucket:
+    # `rate` requests per second on average, bursts of up to `capacity`
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class Job:
+    __slots__ = ("topic", "grade", "today", "out_pdf", "variant")
+
+    def __init__(self, topic: str, grade: str, today: date, out_pdf: Optional[str], variant: int = 0):
+        self.topic = topic
+        self.grade = grade
+        self.today = today
+        self.out_pdf = out_pdf
+        self.variant = variant
+
+
+def slug(text: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-")[:40]
+
+
+def plan_jobs(days: int, grades: List[str], out_dir: str, start: Optional[date] = None) -> List[Job]:
+    # one test per (day, grade), topics rotating exactly like the daily run
+    start = start or date.today()
+    jobs = []
+    for i in range(days):
+        d = start + timedelta(days=i)
+        topic = langtest.pick_daily_topic(d)
+        for grade in grades:
+            name = f"reading-{d.isoformat()}-g{grade}-{slug(topic)}.pdf"
+            jobs.append(Job(topic, grade, d, os.path.join(out_dir, name)))
+    return jobs
+
+
+async def _call(client, messages: List[Dict[str, str]], *, sem: asyncio.Semaphore, bucket: TokenBucket,
+                retries: int, backoff: float, stats: Dict[str, int], topic: str) -> Any:
+    # one rate-limited model call, retried on transport errors -> parsed JSON;
+    # raises ValueError for a reply that is not JSON
+    for attempt in range(retries + 1):
+        try:
+            async with sem:
+                with span("rate_limit.wait"):
+                    await bucket.acquire()
+                stats["requests"] += 1
+                with span("model_call", topic=topic, attempt=attempt):
+                    resp = await client.responses.create(model=langtest.MODEL, input=messages)
+            break
+        except Exception:
+            if attempt == retries:
+                raise
+            stats["retries"] += 1
+            instrument.count("retries")
+            delay = backoff * (2 ** attempt)
+            await asyncio.sleep(delay + random.uniform(0, delay))
+    with span("json_parse"):
+        return json.loads(strip_fences(resp.output_text))
+
+
+async def request_test(client, job: Job, *, sem: asyncio.Semaphore, bucket: TokenBucket,
+                       retries: int, backoff: float, cache: Optional[ResponseCache],
+                       stats: Dict[str, int], repairs: int = 2, regenerations: int = 1) -> Dict[str, Any]:
+    # a validated test: the same check/repair/regenerate loop as
+    # langtest.ResponsesProvider (langtest.checked_test), and only its result
+    # is cached
+    messages = langtest.build_messages(topic=job.topic, grade=job.grade, variant=job.variant)
+    key = None
+    if cache is not None:
+        key = langtest.request_cache_key(topic=job.topic, grade=job.grade, messages=messages,
+                                         model=langtest.cache_model(client))
+        hit = langtest.cached_test(cache, key)
+        if hit is not None:
+            return hit
+
+    steps = langtest.checked_test(messages, topic=job.topic, grade=job.grade, repairs=repairs,
+                                  regenerations=regenerations)
+    request = next(steps)
+    while True:
+        try:
+            reply = await _call(client, request, sem=sem, bucket=bucket, retries=retries, backoff=backoff,
+                                stats=stats, topic=job.topic)
+        except ValueError as e:
+            reply = e
+        try:
+            request = steps.send(reply)
+        except StopIteration as done:
+            data = done.value
+            break
+
+    if cache is not None:
+        cache.put(key, data)
+    return data
+
+
+async def generate_all(client, jobs: List[Job], *, concurrency: int = 8, rps: float = 4.0,
+                       retries: int = 4, backoff: float = 0.5, cache: Optional[ResponseCache] = None,
+                       render_workers: Optional[int] = None) -> Dict[str, Any]:
+    sem = asyncio.Semaphore(concurrency)
+    bucket = TokenBucket(rps)
+    stats = {"requests": 0, "retries": 0, "failed": 0, "written": 0}
+    loop = asyncio.get_running_loop()
+
+    with ProcessPoolExecutor(max_workers=render_workers) as pool:
+        async def one(job: Job) -> None:
+            try:
+                test = await request_test(client, job, sem=sem, bucket=bucket, retries=retries,
+                                          backoff=backoff, cache=cache, stats=stats)
+            except Exception as e:
+                stats["failed"] += 1
+                print(f"FAILED: {job.topic} (grade {job.grade}): {e!r}")
+                return
+            render = functools.partial(langtest.render_pdf, test, out_pdf=job.out_pdf, today=job.today)
+            await loop.run_in_executor(pool, render)
+            stats["written"] += 1
+
+        await asyncio.gather(*(one(job) for job in jobs))
+    return stats
+
+
+# -----------------------
+# Offline stand-in for the OpenAI client
+# -----------------------
+class FakeClient:
+    # async client with the same responses.create() shape; fixed latency plus
+    # jitter, and a share of calls that fail so retry paths get exercised.
+    # Its output is cached under its own name, never as langtest.MODEL's.
+    cache_model = "fake"
+
+    def __init__(self, latency: float = 0.5, jitter: float = 0.2, fail_rate: float = 0.0, seed: int = 0):
+        self.responses = self
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.calls = 0
+        self._rng = random.Random(seed)
+
+    async def create(self, *, model: str, input: List[Dict[str, str]], **kw):
+        self.calls += 1
+        await asyncio.sleep(self.latency + self._rng.uniform(0, self.jitter))
+        if self._rng.random() < self.fail_rate:
+            raise ConnectionError("fake transient failure")
+        topic = input[-1]["content"].split(".", 1)[0].replace("Topic: ", "")
+        return _FakeResponse(json.dumps(fake_test(topic)))
+
+
+class _FakeResponse:
+    def __init__(self, text: str):
+        self.output_text = text
+
+
+def fake_test(topic: str) -> Dict[str, Any]:
+    questions = []
+    key = {}
+    skills = ["author_intent", "literal", "non_literal"]
+    for i in range(7):
+        qid = f"Q{i + 1}"
+        if i % 2 == 0:
+            questions.append({"id": qid, "type": "multiple_choice", "skill": skills[i % 3],
+                              "prompt": f"Question {i + 1} about {topic}?",
+                              "choices": ["First", "Second", "Third", "Fourth"]})
+            key[qid] = "ABCD"[i % 4]
+        else:
+            questions.append({"id": qid, "type": "short_answer", "skill": skills[i % 3],
+                              "prompt": f"Explain part {i + 1} of {topic}.", "choices": None})
+            key[qid] = "Any answer that uses the passage."
+    passage = (f"This is a practice passage about {topic}. It plays a big role in our world. " * 6).strip()
+    return {"title": topic.title(), "passage": passage, "questions": questions, "answer_key": key}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Generate many reading tests concurrently.")
+    ap.add_argument("--days", type=int, default=7)
+    ap.add_argument("--grades", nargs="+", default=["3-4"])
+    ap.add_argument("--out-dir", default="reading_tests")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--rps", type=float, default=4.0, help="max requests per second")
+    ap.add_argument("--retries", type=int, default=4)
+    ap.add_argument("--render-workers", type=int)
+    ap.add_argument("--no-cache", action="store_true")
+    ap.add_argument("--fake", action="store_true", help="use the offline FakeClient")
+    args = ap.parse_args()
+    instrument.from_env()
+
+    if args.fake:
+        client = FakeClient()
+    else:
+        from openai import AsyncOpenAI
+        api_key = os.environ.get("OPENAI_API_KEY")
+        if not api_key:
+            raise SystemExit("Missing OPENAI_API_KEY environment variable.")
+        client = AsyncOpenAI(api_key=api_key)
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    jobs = plan_jobs(args.days, args.grades, args.out_dir)
+    cache = None if args.no_cache else ResponseCache()
+
+    t0 = time.perf_counter()
+    stats = asyncio.run(generate_all(client, jobs, concurrency=args.concurrency, rps=args.rps,
+                                     retries=args.retries, cache=cache,
+                                     render_workers=args.render_workers))
+    dt = time.perf_counter() - t0
+    print(f"Wrote {stats['written']}/{len(jobs)} tests to {args.out_dir} in {dt:.2f}s "
+          f"({stats['requests']} requests, {stats['retries']} retries, {stats['failed']} failed)")
+    if cache is not None:
+        print(f"Cache: {cache.stats['hits']} hit(s), {cache.stats['misses']} miss(es)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# Content-addressed cache for generated reading tests.
+#
+# Parsed test JSON is stored under a SHA-256 of (model, topic, grade, prompt),
+# one file per entry, with an in-memory LRU in front. Entries older than
+# max_age_days are dropped, and the oldest-used ones go first when the folder
+# grows past max_bytes. The folder's size is learned by one sweep on the first
+# put and then kept as a running count, so a put does not walk the folder; the
+# next sweep only comes when the count crosses max_bytes, and it trims to
+# LOW_WATER of it so the one after is far off.
+
+import copy
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "READING_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "homeschool", "reading_tests"),
+)
+
+LOW_WATER = 0.9                   # a sweep trims the folder to this share of max_bytes
+
+
+def cache_key(model: str, topic: str, grade: str, prompt: str) -> str:
+    h = hashlib.sha256()
+    for part in (model, topic, grade, prompt):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, root: str = DEFAULT_CACHE_DIR, *, max_bytes: int = 64 * 1024 * 1024,
+                 max_age_days: float = 180, memory_items: int = 128):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 86400
+        self.memory_items = memory_items
+        self._mem: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()   # key -> (mtime, data)
+        self._bytes: Optional[int] = None       # size and number of entries on disk, after the first sweep
+        self._files = 0
+        self.stats = {"hits": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key + ".json")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        if key in self._mem:
+            mtime, data = self._mem[key]
+            if time.time() - mtime <= self.max_age:
+                self._mem.move_to_end(key)
+                self.stats["hits"] += 1
+                self.stats["memory_hits"] += 1
+                return copy.deepcopy(data)
+            del self._mem[key]                # expired: the disk lookup below drops the file
+
+        p = self.path(key)
+        try:
+            st = os.stat(p)
+            if time.time() - st.st_mtime > self.max_age:
+                self._remove(p, st.st_size)
+                raise FileNotFoundError(p)
+            with open(p, encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.stats["misses"] += 1
+            return None
+
+        os.utime(p, (time.time(), st.st_mtime))   # atime marks last use for eviction
+        self._remember(key, st.st_mtime, data)
+        self.stats["hits"] += 1
+        self.stats["disk_hits"] += 1
+        return copy.deepcopy(data)
+
+    def put(self, key: str, data: Dict[str, Any]) -> None:
+        if self._bytes is None:
+            self.evict()
+        p = self.path(key)
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+        tmp = f"{p}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        try:
+            old = os.stat(p).st_size
+        except FileNotFoundError:
+            old = None
+        os.replace(tmp, p)
+        st = os.stat(p)
+        self._bytes += st.st_size - (old or 0)
+        self._files += old is None
+        self._remember(key, st.st_mtime, copy.deepcopy(data))
+        self.stats["writes"] += 1
+        if self._bytes > self.max_bytes:
+            self.evict()
+
+    def _remember(self, key: str, mtime: float, data: Dict[str, Any]) -> None:
+        self._mem[key] = (mtime, data)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.memory_items:
+            self._mem.popitem(last=False)
+
+    def evict(self) -> None:
+        # one sweep of the folder: drop expired entries, then least recently
+        # used ones until under LOW_WATER * max_bytes; resets the running count
+        # (other processes may have written since)
+        now = time.time()
+        entries = []
+        total = 0
+        for dirpath, _, files in os.walk(self.root):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                p = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(p)
+                except FileNotFoundError:
+                    continue
+                if now - st.st_mtime > self.max_age:
+                    self._remove(p)
+                    continue
+                entries.append((max(st.st_atime, st.st_mtime), st.st_size, p))
+                total += st.st_size
+        self._bytes, self._files = total, len(entries)
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        for _, size, p in entries:
+            if self._bytes <= self.max_bytes * LOW_WATER:
+                break
+            self._remove(p, size)
+
+    def _remove(self, p: str, size: Optional[int] = None) -> None:
+        # size: counted in the running total (None: the sweep has not seen it)
+        try:
+            os.remove(p)
+        except FileNotFoundError:
+            return
+        if size is not None and self._bytes is not None:
+            self._bytes -= size
+            self._files -= 1
+        self._mem.pop(os.path.basename(p)[:-len(".json")], None)
+        self.stats["evictions"] += 1
+
+    def clear(self) -> None:
+        self._mem.clear()
+        self._bytes, self._files = 0, 0
+        for dirpath, _, files in os.walk(self.root):
+            for name in files:
+                if name.endswith(".json"):
+                    os.remove(os.path.join(dirpath, name))
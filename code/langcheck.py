@@ -0,0 +1,457 @@
+# Validation and targeted repair of generated reading tests.
+#
+# compile_schema() turns the JSON-schema subset used by
+# langtest.reading_test_schema() into nested closures once, so checking a test
+# is plain function calls with no schema walking. check_test() adds the rules
+# the schema cannot say (four choices on multiple choice, none on short answer,
+# an answer-key entry per question, at least SKILL_MINIMUM questions per skill)
+# and reports problems per question ID.
+#
+# ResponseStream reads a streamed response and gives up on it as soon as it
+# cannot be JSON. A complete test is checked once it has arrived, and broken
+# questions are rewritten with one small repair request (repair_messages)
+# instead of regenerating the whole test.
+#
+#   python langcheck.py --bench              # fake model: full regeneration vs repair
+
+import argparse
+import json
+import random
+import re
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+SKILL_MINIMUM = 2                 # questions per skill the prompt asks for
+CHOICES = 4
+
+Validator = Callable[[Any, str, List[str]], None]
+
+
+# -----------------------
+# Schema compiler
+# -----------------------
+_TYPES = {
+    "object": dict, "array": list, "string": str, "null": type(None),
+    "boolean": bool, "integer": int, "number": (int, float),
+}
+
+
+def compile_schema(schema: Dict[str, Any]) -> Callable[[Any], List[str]]:
+    """
+    Compile a schema (type, enum, properties, required, additionalProperties,
+    items, minItems, maxItems) into validate(value) -> ["$.path: problem", ...].
+    """
+    check = _compile(schema)
+
+    def validate(value: Any) -> List[str]:
+        errors: List[str] = []
+        check(value, "$", errors)
+        return errors
+    return validate
+
+
+def _compile(schema: Dict[str, Any]) -> Validator:
+    steps: List[Validator] = []
+
+    if "type" in schema:
+        names = schema["type"] if isinstance(schema["type"], list) else [schema["type"]]
+        types = tuple(t for n in names for t in (_TYPES[n] if isinstance(_TYPES[n], tuple) else (_TYPES[n],)))
+        wanted = " or ".join(names)
+        no_bool = bool not in types            # True is an int to isinstance
+
+        def check_type(v, path, errors):
+            if not isinstance(v, types) or (no_bool and isinstance(v, bool)):
+                errors.append(f"{path}: expected {wanted}, got {type(v).__name__}")
+                return False
+            return True
+    else:
+        check_type = None
+
+    if "enum" in schema:
+        allowed = frozenset(schema["enum"])
+
+        def check_enum(v, path, errors):
+            if v not in allowed:
+                errors.append(f"{path}: {v!r} not one of {sorted(allowed)}")
+        steps.append(check_enum)
+
+    props = {k: _compile(s) for k, s in schema.get("properties", {}).items()}
+    required = tuple(schema.get("required", ()))
+    extra = schema.get("additionalProperties", True)
+    extra_check = _compile(extra) if isinstance(extra, dict) else None
+    if props or required or extra is not True:
+        def check_object(v, path, errors):
+            if not isinstance(v, dict):
+                return
+            for k in required:
+                if k not in v:
+                    errors.append(f"{path}: missing {k!r}")
+            for k, item in v.items():
+                sub = props.get(k)
+                if sub is not None:
+                    sub(item, f"{path}.{k}", errors)
+                elif extra is False:
+                    errors.append(f"{path}: unexpected {k!r}")
+                elif extra_check is not None:
+                    extra_check(item, f"{path}.{k}", errors)
+        steps.append(check_object)
+
+    items = _compile(schema["items"]) if "items" in schema else None
+    lo, hi = schema.get("minItems"), schema.get("maxItems")
+    if items is not None or lo is not None or hi is not None:
+        def check_array(v, path, errors):
+            if not isinstance(v, list):
+                return
+            if lo is not None and len(v) < lo:
+                errors.append(f"{path}: {len(v)} items, at least {lo} required")
+            if hi is not None and len(v) > hi:
+                errors.append(f"{path}: {len(v)} items, at most {hi} allowed")
+            if items is not None:
+                for i, item in enumerate(v):
+                    items(item, f"{path}[{i}]", errors)
+        steps.append(check_array)
+
+    def check(v, path, errors):
+        if check_type is not None and not check_type(v, path, errors):
+            return
+        for step in steps:
+            step(v, path, errors)
+    return check
+
+
+# -----------------------
+# Test-level checks
+# -----------------------
+_QUESTION_PATH = re.compile(r"^\$\.questions\[(\d+)\]")
+
+
+class Problems:
+    # what is wrong with one test: per question ID, plus whole-test problems
+    __slots__ = ("questions", "test", "missing_skills", "missing_count")
+
+    def __init__(self):
+        self.questions: Dict[str, List[str]] = {}
+        self.test: List[str] = []
+        self.missing_skills: List[str] = []    # skills still short of SKILL_MINIMUM, one per question
+        self.missing_count = 0                 # questions to add
+
+    def __bool__(self):
+        return bool(self.questions or self.test or self.missing_skills or self.missing_count)
+
+    def repairable(self) -> bool:
+        # everything wrong can be fixed by rewriting or adding questions
+        return not self.test
+
+    def __repr__(self):
+        return (f"Problems(questions={self.questions!r}, test={self.test!r}, "
+                f"add={self.missing_count}, skills={self.missing_skills!r})")
+
+
+def check_question(q: Dict[str, Any], answer_key: Dict[str, Any]) -> List[str]:
+    # rules the schema cannot express, for one question already of the right shape
+    out = []
+    choices = q.get("choices")
+    if q.get("type") == "multiple_choice":
+        if not choices or len(choices) != CHOICES:
+            out.append(f"multiple choice needs {CHOICES} choices, has {len(choices or ())}")
+        elif str(answer_key.get(q.get("id"), "")).strip().upper()[:1] not in "ABCD"[:CHOICES]:
+            out.append("answer key entry is not a choice letter")
+    elif q.get("type") == "short_answer" and choices:
+        out.append("short answer item has choices")
+    if not str(answer_key.get(q.get("id"), "")).strip():
+        out.append("no answer key entry")
+    if not str(q.get("prompt", "")).strip():
+        out.append("empty prompt")
+    return out
+
+
+def check_test(test: Any, validate: Callable[[Any], List[str]], *,
+               min_questions: int = 7, max_questions: int = 10) -> Problems:
+    p = Problems()
+    if not isinstance(test, dict):
+        p.test.append("response is not a JSON object")
+        return p
+    questions = test.get("questions") if isinstance(test.get("questions"), list) else []
+    ids = [q.get("id") if isinstance(q, dict) else None for q in questions]
+    for err in validate(test):
+        m = _QUESTION_PATH.match(err)
+        if m and isinstance(ids[int(m.group(1))], str):
+            p.questions.setdefault(ids[int(m.group(1))], []).append(err[m.end():].lstrip(".: ") or err)
+        elif not (err.startswith("$.questions: ") and "at least" in err):   # too few: added below
+            p.test.append(err)
+    if p.test:
+        return p
+
+    key = test["answer_key"]
+    seen = set()
+    for q in questions:
+        qid = q["id"]
+        if qid in seen:
+            p.test.append(f"duplicate question id {qid!r}")
+            continue
+        seen.add(qid)
+        errs = check_question(q, key)
+        if errs:
+            p.questions.setdefault(qid, []).extend(errs)
+
+    # only questions that are kept count toward the skill quotas; rewrites
+    # take the short skills first, then new questions are added for the rest
+    counts = {s: 0 for s in ("author_intent", "literal", "non_literal")}
+    for q in questions:
+        if q["id"] not in p.questions:
+            counts[q["skill"]] += 1
+    p.missing_skills = [s for s, n in counts.items() for _ in range(SKILL_MINIMUM - n)]
+    p.missing_count = max(min_questions - len(questions), len(p.missing_skills) - len(p.questions), 0)
+    if len(questions) + p.missing_count > max_questions:
+        p.test.append(f"{len(questions)} questions, {p.missing_count} more needed; at most {max_questions}")
+    return p
+
+
+# -----------------------
+# Streaming
+# -----------------------
+class ResponseStream:
+    """
+    Feed it response text as it arrives. `broken` turns true as soon as the
+    text cannot be a JSON object (prose instead of JSON), so the caller can
+    drop the stream early instead of paying for the rest of it. finish()
+    parses the whole document; it is validated after that, like any response.
+    """
+
+    def __init__(self):
+        self.broken = False
+        self._parts: List[str] = []
+
+    def feed(self, text: str) -> None:
+        self._parts.append(text)
+        if len(self._parts) == 1 or not "".join(self._parts[:-1]).strip():
+            head = "".join(self._parts).lstrip()
+            self.broken = bool(head) and head[0] not in "{`"
+
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    def finish(self) -> Any:
+        # raises ValueError for JSON that does not parse
+        return json.loads(strip_fences(self.text()))
+
+
+def strip_fences(text: str) -> str:
+    # models sometimes wrap JSON in ```json fences despite the instructions
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        text = text.rsplit("```", 1)[0]
+    return text.strip()
+
+
+# -----------------------
+# Repair
+# -----------------------
+def repair_messages(test: Dict[str, Any], problems: Problems, *, grade: str) -> List[Dict[str, str]]:
+    # a request for just the broken questions (same IDs) and any missing ones
+    skills = list(problems.missing_skills)
+    fix = []
+    for qid, errs in problems.questions.items():
+        item = {"id": qid, "problems": errs}
+        if skills:
+            item["skill"] = skills.pop(0)
+        fix.append(item)
+    existing = {q["id"] for q in test["questions"]}
+    n = 1
+    for _ in range(problems.missing_count):
+        while f"Q{n}" in existing:
+            n += 1
+        existing.add(f"Q{n}")
+        item = {"id": f"Q{n}", "problems": ["new question"]}
+        if skills:
+            item["skill"] = skills.pop(0)
+        fix.append(item)
+    keep = [{"id": q["id"], "skill": q["skill"], "prompt": q["prompt"]}
+            for q in test["questions"] if q["id"] not in problems.questions]
+    system = (
+        "You are an expert elementary reading teacher fixing a reading test for grade "
+        f"{grade} readers. Multiple choice questions have {CHOICES} choices and the answer key gives "
+        "the choice letter; short answer questions have choices null and a short expected answer."
+    )
+    user = (
+        f"Passage title: {test['title']}\n\nPassage:\n{test['passage']}\n\n"
+        f"Questions that stay as they are (do not repeat them):\n{json.dumps(keep, ensure_ascii=False)}\n\n"
+        "Write a replacement for each of these question IDs, keeping the ID and using the given skill "
+        "where one is listed:\n"
+        f"FIX: {json.dumps(fix, ensure_ascii=False)}\n\n"
+        "Respond with VALID JSON ONLY, exactly:\n"
+        '{"questions": [ {"id", "type", "skill", "prompt", "choices"} ... ], '
+        '"answer_key": { id: answer }}\n'
+    )
+    return [{"role": "system", "content": system}, {"role": "user", "content": user}]
+
+
+def merge_repair(test: Dict[str, Any], patch: Dict[str, Any]) -> Dict[str, Any]:
+    # replace questions by ID, append new ones, in ID order as printed
+    fixed = {q["id"]: q for q in patch.get("questions", []) if isinstance(q, dict) and "id" in q}
+    questions = [fixed.pop(q["id"], q) for q in test["questions"]]
+    questions += fixed.values()
+    key = dict(test["answer_key"])
+    if isinstance(patch.get("answer_key"), dict):
+        key.update(patch["answer_key"])
+    return dict(test, questions=questions, answer_key=key)
+
+
+# -----------------------
+# Offline fake model
+# -----------------------
+class FakeModel:
+    """
+    Synchronous stand-in for OpenAI() with responses.create(stream=...).
+    Output costs `per_char` seconds per character after a fixed `latency`, and
+    `defect_rate` of generated questions come back broken, so the validation
+    and repair paths can be measured without an API key. Its output is cached
+    under its own name (langtest.cache_model), never as langtest.MODEL's.
+    """
+
+    cache_model = "fake"
+
+    def __init__(self, latency: float = 0.02, per_char: float = 2e-5, defect_rate: float = 0.1,
+                 seed: int = 0, chunk: int = 64):
+        self.responses = self
+        self.latency = latency
+        self.per_char = per_char
+        self.defect_rate = defect_rate
+        self.chunk = chunk
+        self.calls = 0
+        self.chars = 0
+        self._rng = random.Random(seed)
+
+    def create(self, *, model: str, input: List[Dict[str, str]], stream: bool = False, **kw):
+        self.calls += 1
+        text = json.dumps(self._answer(input[-1]["content"]), ensure_ascii=False)
+        self.chars += len(text)
+        if stream:
+            return self._stream(text)
+        time.sleep(self.latency + self.per_char * len(text))
+        return _Text(text)
+
+    def _stream(self, text: str):
+        time.sleep(self.latency)
+        for i in range(0, len(text), self.chunk):
+            part = text[i:i + self.chunk]
+            time.sleep(self.per_char * len(part))
+            yield _Delta(part)
+
+    def _answer(self, prompt: str) -> Dict[str, Any]:
+        from langbulk import fake_test
+
+        if "FIX: " in prompt:
+            fix = json.loads(prompt.split("FIX: ", 1)[1].split("\n", 1)[0])
+            questions, key = [], {}
+            for i, item in enumerate(fix):
+                q, answer = _fake_question(item["id"], item.get("skill") or "literal", i, "repair")
+                questions.append(q)
+                key[q["id"]] = answer
+            return self._damage({"questions": questions, "answer_key": key})
+        topic = prompt.split(".", 1)[0].replace("Topic: ", "")
+        return self._damage(fake_test(topic))
+
+    def _damage(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        questions = data["questions"]
+        for q in list(questions):
+            if self._rng.random() >= self.defect_rate:
+                continue
+            kind = self._rng.choice(["choices", "key", "count", "type"])
+            if kind == "choices" and q["type"] == "multiple_choice":
+                q["choices"] = q["choices"][:3]
+            elif kind == "choices":
+                q["choices"] = ["Yes", "No"]
+            elif kind == "key":
+                data["answer_key"].pop(q["id"], None)
+            elif kind == "count" and len(questions) > 1:
+                questions.remove(q)
+                data["answer_key"].pop(q["id"], None)
+            else:
+                q["type"] = "essay"
+        return data
+
+
+def _fake_question(qid: str, skill: str, i: int, topic: str) -> Tuple[Dict[str, Any], str]:
+    if i % 2 == 0:
+        return ({"id": qid, "type": "multiple_choice", "skill": skill, "prompt": f"Question {qid} about {topic}?",
+                 "choices": ["First", "Second", "Third", "Fourth"]}, "ABCD"[i % 4])
+    return ({"id": qid, "type": "short_answer", "skill": skill, "prompt": f"Explain {qid} ({topic}).",
+             "choices": None}, "Any answer that uses the passage.")
+
+
+class _Text:
+    def __init__(self, text: str):
+        self.output_text = text
+
+
+class _Delta:
+    type = "response.output_text.delta"
+
+    def __init__(self, delta: str):
+        self.delta = delta
+
+
+def benchmark(n: int = 40, defect_rate: float = 0.1, seed: int = 0) -> Dict[str, Dict[str, float]]:
+    # the same fake model answering n tests two ways: regenerate the whole test
+    # until it validates (what a plain retry does), or stream + repair
+    import langtest
+
+    topics = [langtest.TOPIC_POOL[i % len(langtest.TOPIC_POOL)] for i in range(n)]
+    out = {}
+    for mode in ("regenerate", "repair"):
+        model = FakeModel(defect_rate=defect_rate, seed=seed)
+        failed = 0
+        t0 = time.perf_counter()
+        for topic in topics:
+            try:
+                if mode == "regenerate":
+                    langtest.generate_reading_test(model, topic=topic, repairs=0, regenerations=5)
+                else:
+                    langtest.generate_reading_test(model, topic=topic, stream=True, repairs=3)
+            except ValueError:
+                failed += 1
+        dt = time.perf_counter() - t0
+        out[mode] = {"requests": model.calls, "chars": model.chars, "seconds": dt, "failed": failed}
+        print(f"{mode:<11} {model.calls:>5} requests  {model.chars:>9,} chars generated  "
+              f"{dt / n * 1000:7.1f} ms/test  {failed} failed")
+    saved = 1 - out["repair"]["requests"] / out["regenerate"]["requests"]
+    print(f"{n} tests, {defect_rate:.0%} of questions broken: repair saves {saved:.0%} of requests, "
+          f"{1 - out['repair']['chars'] / out['regenerate']['chars']:.0%} of generated text")
+    return out
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description="Validate and repair generated reading tests.")
+    ap.add_argument("--bench", action="store_true", help="compare full regeneration with repair on a fake model")
+    ap.add_argument("-n", type=int, default=40, help="tests for --bench")
+    ap.add_argument("--defect-rate", type=float, default=0.1, help="share of broken questions for --bench")
+    ap.add_argument("file", nargs="?", help="a test JSON file to check")
+    args = ap.parse_args(argv)
+
+    if args.bench:
+        benchmark(args.n, args.defect_rate)
+        return
+    if not args.file:
+        ap.error("give a test JSON file or --bench")
+    import langtest
+
+    with open(args.file, encoding="utf-8") as f:
+        test = json.load(f)
+    problems = check_test(test, langtest.reading_test_validator())
+    if not problems:
+        print(f"{args.file}: ok")
+        return
+    for err in problems.test:
+        print(f"test: {err}")
+    for qid, errs in problems.questions.items():
+        print(f"{qid}: {'; '.join(errs)}")
+    if problems.missing_count:
+        print(f"needs {problems.missing_count} more question(s)"
+              + (f" ({', '.join(problems.missing_skills)})" if problems.missing_skills else ""))
+    raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
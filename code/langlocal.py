@@ -0,0 +1,153 @@
+# Reading tests without a model: passages and questions from a bundled corpus.
+#
+# reading_corpus.json holds, per TOPIC_POOL topic, a few titles, intros and
+# closings, fact sentences that each carry a literal question (answer plus
+# three wrong choices), figurative sentences with their meaning, and the
+# author's purpose. CorpusProvider picks and orders those with a
+# random.Random seeded from (seed, topic, grade, variant), so the same
+# arguments always give the same test, with no network and no API key, in well
+# under a millisecond. The output has the shape generate_reading_test returns
+# and passes langcheck.check_test.
+#
+#   python langlocal.py --topic "how magnets work" --seed 3
+#   python langlocal.py --bench
+
+import argparse
+import functools
+import json
+import os
+import random
+import re
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from langtest import Provider
+
+DEFAULT_CORPUS = os.environ.get("READING_CORPUS",
+                                os.path.join(os.path.dirname(os.path.abspath(__file__)), "reading_corpus.json"))
+
+LETTERS = "ABCD"
+
+
+@functools.lru_cache(maxsize=4)
+def load_corpus(path: str = DEFAULT_CORPUS) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _low_grade(grade: str) -> int:
+    # "3-4" -> 3; anything unparseable counts as the default grade
+    m = re.match(r"\s*(\d+)", grade)
+    return int(m.group(1)) if m else 3
+
+
+def _multiple_choice(rng: random.Random, answer: str, wrong: List[str]) -> Tuple[List[str], str]:
+    # four shuffled choices and the letter of the right one
+    choices = [answer] + rng.sample(wrong, 3)
+    rng.shuffle(choices)
+    return choices, LETTERS[choices.index(answer)]
+
+
+class CorpusProvider(Provider):
+    """
+    Builds a schema-valid reading test from reading_corpus.json. Two tests
+    differ only if seed, topic, grade or variant do.
+    """
+
+    name = "local"
+
+    def __init__(self, seed: int = 0, corpus: str = DEFAULT_CORPUS):
+        self.seed = seed
+        self.corpus = load_corpus(corpus)
+
+    def topics(self) -> List[str]:
+        return list(self.corpus["topics"])
+
+    def reading_test(self, *, topic: str, grade: str = "3-4", variant: int = 0) -> Dict[str, Any]:
+        entry = self.corpus["topics"].get(topic)
+        if entry is None:
+            raise ValueError(f"no corpus passage for {topic!r}; topics: {', '.join(self.topics())}")
+        rng = random.Random(f"{self.seed}|{topic}|{grade}|{variant}")
+
+        # passage: intro, facts in corpus order with a figure of speech after
+        # the second, the other figure, closing; younger readers get fewer facts
+        n_facts = 4 if _low_grade(grade) < 3 else 5
+        facts = [entry["facts"][i] for i in sorted(rng.sample(range(len(entry["facts"])), n_facts))]
+        figures = rng.sample(entry["figurative"], 2)
+        closing = rng.choice(entry["closings"])
+        sentences = [rng.choice(entry["intros"])]
+        sentences += [f["text"] for f in facts[:2]] + [figures[0]["text"]]
+        sentences += [f["text"] for f in facts[2:]] + [figures[1]["text"], closing]
+
+        questions: List[Dict[str, Any]] = []
+        key: Dict[str, str] = {}
+
+        def add(skill: str, prompt: str, choices: Optional[List[str]], answer: str) -> None:
+            qid = f"Q{len(questions) + 1}"
+            questions.append({"id": qid, "type": "multiple_choice" if choices else "short_answer",
+                              "skill": skill, "prompt": prompt, "choices": choices})
+            key[qid] = answer
+
+        choices, letter = _multiple_choice(rng, entry["purpose"], self.corpus["purpose_wrong"])
+        add("author_intent", "Why did the author most likely write this passage?", choices, letter)
+        add("author_intent", f'Why do you think the author ends the passage with "{closing}"',
+            None, "It sums up the main idea and connects it to the reader's own life.")
+
+        asked = rng.sample(facts, 3)
+        for fact in asked[:2]:
+            choices, letter = _multiple_choice(rng, fact["answer"], fact["wrong"])
+            add("literal", fact["question"], choices, letter)
+        add("literal", f"{asked[2]['question']} Answer in a complete sentence using the passage.",
+            None, f"{asked[2]['answer'][0].upper()}{asked[2]['answer'][1:]} (\"{asked[2]['text']}\")")
+
+        choices, letter = _multiple_choice(rng, figures[0]["meaning"], figures[0]["wrong"])
+        add("non_literal", f'The author writes "{figures[0]["phrase"]}". What does this phrase mean?',
+            choices, letter)
+        add("non_literal", f'The passage says, "{figures[1]["text"]}" Is this meant literally? '
+                           f'Explain what it really means.',
+            None, f'No. "{figures[1]["phrase"]}" means {figures[1]["meaning"]}.')
+
+        return {"title": rng.choice(entry["titles"]), "passage": " ".join(sentences),
+                "questions": questions, "answer_key": key}
+
+
+def benchmark(n: int = 1000, seed: int = 0) -> float:
+    import langtest
+    from langcheck import check_test
+
+    provider = CorpusProvider(seed=seed)
+    validate = langtest.reading_test_validator()
+    topics = provider.topics()
+    t0 = time.perf_counter()
+    for i in range(n):
+        test = provider.reading_test(topic=topics[i % len(topics)], variant=i)
+        if check_test(test, validate):
+            raise ValueError(f"invalid corpus test for {topics[i % len(topics)]!r}, variant {i}")
+    dt = (time.perf_counter() - t0) / n
+    print(f"{n} tests built and checked: {dt * 1e6:.1f} us/test")
+    return dt
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description="Build a reading test from the bundled corpus.")
+    ap.add_argument("--topic", help="default: the first corpus topic")
+    ap.add_argument("--grade", default="3-4")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--variant", type=int, default=0)
+    ap.add_argument("--bench", action="store_true", help="time building and checking tests")
+    ap.add_argument("-n", type=int, default=1000, help="tests for --bench")
+    args = ap.parse_args(argv)
+
+    if args.bench:
+        benchmark(args.n, args.seed)
+        return
+    provider = CorpusProvider(seed=args.seed)
+    topic = args.topic or provider.topics()[0]
+    json.dump(provider.reading_test(topic=topic, grade=args.grade, variant=args.variant), sys.stdout,
+              indent=1, ensure_ascii=False)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,33 @@
 # daily_reading_test_openai.py
-# Requires: pip install openai reportlab
+# Requires: pip install openai reportlab (openai only for --provider openai)
 # Env var: export OPENAI_API_KEY="..."
+# --provider local builds the test from reading_corpus.json (langlocal.py)
 
+import abc
+import argparse
 import os
 import json
+import functools
+import sys
 from datetime import date
-from typing import Dict, Any, List
+from typing import IO, TYPE_CHECKING, Dict, Any, Generator, List, Optional, Union
 
-from openai import OpenAI
+# openai and reportlab's canvas are imported on first use: a cache hit or
+# --key-only never loads the client, and `import langtest` stays cheap
 from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
 from reportlab.lib.units import inch
-import textwrap
+
+import instrument
+from instrument import span
+from langcache import ResponseCache, cache_key
+from langcheck import (Problems, ResponseStream, check_test, compile_schema, merge_repair, repair_messages,
+                       strip_fences)
+from pagetemplates import PageTemplates, use_forms
+from textlayout import draw_block, layout, split_block
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+    from reportlab.pdfgen.canvas import Canvas
 
 
 OUT_PDF = "Daily_Reading_Test_Age8.pdf"
@@ -40,20 +56,8 @@ def pick_daily_topic(today: date) -> str:
     return TOPIC_POOL[idx]
 
 
-def generate_reading_test(client: OpenAI, *, topic: str, grade: str = "3-4") -> Dict[str, Any]:
-    """
-    Returns a dict:
-      {
-        "title": "...",
-        "passage": "...",
-        "questions": [
-            {"id":"Q1","type":"multiple_choice","skill":"author_intent", ...},
-            ...
-        ],
-        "answer_key": {"Q1":"B", "Q2":"..."}
-      }
-    """
-    schema = {
+def reading_test_schema() -> Dict[str, Any]:
+    return {
         "name": "reading_test",
         "strict": True,
         "schema": {
@@ -91,6 +95,9 @@ def generate_reading_test(client: OpenAI, *, topic: str, grade: str = "3-4") ->
         },
     }
 
+
+def build_messages(*, topic: str, grade: str = "3-4", variant: int = 0) -> List[Dict[str, str]]:
+    # variant > 0 asks for a different passage on the same topic (bank building)
     system_instructions = (
         "You are an expert elementary reading teacher.\n"
         f"Write one short NONFICTION passage for grade {grade} readers (about 120–170 words).\n"
@@ -105,63 +112,277 @@ def generate_reading_test(client: OpenAI, *, topic: str, grade: str = "3-4") ->
         "Provide an answer key mapping question IDs to the correct choice letter (A/B/C/D) or a short expected answer."
     )
 
-    # Responses API call :contentReference[oaicite:2]{index=2}
-    resp = client.responses.create(
-        model=MODEL,
-        input=[
-            {"role": "system", "content": system_instructions},
-            {"role": "user", "content": (
-                f"Topic: {topic}. Create the passage and questions.\n\n"
-                "IMPORTANT: Respond with VALID JSON ONLY.\n"
-                "Do not include explanations, markdown, or extra text.\n"
-                "The JSON must have exactly these keys:\n"
-                "{\n"
-                '  "title": string,\n'
-                '  "passage": string,\n'
-                '  "questions": [\n'
-                "     {\n"
-                '       "id": string,\n'
-                '       "type": "multiple_choice" | "short_answer",\n'
-                '       "skill": "author_intent" | "literal" | "non_literal",\n'
-                '       "prompt": string,\n'
-                '       "choices": [string] | null\n'
-                "     }\n"
-                "  ],\n"
-                '  "answer_key": { string: string }\n'
-                "}\n"
-            )},
+    return [
+        {"role": "system", "content": system_instructions},
+        {"role": "user", "content": (
+            f"Topic: {topic}. Create the passage and questions.\n\n"
+            + (f"This is version {variant + 1}: use a different angle and title than other versions.\n\n"
+               if variant else "") +
+            "IMPORTANT: Respond with VALID JSON ONLY.\n"
+            "Do not include explanations, markdown, or extra text.\n"
+            "The JSON must have exactly these keys:\n"
+            "{\n"
+            '  "title": string,\n'
+            '  "passage": string,\n'
+            '  "questions": [\n'
+            "     {\n"
+            '       "id": string,\n'
+            '       "type": "multiple_choice" | "short_answer",\n'
+            '       "skill": "author_intent" | "literal" | "non_literal",\n'
+            '       "prompt": string,\n'
+            '       "choices": [string] | null\n'
+            "     }\n"
+            "  ],\n"
+            '  "answer_key": { string: string }\n'
+            "}\n"
+        )},
+    ]
+
+
+@functools.lru_cache(maxsize=1)
+def reading_test_validator():
+    # compiled once per process; see langcheck.compile_schema
+    return compile_schema(reading_test_schema()["schema"])
+
+
+def request_cache_key(*, topic: str, grade: str, messages: List[Dict[str, str]], model: str = MODEL) -> str:
+    # model names whatever answers the request, so a stand-in client never
+    # shares entries with the real one
+    prompt = json.dumps([messages, reading_test_schema()], sort_keys=True, ensure_ascii=False)
+    return cache_key(model, topic, grade, prompt)
+
+
+def cache_model(client: Any) -> str:
+    # the model part of the cache key; stand-in clients name themselves
+    # (checked on the class: LazyOpenAI answers any attribute)
+    return getattr(type(client), "cache_model", MODEL)
+
+
+class LazyOpenAI:
+    """
+    Stands in for OpenAI(api_key=...). The openai package is imported and the
+    client built on first use, so runs served from the cache never pay for it
+    (or need a key).
+    """
+
+    def __init__(self, api_key: Optional[str] = None):
+        self._api_key = api_key
+        self._client = None
+
+    def __getattr__(self, name: str) -> Any:
+        if self._client is None:
+            if not self._api_key:
+                raise SystemExit("Missing OPENAI_API_KEY environment variable.")
+            from openai import OpenAI
+            self._client = OpenAI(api_key=self._api_key)
+        return getattr(self._client, name)
+
+
+def _request(client: "OpenAI", messages: List[Dict[str, str]], stream: bool) -> Any:
+    # one model call -> parsed JSON; raises ValueError for a response that is
+    # not JSON (a stream is dropped as soon as that is clear)
+    with span("model_call", stream=stream):
+        if not stream:
+            raw = client.responses.create(model=MODEL, input=messages).output_text
+        else:
+            parsed = ResponseStream()
+            events = client.responses.create(model=MODEL, input=messages, stream=True)
+            for event in events:
+                if event.type == "response.output_text.delta":
+                    parsed.feed(event.delta)
+                    if parsed.broken:
+                        getattr(events, "close", lambda: None)()
+                        raise ValueError("response is not JSON: " + parsed.text()[:60])
+            raw = parsed.text()
+    instrument.observe("response_chars", len(raw))
+    with span("json_parse"):
+        return json.loads(strip_fences(raw))
+
+
+# -----------------------
+# Providers
+# -----------------------
+class Provider(abc.ABC):
+    """
+    Where reading tests come from. reading_test() returns a test dict (see
+    generate_reading_test) and every provider must define it; cache_key() is
+    None when the output is not worth caching, and `checked` says
+    reading_test() already validated it.
+    """
+
+    name = ""
+    checked = False
+
+    @abc.abstractmethod
+    def reading_test(self, *, topic: str, grade: str = "3-4", variant: int = 0) -> Dict[str, Any]:
+        ...
+
+    def cache_key(self, *, topic: str, grade: str, variant: int = 0) -> Optional[str]:
+        return None
+
+
+class ResponsesProvider(Provider):
+    """
+    A model behind the Responses API: OpenAI(), LazyOpenAI or
+    langcheck.FakeModel. Every response is checked against
+    reading_test_schema() plus the rules in langcheck.check_test. Broken or
+    missing questions are rewritten by up to `repairs` small follow-up
+    requests; only a response that cannot be repaired that way (not JSON, no
+    passage, ...) is regenerated, up to `regenerations` times, before
+    ValueError. stream=True reads the response incrementally.
+    """
+
+    name = "openai"
+    checked = True
+
+    def __init__(self, client: "OpenAI", *, stream: bool = False, repairs: int = 2, regenerations: int = 1):
+        self.client = client
+        self.stream = stream
+        self.repairs = repairs
+        self.regenerations = regenerations
+
+    def cache_key(self, *, topic: str, grade: str, variant: int = 0) -> Optional[str]:
+        messages = build_messages(topic=topic, grade=grade, variant=variant)
+        return request_cache_key(topic=topic, grade=grade, messages=messages, model=cache_model(self.client))
+
+    def reading_test(self, *, topic: str, grade: str = "3-4", variant: int = 0) -> Dict[str, Any]:
+        # Responses API call :contentReference[oaicite:2]{index=2}
+        messages = build_messages(topic=topic, grade=grade, variant=variant)
+        steps = checked_test(messages, topic=topic, grade=grade, repairs=self.repairs,
+                             regenerations=self.regenerations)
+        request = next(steps)
+        while True:
+            try:
+                reply = _request(self.client, request, self.stream and request is messages)
+            except ValueError as e:
+                reply = e
+            try:
+                request = steps.send(reply)
+            except StopIteration as done:
+                return done.value
+
+
+def checked_test(messages: List[Dict[str, str]], *, topic: str, grade: str, repairs: int = 2,
+                 regenerations: int = 1) -> Generator[List[Dict[str, str]], Any, Dict[str, Any]]:
+    """
+    The check/repair/regenerate loop of ResponsesProvider without the model
+    calls, so the async bulk path (langbulk.request_test) runs the same one.
+    Yields the messages of each request it needs and is sent back the parsed
+    JSON, or the ValueError of a reply that is not JSON. Returns a test that
+    passes langcheck.check_test, or raises ValueError.
+    """
+    validate = reading_test_validator()
+    for attempt in range(regenerations + 1):
+        data = yield messages
+        if isinstance(data, ValueError):
+            problems = Problems()
+            problems.test.append(str(data))
+        else:
+            with span("validate"):
+                problems = check_test(data, validate)
+            for _ in range(repairs):
+                if not problems or not problems.repairable():
+                    break
+                instrument.count("repairs")
+                with span("repair", questions=len(problems.questions) + problems.missing_count):
+                    patch = yield repair_messages(data, problems, grade=grade)
+                    if isinstance(patch, dict):
+                        data = merge_repair(data, patch)
+                        problems = check_test(data, validate)
+        if not problems:
+            return data
+        if attempt < regenerations:
+            instrument.count("regenerations")
+    raise ValueError(f"reading test for {topic!r} is still invalid: {problems}")
+
+
+def cached_test(cache: ResponseCache, key: str) -> Optional[Dict[str, Any]]:
+    # a cache hit, re-checked: entries written before tests were validated (or
+    # by anything else) are treated as misses and get replaced
+    with span("cache.get"):
+        hit = cache.get(key)
+    if hit is None:
+        return None
+    if check_test(hit, reading_test_validator()):
+        instrument.count("cache.invalid")
+        return None
+    instrument.count("cache.hits")
+    return hit
+
+
+PROVIDERS = ("openai", "local")
+
+
+def make_provider(name: str = "openai", *, seed: int = 0, stream: bool = False) -> Provider:
+    # "local" needs neither the openai package nor a key; see langlocal.py
+    if name == "local":
+        from langlocal import CorpusProvider
+        return CorpusProvider(seed=seed)
+    if name == "openai":
+        # the key is only needed if the cache misses
+        return ResponsesProvider(LazyOpenAI(os.environ.get("OPENAI_API_KEY")), stream=stream)
+    raise ValueError(f"unknown provider {name!r}; choose from {', '.join(PROVIDERS)}")
+
+
+def generate_reading_test(provider: Any, *, topic: str, grade: str = "3-4", variant: int = 0,
+                          cache: Optional[ResponseCache] = None, stream: bool = False,
+                          repairs: int = 2, regenerations: int = 1) -> Dict[str, Any]:
+    """
+    Returns a dict:
+      {
+        "title": "...",
+        "passage": "...",
+        "questions": [
+            {"id":"Q1","type":"multiple_choice","skill":"author_intent", ...},
+            ...
         ],
-    )
+        "answer_key": {"Q1":"B", "Q2":"..."}
+      }
 
-    raw = resp.output_text.strip()
-    data = json.loads(raw)
+    `provider` is a Provider (make_provider) or a Responses API client, which
+    is wrapped in ResponsesProvider with stream/repairs/regenerations. With a
+    cache, the same (model, topic, grade, prompt) is only sent once. A test
+    that fails langcheck.check_test raises ValueError and is never cached, and
+    a cache hit that fails it is regenerated.
+    """
+    # checked on the class: LazyOpenAI answers any attribute, and a Provider
+    # subclass may come from a second copy of this module (python langtest.py)
+    if not hasattr(type(provider), "reading_test"):
+        provider = ResponsesProvider(provider, stream=stream, repairs=repairs, regenerations=regenerations)
+    key = None
+    if cache is not None:
+        key = provider.cache_key(topic=topic, grade=grade, variant=variant)
+    if key is not None:
+        hit = cached_test(cache, key)
+        if hit is not None:
+            return hit
+
+    with span("provider", provider=provider.name):
+        data = provider.reading_test(topic=topic, grade=grade, variant=variant)
+    if not provider.checked:
+        with span("validate"):
+            problems = check_test(data, reading_test_validator())
+        if problems:
+            raise ValueError(f"{provider.name} reading test for {topic!r} is invalid: {problems}")
+
+    if key is not None:
+        with span("cache.put"):
+            cache.put(key, data)
     return data
 
 
-def draw_wrapped(c: canvas.Canvas, x: float, y: float, text: str, *,
-                 width_chars: int = 95, leading: int = 14,
+def draw_wrapped(c: "Canvas", x: float, y: float, text: str, *,
+                 width: Optional[float] = None, leading: int = 14,
                  font: str = "Helvetica", size: int = 11) -> float:
-    c.setFont(font, size)
-    for para in text.split("\n"):
-        if not para.strip():
-            y -= leading
-            continue
-        for line in textwrap.wrap(para, width=width_chars):
-            c.drawString(x, y, line)
-            y -= leading
-        y -= leading * 0.5
-    return y
-
-
-def render_pdf(test: Dict[str, Any], *, out_pdf: str, today: date) -> None:
-    W, H = letter
-    margin = 0.7 * inch
-    c = canvas.Canvas(out_pdf, pagesize=letter)
-    c.setTitle("Daily Reading Test")
+    # wraps on real glyph widths; width defaults to the rest of the line
+    if width is None:
+        width = letter[0] - 0.7 * inch - x
+    return draw_block(c, x, y, layout(text, width, font=font, size=size, leading=leading))
 
-    today_str = today.strftime("%B %d, %Y")
 
-    # Header
+def draw_header(c: "Canvas", today_str: str) -> None:
+    W, H = letter
+    margin = 0.7 * inch
     c.setFont("Helvetica-Bold", 18)
     c.drawString(margin, H - margin, f"Reading Test — {today_str}")
     c.setFont("Helvetica", 11)
@@ -169,80 +390,182 @@ def render_pdf(test: Dict[str, Any], *, out_pdf: str, today: date) -> None:
     c.drawString(W - margin - 180, H - margin - 20, "Score: ______ / ______")
     c.line(margin, H - margin - 28, W - margin, H - margin - 28)
 
+
+def draw_answer_header(c: "Canvas", today_str: str) -> None:
+    W, H = letter
+    margin = 0.7 * inch
+    c.setFont("Helvetica-Bold", 16)
+    c.drawString(margin, H - margin, f"Answer Key — {today_str}")
+
+
+@functools.lru_cache(maxsize=8)
+def page_templates(today_str: str) -> PageTemplates:
+    # static layers shared by every copy rendered for the same day
+    t = PageTemplates("read")
+    t.add("header", lambda c: draw_header(c, today_str))
+    t.add("answer_header", lambda c: draw_answer_header(c, today_str))
+    return t
+
+
+BOTTOM = 0.9 * inch               # nothing is laid out below this line
+SHORT_ANSWER_BLANK = "   ______________________________________________"
+CHOICE_LETTERS = ["A", "B", "C", "D"]
+
+
+def plan_pages(test: Dict[str, Any], *, method: str = "greedy") -> List[List[tuple]]:
+    """
+    Lays out the whole test before anything is drawn. Returns one list of draw
+    ops per page:
+      ("template", name) | ("string", x, y, font, size, text)
+      ("line", x1, y1, x2, y2) | ("block", x, y, Block)
+    A question (prompt plus its choices or answer lines) is never split across
+    pages; a passage longer than a page continues on the next one.
+    """
+    W, H = letter
+    margin = 0.7 * inch
+    width = W - 2 * margin
+    pages: List[List[tuple]] = [[("template", "header")]]
     y = H - margin - 55
 
+    def new_page() -> float:
+        pages.append([])
+        return H - margin
+
     # Passage title + text
-    c.setFont("Helvetica-Bold", 13)
-    c.drawString(margin, y, f"Passage: {test['title']}")
+    pages[-1].append(("string", margin, y, "Helvetica-Bold", 13, f"Passage: {test['title']}"))
     y -= 18
-
-    y = draw_wrapped(c, margin, y, test["passage"], width_chars=95, leading=14, font="Helvetica", size=11)
+    passage = layout(test["passage"], width, font="Helvetica", size=11, leading=14, method=method)
+    while passage.lines:
+        if y - passage.height >= BOTTOM:
+            pages[-1].append(("block", margin, y, passage))
+            y -= passage.height
+            break
+        head, passage = split_block(passage, y - BOTTOM)
+        pages[-1].append(("block", margin, y, head))
+        y = new_page()
     y -= 8
 
     # Questions
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(margin, y, "Questions")
+    if y - 16 - 14 < BOTTOM:
+        y = new_page()
+    pages[-1].append(("string", margin, y, "Helvetica-Bold", 12, "Questions"))
     y -= 16
-    c.line(margin, y + 10, W - margin, y + 10)
-
-    c.setFont("Helvetica", 11)
+    pages[-1].append(("line", margin, y + 10, W - margin, y + 10))
 
     for q in test["questions"]:
         prompt = q["prompt"].strip()
-        y = draw_wrapped(c, margin, y, f"{q['id']}) {prompt}", width_chars=95, leading=14)
-
+        item = [(margin, layout(f"{q['id']}) {prompt}", width, method=method))]
         if q["type"] == "multiple_choice" and q["choices"]:
-            # Print A–D
-            letters = ["A", "B", "C", "D"]
             for i, choice in enumerate(q["choices"][:4]):
-                y = draw_wrapped(c, margin + 18, y, f"☐ {letters[i]}. {choice}", width_chars=92, leading=14)
+                item.append((margin + 18, layout(f"☐ {CHOICE_LETTERS[i]}. {choice}", width - 18, method=method)))
+            height = sum(b.height for _, b in item) + 4
+        else:
+            height = item[0][1].height + 34
+
+        if y - height < BOTTOM and pages[-1]:
+            y = new_page()
+        for x, block in item:
+            pages[-1].append(("block", x, y, block))
+            y -= block.height
+        if q["type"] == "multiple_choice" and q["choices"]:
             y -= 4
         else:
             # short answer lines
-            c.drawString(margin, y, "   ______________________________________________")
+            pages[-1].append(("string", margin, y, "Helvetica", 11, SHORT_ANSWER_BLANK))
             y -= 16
-            c.drawString(margin, y, "   ______________________________________________")
+            pages[-1].append(("string", margin, y, "Helvetica", 11, SHORT_ANSWER_BLANK))
             y -= 18
+    return pages
 
-        # Page overflow
-        if y < 1.1 * inch:
-            c.showPage()
-            y = H - margin
-            c.setFont("Helvetica", 11)
 
-    # Optional: print answer key on a second page (comment out if you don't want it)
-    c.showPage()
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(margin, H - margin, f"Answer Key — {today_str}")
+def plan_answer_pages(test: Dict[str, Any]) -> List[List[tuple]]:
+    W, H = letter
+    margin = 0.7 * inch
+    pages: List[List[tuple]] = [[("template", "answer_header")]]
     y = H - margin - 30
-    c.setFont("Helvetica", 11)
-
     for q in test["questions"]:
         qid = q["id"]
         ans = test["answer_key"].get(qid, "")
-        c.drawString(margin, y, f"{qid}: {ans}")
-        y -= 14
-        if y < 1.0 * inch:
-            c.showPage()
+        block = layout(f"{qid}: {ans}", W - 2 * margin)
+        if y - block.height < BOTTOM:
+            pages.append([])
             y = H - margin
-            c.setFont("Helvetica", 11)
-
-    c.save()
-
-def main():
-    api_key = OPENAI_API_KEY#os.environ.get("OPENAI_API_KEY")
-    if not api_key:
-        raise SystemExit("Missing OPENAI_API_KEY environment variable.")
+        pages[-1].append(("block", margin, y, block))
+        y -= block.height
+    return pages
+
+
+def draw_pages(c: "Canvas", pages: List[List[tuple]], templates: PageTemplates) -> None:
+    for ops in pages:
+        for op in ops:
+            kind = op[0]
+            if kind == "block":
+                draw_block(c, op[1], op[2], op[3])
+            elif kind == "string":
+                c.setFont(op[3], op[4])
+                c.drawString(op[1], op[2], op[5])
+            elif kind == "line":
+                c.line(*op[1:])
+            else:
+                templates.place(c, op[1])
+        c.showPage()
+
+
+def render_pdf(test: Dict[str, Any], *, out_pdf: Union[str, IO[bytes]], today: date, forms: bool = False,
+               answer_key: bool = True) -> None:
+    from reportlab.pdfgen.canvas import Canvas
+    c = instrument.count_draw_calls(Canvas(out_pdf, pagesize=letter))
+    c.setTitle("Daily Reading Test")
+    if forms:
+        use_forms(c)
 
-    client = OpenAI(api_key=OPENAI_API_KEY)
+    today_str = today.strftime("%B %d, %Y")
+    templates = page_templates(today_str)
+
+    with span("layout"):
+        pages = plan_pages(test)
+        if answer_key:
+            # answer key starts on its own page
+            pages += plan_answer_pages(test)
+    with span("draw", pages=len(pages)):
+        draw_pages(c, pages, templates)
+    with span("save"):
+        c.save()
+    if instrument.enabled:
+        instrument.observe("pdf_bytes", os.path.getsize(out_pdf) if isinstance(out_pdf, str) else out_pdf.tell())
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description="Generate today's reading test PDF.")
+    ap.add_argument("--out", default=OUT_PDF, help="output PDF")
+    ap.add_argument("--topic", help="default: today's topic from TOPIC_POOL")
+    ap.add_argument("--grade", default="3-4")
+    ap.add_argument("--key-only", action="store_true", help="print the answer key as JSON instead of the PDF")
+    ap.add_argument("--stream", action="store_true", help="stream the response, dropping a non-JSON reply early")
+    ap.add_argument("--provider", choices=PROVIDERS, default=os.environ.get("READING_PROVIDER", "openai"),
+                    help="openai (default) or local: built from the bundled corpus, no network")
+    ap.add_argument("--seed", type=int, default=0, help="seed for --provider local")
+    args = ap.parse_args(argv)
+    instrument.from_env()
+
+    provider = make_provider(args.provider, seed=args.seed, stream=args.stream)
 
     today = date.today()
-    topic = pick_daily_topic(today)
-
-    test = generate_reading_test(client, topic=topic, grade="3-4")
-    render_pdf(test, out_pdf=OUT_PDF, today=today)
-
-    print(f"Wrote: {OUT_PDF}  (topic: {topic})")
+    topic = args.topic or pick_daily_topic(today)
+    if args.provider == "local" and topic not in provider.topics():
+        ap.error(f"no corpus passage for {topic!r}; topics: {', '.join(provider.topics())}")
+
+    cache = None if os.environ.get("READING_CACHE") == "off" else ResponseCache()
+    test = generate_reading_test(provider, topic=topic, grade=args.grade, cache=cache)
+    if args.key_only:
+        json.dump(test["answer_key"], sys.stdout, indent=1, ensure_ascii=False)
+        print()
+        return
+    render_pdf(test, out_pdf=args.out, today=today)
+
+    print(f"Wrote: {args.out}  (topic: {topic}, provider: {provider.name})")
+    if cache is not None and provider.cache_key(topic=topic, grade=args.grade) is not None:
+        print(f"Cache: {cache.stats['hits']} hit(s), {cache.stats['misses']} miss(es)")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,226 @@
+# Answer keys for mathtest.py problem sets.
+#
+# solve_problem_set() works out every item on both pages and returns the
+# answers keyed by the question labels printed on the test ("1", "5", "9a",
+# "p2-3b", ...), taken from mathtest.worksheet_layout() so they can't drift
+# from the sheet. Fractions are given in lowest terms; fields_match() still
+# accepts an equivalent fraction where the question does not ask for that.
+# Prime factorization uses a smallest-prime-factor sieve plus an LRU cache, so
+# solving stays in the microseconds per item even for big banks.
+
+from array import array
+from decimal import Decimal
+from fractions import Fraction
+from functools import lru_cache
+import math
+
+SIEVE_LIMIT = 1 << 17             # numbers below this factor by table lookup
+
+_spf = None
+
+
+def spf_table():
+    # smallest prime factor of every n < SIEVE_LIMIT, built on first use
+    global _spf
+    if _spf is None:
+        # one slice assignment per prime up to the square root, largest first,
+        # so the smallest prime is the one left in each slot (~4x faster than
+        # marking composites one by one; this is most of a cold --key-only run)
+        spf = array("i", range(SIEVE_LIMIT))
+        root = math.isqrt(SIEVE_LIMIT - 1)
+        primes = [p for p in range(2, root + 1) if all(p % q for q in range(2, math.isqrt(p) + 1))]
+        for p in reversed(primes):
+            spf[p * p::p] = array("i", [p]) * len(range(p * p, SIEVE_LIMIT, p))
+        _spf = spf
+    return _spf
+
+
+@lru_cache(maxsize=65536)
+def prime_factors(n: int) -> tuple:
+    # ascending prime factors with repeats: 360 -> (2, 2, 2, 3, 3, 5)
+    if n < 2:
+        return ()
+    out = []
+    if n >= SIEVE_LIMIT:
+        p = 2
+        while p * p <= n and n >= SIEVE_LIMIT:
+            while n % p == 0:
+                out.append(p)
+                n //= p
+            p += 1 if p == 2 else 2
+        if n >= SIEVE_LIMIT:
+            out.append(n)
+            return tuple(out)
+    spf = spf_table()
+    while n > 1:
+        p = spf[n]
+        out.append(p)
+        n //= p
+    return tuple(out)
+
+
+def format_factors(n: int) -> str:
+    # 360 -> "2^3 × 3^2 × 5"
+    factors = prime_factors(n)
+    parts = []
+    for p in sorted(set(factors)):
+        k = factors.count(p)
+        parts.append(f"{p}^{k}" if k > 1 else str(p))
+    return " × ".join(parts)
+
+
+def reduce_fraction(num, den):
+    g = math.gcd(num, den)
+    return num // g, den // g
+
+
+def format_fraction(num, den):
+    num, den = reduce_fraction(num, den)
+    if den < 0:
+        num, den = -num, -den
+    return str(num) if den == 1 else f"{num}/{den}"
+
+
+def fraction_sum(n1, d1, op, n2, d2):
+    # (result string, LCD)
+    lcd = d1 * d2 // math.gcd(d1, d2)
+    a = n1 * (lcd // d1)
+    b = n2 * (lcd // d2)
+    total = a + b if op == "+" else a - b
+    return format_fraction(total, lcd), lcd
+
+
+def improper_to_mixed(num, den):
+    whole, rem = divmod(num, den)
+    return whole, rem, den
+
+
+def mixed_expression(dec1, op1, dec2, op2, fn, fd):
+    # evaluated left to right in exact decimal arithmetic
+    total = Decimal(repr(dec1))
+    total = total + Decimal(repr(dec2)) if op1 == "+" else total - Decimal(repr(dec2))
+    frac = Decimal(fn) / Decimal(fd)
+    total = total + frac if op2 == "+" else total - frac
+    text = format(total.normalize(), "f")
+    return "0" if text in ("-0", "0") else text
+
+
+def figure_area(kind, *dims):
+    # area of a mathtest.make_area_figure shape (dims without the unit)
+    if kind == "rectangle":
+        w, h = dims
+        return w * h
+    if kind == "l_shape":
+        w, h, cut_w, cut_h = dims
+        return w * h - cut_w * cut_h
+    if kind == "triangle":
+        base, height = dims
+        return base * height // 2
+    if kind == "trapezoid":
+        top, bottom, height = dims
+        return (top + bottom) * height // 2
+    raise ValueError(f"unknown figure kind: {kind!r}")
+
+
+def _sum_with_lcd(item):
+    result, lcd = fraction_sum(*item)
+    return f"{result} (LCD {lcd})"
+
+
+def _improper_from_mixed(item):
+    # in lowest terms: 4 4/8 -> 9/2
+    whole, num, den = item
+    f = Fraction(whole * den + num, den)
+    return f"{f.numerator}/{f.denominator}"
+
+
+def _mixed_from_improper(item):
+    # fraction part in lowest terms: 76/8 -> 9 1/2
+    whole, rem, den = improper_to_mixed(*item)
+    f = Fraction(rem, den)
+    return f"{whole} {f.numerator}/{f.denominator}"
+
+
+def _hcf_lcm(item):
+    a, b = item
+    g = math.gcd(a, b)
+    return f"HCF {g}, LCM {a * b // g}"
+
+
+# ProblemSet field -> (section, answer of one of its items); the mixed decimal
+# & fraction item counts toward fraction sums
+ANSWERS = {
+    "add_nums": ("addition", lambda nums: str(sum(nums))),
+    "sub": ("subtraction", lambda ab: str(ab[0] - ab[1])),
+    "mults": ("multiplication", lambda ab: str(ab[0] * ab[1])),
+    "divs": ("division", lambda ab: str(ab[0] // ab[1])),
+    "simp_fracs": ("simplify", lambda ab: format_fraction(*ab)),
+    "frac_sums": ("fraction_sum", _sum_with_lcd),
+    "mixed": ("fraction_sum", lambda item: mixed_expression(*item)),
+    "prime_targets": ("prime_factors", format_factors),
+    "mixed_numbers": ("mixed_to_improper", _improper_from_mixed),
+    "improper_fracs": ("improper_to_mixed", _mixed_from_improper),
+    "pairs": ("hcf_lcm", _hcf_lcm),
+    "areas": ("area", lambda fig: f"{figure_area(fig[0], *fig[2:])} {fig[1]}²"),
+}
+
+
+def _questions(ps):
+    # (label, field, item) of every question, from the layout the sheet is
+    # drawn with (imported here: mathtest imports this module)
+    import mathtest
+    for label, field, index in mathtest.worksheet_layout(ps).questions:
+        item = getattr(ps, field)
+        yield label, field, item if index is None else item[index]
+
+
+def solve_problem_set(ps) -> dict:
+    # {label: answer}, labels in the order the questions are printed
+    return {label: ANSWERS[field][1](item) for label, field, item in _questions(ps)}
+
+
+def answer_sections(ps) -> dict:
+    # {label: section} for the same labels as solve_problem_set
+    return {label: ANSWERS[field][0] for label, field, _ in _questions(ps)}
+
+
+def answer_fields(ps) -> dict:
+    # {label: what goes in each of its blanks, in mathtest.AnswerBoxes order}
+    # for checking a scanned sheet; None where the answer is free-form (prime
+    # factorizations) and has to be marked by hand
+    sections = answer_sections(ps)
+    fields = {}
+    for label, ans in solve_problem_set(ps).items():
+        sec = sections[label]
+        if sec == "prime_factors":
+            fields[label] = None
+        elif sec == "mixed_to_improper":
+            fields[label] = tuple(ans.split("/"))              # num / den
+        elif sec == "improper_to_mixed":
+            whole, frac = ans.split(" ")
+            fields[label] = (whole, *frac.split("/"))         # whole  num/den
+        elif sec == "hcf_lcm":
+            hcf, lcm = ans.split(", ")
+            fields[label] = (hcf.split()[1], lcm.split()[1])
+        else:
+            # number or fraction; drops "(LCD n)" and the area's unit
+            fields[label] = (ans.split(" ")[0],)
+    return fields
+
+
+def fields_match(section, got, want) -> bool:
+    # a read answer against its answer_fields() entry. The conversions do not
+    # ask for lowest terms, so any equivalent fraction counts there (a mixed
+    # number still needs a proper fraction part).
+    if tuple(got) == tuple(want):
+        return True
+    if section not in ("mixed_to_improper", "improper_to_mixed") or len(got) != len(want):
+        return False
+    try:
+        got = [int(g) for g in got]
+        if section == "mixed_to_improper":
+            return got[1] != 0 and Fraction(*got) == Fraction(*map(int, want))
+        whole, num, den = got
+        return 0 < num < den and whole + Fraction(num, den) == int(want[0]) + Fraction(int(want[1]), int(want[2]))
+    except ValueError:
+        return False
@@ -0,0 +1,198 @@
+# Vectorized problem generation for bulk question banks.
+# Requires: pip install numpy
+#
+# Each make_* function returns a whole column of problems as an int64 array,
+# drawn from a numpy.random.Generator, following the same difficulty profile
+# and value pools as the scalar generators in mathtest.py. Use the scalar path
+# for a single worksheet; use this one when a bank needs millions of items.
+
+import argparse
+import random
+import time
+
+import numpy as np
+
+import mathtest as mt
+
+OPS = np.array(["+", "-"])        # fraction-sum op codes: 0 -> "+", 1 -> "-"
+
+
+def rand_ndigit(gen: np.random.Generator, n_digits) -> np.ndarray:
+    # n_digits may be an array: each item gets its own digit count
+    n_digits = np.asarray(n_digits, dtype=np.int64)
+    lo = 10 ** (n_digits - 1)
+    hi = 10 ** n_digits - 1
+    return gen.integers(lo, hi, endpoint=True)
+
+
+def make_addition(gen, n, profile=None):
+    # (n, add_terms)
+    p = profile or mt.default_profile()
+    digits = gen.integers(p.add_min_digits, p.add_max_digits, size=(n, p.add_terms), endpoint=True)
+    return rand_ndigit(gen, digits)
+
+
+def make_subtraction(gen, n, profile=None):
+    # (n, 2) columns a, b with a >= b
+    p = profile or mt.default_profile()
+    da = gen.integers(p.sub_min_digits, p.sub_max_digits, size=n, endpoint=True)
+    a = rand_ndigit(gen, da)
+    db = gen.integers(p.sub_min_digits, np.minimum(p.sub_max_digits, da), endpoint=True)
+    b = rand_ndigit(gen, db)
+    return np.stack([np.maximum(a, b), np.minimum(a, b)], axis=1)
+
+
+def make_multiplication(gen, n, profile=None):
+    # (n, 2) columns top, bottom
+    p = profile or mt.default_profile()
+    top = rand_ndigit(gen, np.full(n, p.mult_top_digits))
+    bottom = rand_ndigit(gen, np.full(n, p.mult_bottom_digits))
+    return np.stack([top, bottom], axis=1)
+
+
+def make_division_exact(gen, n, profile=None):
+    # (n, 2) columns dividend, divisor; dividend = divisor * quotient so it divides evenly
+    divisor = gen.choice(np.array(mt.DIV_DIVISORS, dtype=np.int64), size=n)
+    quotient = gen.integers(12, 98, size=n, endpoint=True)
+    return np.stack([divisor * quotient, divisor], axis=1)
+
+
+def make_simplify_fraction(gen, n, profile=None):
+    # (n, 2) columns a, b sharing a factor >= 2
+    base = gen.integers(2, 12, size=n, endpoint=True)
+    a = gen.integers(2, 25, size=n, endpoint=True) * base
+    b = gen.integers(2, 25, size=n, endpoint=True) * base
+    return np.stack([a, b], axis=1)
+
+
+def make_fraction_sum(gen, n, profile=None):
+    # (n, 5) columns n1, d1, op, n2, d2; op indexes OPS
+    denoms = np.array(mt.FRACTION_DENOMS, dtype=np.int64)
+    d1 = gen.choice(denoms, size=n)
+    d2 = gen.choice(denoms, size=n)
+    n1 = gen.integers(1, d1 - 1, endpoint=True)
+    n2 = gen.integers(1, d2 - 1, endpoint=True)
+    op = gen.integers(0, 2, size=n)
+    return np.stack([n1, d1, op, n2, d2], axis=1)
+
+
+def make_prime_factor_targets(gen, n, profile=None):
+    # (n, prime_facts): distinct pool entries per row
+    k = (profile or mt.default_profile()).prime_facts
+    pool = np.broadcast_to(np.array(mt.PRIME_POOL, dtype=np.int64), (n, len(mt.PRIME_POOL)))
+    return gen.permuted(pool, axis=1)[:, :k]
+
+
+def make_mixed_number(gen, n, profile=None):
+    # (n, 3) columns whole, num, den
+    den = gen.choice(np.array(mt.MIXED_DENOMS, dtype=np.int64), size=n)
+    whole = gen.integers(1, 9, size=n, endpoint=True)
+    num = gen.integers(1, den - 1, endpoint=True)
+    return np.stack([whole, num, den], axis=1)
+
+
+def make_improper_fraction(gen, n, profile=None):
+    # (n, 2) columns num, den (never a whole number)
+    whole, num, den = make_mixed_number(gen, n).T
+    return np.stack([whole * den + num, den], axis=1)
+
+
+def make_hcf_lcm_pair(gen, n, profile=None):
+    # (n, 4) columns a, b, hcf, lcm
+    base = gen.choice(np.array(mt.HCF_BASES, dtype=np.int64), size=n)
+    a = np.minimum(base * gen.integers(2, 20, size=n, endpoint=True), 999)
+    b = np.minimum(base * gen.integers(2, 20, size=n, endpoint=True), 999)
+    a = np.where(a < 10, a + base, a)
+    b = np.where(b < 10, b + base, b)
+    return np.stack([a, b, np.gcd(a, b), np.lcm(a, b)], axis=1)
+
+
+GENERATORS = {
+    "addition": make_addition,
+    "subtraction": make_subtraction,
+    "multiplication": make_multiplication,
+    "division": make_division_exact,
+    "simplify": make_simplify_fraction,
+    "fraction_sum": make_fraction_sum,
+    "prime_factors": make_prime_factor_targets,
+    "mixed_number": make_mixed_number,
+    "improper_fraction": make_improper_fraction,
+    "hcf_lcm": make_hcf_lcm_pair,
+}
+
+# scalar counterparts in mathtest.py, for benchmark()
+SCALAR = {
+    "addition": mt.make_addition,
+    "subtraction": mt.make_subtraction,
+    "multiplication": mt.make_multiplication,
+    "division": mt.make_division_exact,
+    "simplify": mt.make_simplify_fraction,
+    "fraction_sum": mt.make_fraction_sum,
+    "prime_factors": lambda rng: mt.make_prime_factor_targets(None, rng),
+    "mixed_number": mt.make_mixed_number,
+    "improper_fraction": mt.make_improper_fraction,
+    "hcf_lcm": mt.make_hcf_lcm_pair,
+}
+
+
+def make_bank(n, seed=None, kinds=None, profile=None):
+    # n items of every kind (or just `kinds`), as {kind: array}
+    gen = np.random.default_rng(seed)
+    profile = profile or mt.default_profile()
+    return {kind: GENERATORS[kind](gen, n, profile) for kind in (kinds or GENERATORS)}
+
+
+def save_bank(path, bank):
+    np.savez_compressed(path, **bank)
+
+
+def load_bank(path):
+    with np.load(path) as f:
+        return {kind: f[kind] for kind in f.files}
+
+
+def benchmark(n=200_000, seed=0):
+    # items/second per kind: scalar random.Random loop vs one vectorized call
+    rows = []
+    gen = np.random.default_rng(seed)
+    rng = random.Random(seed)
+    for kind, fn in GENERATORS.items():
+        scalar = SCALAR[kind]
+        t0 = time.perf_counter()
+        for _ in range(n):
+            scalar(rng)
+        t_scalar = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        fn(gen, n)
+        t_vec = time.perf_counter() - t0
+        rows.append((kind, n / t_scalar, n / t_vec, t_scalar / t_vec))
+
+    print(f"{'kind':<18} {'scalar/s':>12} {'numpy/s':>14} {'speedup':>8}")
+    for kind, s, v, x in rows:
+        print(f"{kind:<18} {s:>12,.0f} {v:>14,.0f} {x:>7.1f}x")
+    return rows
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Build a bulk math question bank with NumPy.")
+    ap.add_argument("-n", type=int, default=1_000_000, help="items per problem kind")
+    ap.add_argument("--seed", type=int)
+    ap.add_argument("--out", default="math_bank.npz")
+    ap.add_argument("--bench", action="store_true", help="compare against the scalar generators and exit")
+    args = ap.parse_args(argv)
+
+    if args.bench:
+        benchmark(min(args.n, 200_000), seed=args.seed or 0)
+        return
+
+    t0 = time.perf_counter()
+    bank = make_bank(args.n, seed=args.seed)
+    dt = time.perf_counter() - t0
+    save_bank(args.out, bank)
+    total = sum(len(col) for col in bank.values())
+    print(f"Wrote: {args.out}  ({total:,} items in {dt:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
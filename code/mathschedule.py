@@ -0,0 +1,315 @@
+# Adaptive difficulty for mathtest.py, driven by the score history.
+# Requires: pip install numpy
+#
+# Graded sections go into the score store as "Math.<section>" rows (percent
+# correct). SkillModel keeps, per student and section, an exponentially
+# weighted accuracy and a difficulty level in small numpy arrays; each graded
+# section is an O(1) update, and the model remembers how many store rows it
+# has consumed, so syncing only reads rows appended since the last run.
+# profiles() turns every student's levels into a mathtest.Profile in one pass,
+# which is what the nightly roster run renders from.
+#
+#   python mathschedule.py grade --student Ava --id M1-... --wrong 3 9b p2-3a --time 52
+#   python mathschedule.py profile --student Ava
+#   python mathschedule.py nightly --out-dir tonight
+
+import argparse
+import json
+import os
+import time
+import zlib
+from datetime import datetime
+
+import numpy as np
+
+import mathtest as mt
+from mathanswers import answer_sections
+from problemhistory import ProblemHistory, format_stats, history_path
+from scorestore import DEFAULT_STORE, ScoreStore
+
+SUBJECT = "Math"
+
+# section -> (Profile fields, values from easiest to hardest). The mathtest.py
+# defaults are level 0; a student's level moves one rung at a time.
+LADDERS = {
+    "addition": (("add_min_digits", "add_max_digits"), [(2, 3), (3, 4), (4, 5), (5, 6), (6, 7)]),
+    "subtraction": (("sub_min_digits", "sub_max_digits"), [(2, 2), (2, 3), (3, 4), (4, 5), (5, 6)]),
+    "multiplication": (("mult_top_digits", "mult_bottom_digits"), [(2, 1), (3, 1), (3, 2), (4, 2), (5, 2)]),
+    "division": (("div_problems",), [(1,), (2,), (3,)]),
+    "simplify": (("simplify_fractions",), [(1,), (2,), (3,)]),
+    "fraction_sum": (("fraction_sums",), [(1,), (2,), (3,)]),
+    "prime_factors": (("prime_facts",), [(2,), (3,), (4,)]),
+    "mixed_to_improper": (("page2_mixed_to_improper",), [(3,), (4,), (5,), (6,)]),
+    "improper_to_mixed": (("page2_improper_to_mixed",), [(3,), (4,), (5,), (6,)]),
+    "hcf_lcm": (("page2_hcf_lcm_pairs",), [(2,), (3,), (4,), (5,)]),
+    "area": (("page2_area_figures",), [(2,), (3,), (4,)]),
+}
+SECTIONS = tuple(LADDERS)
+
+# Extra question rows push everything below them down the page. The sections
+# that can give rows back, per page of mt.WORKSHEET_SPEC; a profile whose
+# layout would run a page onto a second sheet gives rows back, largest surplus
+# over the defaults first.
+PAGE_FIT = (
+    ("division", "simplify", "fraction_sum", "prime_factors"),
+    ("mixed_to_improper", "improper_to_mixed", "hcf_lcm"),
+)
+
+ALPHA = 0.4               # weight of the newest result in the running accuracy
+PROMOTE = 0.90            # running accuracy to move up a level
+DEMOTE = 0.60             # ... and to move down
+MIN_TESTS = 2             # results needed at a level before it can change
+RESET_ACC = 0.75          # running accuracy after a level change
+
+
+def _base_levels(profile):
+    # ladder index of the given profile's values, per section
+    return np.array([rungs.index(tuple(getattr(profile, f) for f in fields))
+                     for fields, rungs in LADDERS.values()], dtype=np.int8)
+
+
+BASE = _base_levels(mt.default_profile())
+
+
+class SkillModel:
+    def __init__(self, path=None):
+        self.path = path
+        self.students = []
+        self.index = {}
+        k = len(SECTIONS)
+        self.acc = np.full((0, k), np.nan, dtype=np.float32)
+        self.level = np.zeros((0, k), dtype=np.int8)      # relative to the defaults
+        self.since = np.zeros((0, k), dtype=np.uint16)    # results since the last level change
+        self.rows_seen = 0
+        if path and os.path.exists(path):
+            with np.load(path) as f:
+                self.students = f["students"].tolist()
+                self.acc, self.level, self.since = f["acc"], f["level"], f["since"]
+                self.rows_seen = int(f["rows_seen"])
+            # sections added since the model was saved start at the defaults
+            m, missing = self.acc.shape[0], k - self.acc.shape[1]
+            if missing > 0:
+                self.acc = np.hstack([self.acc, np.full((m, missing), np.nan, dtype=np.float32)])
+                self.level = np.hstack([self.level, np.zeros((m, missing), dtype=np.int8)])
+                self.since = np.hstack([self.since, np.zeros((m, missing), dtype=np.uint16)])
+            self.index = {s: i for i, s in enumerate(self.students)}
+
+    def save(self, path=None):
+        path = path or self.path
+        tmp = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp, students=np.array(self.students, dtype=str), acc=self.acc, level=self.level,
+                 since=self.since, rows_seen=self.rows_seen)
+        os.replace(tmp, path)
+
+    def add_students(self, names):
+        # one resize for any number of new students
+        new = [n for n in dict.fromkeys(names) if n not in self.index]
+        if not new:
+            return
+        for n in new:
+            self.index[n] = len(self.students)
+            self.students.append(n)
+        m, k = len(new), len(SECTIONS)
+        self.acc = np.vstack([self.acc, np.full((m, k), np.nan, dtype=np.float32)])
+        self.level = np.vstack([self.level, np.zeros((m, k), dtype=np.int8)])
+        self.since = np.vstack([self.since, np.zeros((m, k), dtype=np.uint16)])
+
+    def student(self, name):
+        if name not in self.index:
+            self.add_students([name])
+        return self.index[name]
+
+    def update(self, student, section, accuracy):
+        # one graded section (accuracy in 0..1): constant time
+        i, k = self.student(student), SECTIONS.index(section)
+        prev = self.acc[i, k]
+        acc = accuracy if np.isnan(prev) else ALPHA * accuracy + (1 - ALPHA) * prev
+        self.since[i, k] += 1
+        if self.since[i, k] >= MIN_TESTS and (acc >= PROMOTE or acc < DEMOTE):
+            step = 1 if acc >= PROMOTE else -1
+            lo, hi = -int(BASE[k]), len(LADDERS[section][1]) - 1 - int(BASE[k])
+            new = min(max(int(self.level[i, k]) + step, lo), hi)
+            if new != self.level[i, k]:
+                self.level[i, k] = new
+                self.since[i, k] = 0
+                acc = RESET_ACC
+        self.acc[i, k] = acc
+
+    def sync(self, store):
+        # fold in score-store rows appended since the last sync
+        n = len(store)
+        if n <= self.rows_seen:
+            return 0
+        cols = store.columns()
+        sub = np.asarray(cols["subject"][self.rows_seen:n])
+        section_of = {store.meta["subjects"].index(f"{SUBJECT}.{s}"): s
+                      for s in SECTIONS if f"{SUBJECT}.{s}" in store.meta["subjects"]}
+        rows = np.flatnonzero(np.isin(sub, list(section_of)))
+        students = store.meta["students"]
+        st = cols["student"][self.rows_seen:n][rows].tolist()
+        score = cols["score"][self.rows_seen:n][rows].tolist()
+        self.add_students(students[s] for s in set(st))
+        for s, code, pct in zip(st, sub[rows].tolist(), score):
+            self.update(students[s], section_of[code], pct / 100.0)
+        self.rows_seen = n
+        return len(rows)
+
+    def profiles(self):
+        # {student: Profile} for the whole roster, one column per knob
+        base = mt.default_profile()
+        cols = {}
+        for k, (fields, rungs) in enumerate(LADDERS.values()):
+            idx = self.level[:, k].astype(np.int64) + BASE[k]
+            values = np.array(rungs)[idx]
+            for j, f in enumerate(fields):
+                cols[f] = values[:, j].tolist()
+        out = {}
+        for i, name in enumerate(self.students):
+            p = base._replace(**{f: v[i] for f, v in cols.items()})
+            out[name] = fit_pages(p)
+        return out
+
+    def profile_for(self, student):
+        if student not in self.index:
+            return mt.default_profile()
+        return self.profiles()[student]
+
+
+def fit_pages(profile):
+    # give back question rows until every page fits on one sheet (see PAGE_FIT);
+    # layouts are cached per shape, so this is a few dict lookups per profile
+    base = mt.default_profile()
+    for page, sections in enumerate(PAGE_FIT):
+        fields = {s: LADDERS[s][0][0] for s in sections}
+        while mt.worksheet_layout(profile).sheets.count(page) > 1:
+            surplus = {s: getattr(profile, f) - getattr(base, f) for s, f in fields.items()}
+            s = max(surplus, key=surplus.get)
+            if surplus[s] <= 0:
+                break
+            profile = profile._replace(**{fields[s]: getattr(profile, fields[s]) - 1})
+    return profile
+
+
+def model_path(store):
+    return os.path.join(store.root, "skills.npz")
+
+
+# -----------------------
+# Grading and the nightly run
+# -----------------------
+def history_view(store, student, ws_id, history=None):
+    # what regenerate() needs for a history sheet: the student's problems as
+    # of the printed date (None for sheets drawn without history)
+    if not mt.uses_history(ws_id):
+        return None
+    _, _, today_str = mt.parse_worksheet_id(ws_id)
+    return (history or ProblemHistory(history_path(store.root))).view(student, datetime.strptime(today_str, "%B %d, %Y").date())
+
+
+def grade(store, student, ws_id, wrong=(), minutes=0.0, day=None, history=None, skip=()):
+    # record a marked worksheet: one overall Math row plus one row per section.
+    # Labels in skip were not marked (e.g. unread by scangrade.py) and count
+    # neither way; a section with nothing left gets no row.
+    _, _, today_str = mt.parse_worksheet_id(ws_id)
+    ps = mt.regenerate(ws_id, history_view(store, student, ws_id, history))
+    sections = answer_sections(ps)
+    unknown = (set(wrong) | set(skip)) - set(sections)
+    if unknown:
+        raise ValueError(f"no such question(s) on {ws_id}: {', '.join(sorted(unknown))}")
+    sections = {label: sec for label, sec in sections.items() if label not in skip}
+    if not sections:
+        raise ValueError(f"nothing left to grade on {ws_id}")
+    total = dict.fromkeys(SECTIONS, 0)
+    right = dict.fromkeys(SECTIONS, 0)
+    for label, sec in sections.items():
+        total[sec] += 1
+        right[sec] += label not in wrong
+    day = day or datetime.strptime(today_str, "%B %d, %Y").date()
+    used = [s for s in SECTIONS if total[s]]
+    overall = 100.0 * sum(right.values()) / len(sections)
+    store.append(
+        days=[day] * (len(used) + 1),
+        students=[student] * (len(used) + 1),
+        subjects=[SUBJECT] + [f"{SUBJECT}.{s}" for s in used],
+        scores=[overall] + [100.0 * right[s] / total[s] for s in used],
+        minutes=[minutes] + [0.0] * len(used),
+    )
+    return overall
+
+
+def roster_seed(student, today_str):
+    # stable per student and day, so re-running tonight's batch is idempotent
+    return zlib.crc32(f"{student}|{today_str}".encode("utf-8"))
+
+
+def nightly(model, out_dir, today_str=mt.today_str, students=None, answers="none", history=None):
+    # one worksheet per student from the in-memory model; writes a manifest
+    # of worksheet IDs next to the PDFs. With a ProblemHistory, items each
+    # student had in its window are redrawn and tonight's items recorded.
+    os.makedirs(out_dir, exist_ok=True)
+    profiles = model.profiles()
+    day = datetime.strptime(today_str, "%B %d, %Y").date()
+    manifest = {}
+    for student in students or model.students:
+        profile = profiles.get(student) or mt.default_profile()
+        seed = roster_seed(student, today_str)
+        name = f"{student}-{mt.batch_pdf_name(seed, today_str)}"
+        seen = history.view(student, day) if history is not None else None
+        mt.render_seed(os.path.join(out_dir, name), seed, today_str, answers, profile, seen)
+        if seen is not None:
+            history.commit(seen)
+        manifest[student] = {"pdf": name, "id": mt.worksheet_id(seed, profile, today_str, seen is not None)}
+    with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Adaptive difficulty from the score history.")
+    ap.add_argument("--store", default=DEFAULT_STORE)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    g = sub.add_parser("grade", help="record a marked worksheet")
+    g.add_argument("--student", required=True)
+    g.add_argument("--id", required=True, help="worksheet ID printed on the test")
+    g.add_argument("--wrong", nargs="*", default=[], help="labels marked wrong, e.g. 3 9b p2-3a")
+    g.add_argument("--time", type=float, default=0.0, help="minutes taken")
+
+    p = sub.add_parser("profile", help="show a student's levels and profile")
+    p.add_argument("--student", required=True)
+
+    n = sub.add_parser("nightly", help="one worksheet per student")
+    n.add_argument("--out-dir", default="nightly")
+    n.add_argument("--students", nargs="*", help="default: every student in the model")
+    n.add_argument("--answers", choices=mt.ANSWER_MODES, default="none")
+    n.add_argument("--allow-repeats", action="store_true", help="skip the problem-history check")
+    args = ap.parse_args(argv)
+
+    store = ScoreStore(args.store)
+    model = SkillModel(model_path(store))
+    model.sync(store)
+
+    if args.cmd == "grade":
+        overall = grade(store, args.student, args.id, args.wrong, args.time)
+        model.sync(store)
+        print(f"Recorded: {args.student} {overall:.1f}%")
+    elif args.cmd == "profile":
+        i = model.index.get(args.student)
+        for k, sec in enumerate(SECTIONS):
+            lvl = int(model.level[i, k]) if i is not None else 0
+            acc = float(model.acc[i, k]) if i is not None else float("nan")
+            print(f"{sec:<18} level {lvl:+d}  accuracy {acc:.2f}")
+        print(model.profile_for(args.student))
+    else:
+        history = None if args.allow_repeats else ProblemHistory(history_path(store.root))
+        t0 = time.perf_counter()
+        manifest = nightly(model, args.out_dir, students=args.students, answers=args.answers, history=history)
+        print(f"Wrote {len(manifest)} worksheet(s) to {args.out_dir} in {time.perf_counter() - t0:.2f}s")
+        if history is not None:
+            history.save()
+            print(f"Problem history: {format_stats(history.stats)}")
+    model.save()
+
+
+if __name__ == "__main__":
+    main()
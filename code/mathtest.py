@@ -1,10 +1,28 @@
+# reportlab's canvas, metrics and colors (and the process pool) are imported
+# where they are used, so --help, --key-only and `import mathtest` stay fast
 from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
 from reportlab.lib.units import inch
-from reportlab.lib import colors
-from datetime import date
+from collections import namedtuple
+from datetime import date, datetime
+import argparse
+import atexit
+import functools
+import io
+import json
+import os
 import random
 import math
+import sys
+import time
+import instrument
+from instrument import span
+if __name__ in ("__main__", "__mp_main__"):
+    # run as a script: mathanswers imports this module by name for the layout,
+    # which must not load (and define ProblemSet) a second time
+    sys.modules.setdefault("mathtest", sys.modules[__name__])
+from mathanswers import solve_problem_set
+from pagetemplates import PageTemplates, use_forms
+from pdfstream import PdfSink, SINK_FORMATS, peak_rss_mb
 today_str = date.today().strftime("%B %d, %Y")
 
 # -----------------------
@@ -34,15 +52,66 @@ PRIME_FACTS = 3
 PAGE2_MIXED_TO_IMPROPER = 5
 PAGE2_IMPROPER_TO_MIXED = 5
 PAGE2_HCF_LCM_PAIRS = 4
+PAGE2_AREA_FIGURES = 3            # one row of shapes, at most one of each kind
+
+# Value pools the generators draw from
+DIV_DIVISORS = [6, 8, 9, 10, 12, 15, 16, 18, 20, 24]
+FRACTION_DENOMS = [3, 4, 5, 6, 8, 10, 12]
+MIXED_DENOMS = [2, 3, 4, 5, 6, 8, 10, 12]
+HCF_BASES = [2, 3, 4, 5, 6, 7, 8, 9, 10, 12]
+PRIME_POOL = [120, 144, 180, 210, 240, 252, 270, 280, 300, 315, 336, 360, 420, 504]
+# 11-smooth numbers 100..600 with at least four prime factors; used instead of
+# PRIME_POOL when a student's history is consulted, so there is room to avoid repeats
+PRIME_POOL_WIDE = [100, 108, 112, 120, 126, 128, 132, 135, 140, 144, 150, 160, 162, 168, 176, 180,
+                   189, 192, 196, 198, 200, 210, 216, 220, 224, 225, 240, 243, 250, 252, 256, 264,
+                   270, 280, 288, 294, 297, 300, 308, 315, 320, 324, 330, 336, 350, 352, 360, 375,
+                   378, 384, 392, 396, 400, 405, 420, 432, 440, 441, 448, 450, 462, 480, 484, 486,
+                   490, 495, 500, 504, 512, 525, 528, 540, 550, 560, 567, 576, 588, 594, 600]
+MAX_RESAMPLES = 8                 # redraws per item before a recent repeat is accepted
+AREA_KINDS = ("rectangle", "l_shape", "triangle", "trapezoid")
+AREA_UNITS = ("cm", "m", "in", "ft")
+
+# Bump whenever a change makes the same seed + profile produce different
+# problems, so old worksheet IDs keep regenerating the test that was printed.
+GENERATOR_VERSION = 1
+
+# -----------------------
+# Difficulty profiles
+# -----------------------
+# A Profile is the difficulty knobs above as one value, so callers can hand the
+# generators per-student settings instead of editing this file.
+Profile = namedtuple("Profile", [
+    "add_terms", "add_min_digits", "add_max_digits",
+    "sub_min_digits", "sub_max_digits",
+    "mult_top_digits", "mult_bottom_digits",
+    "div_problems", "simplify_fractions", "fraction_sums", "prime_facts",
+    "page2_mixed_to_improper", "page2_improper_to_mixed", "page2_hcf_lcm_pairs",
+    "page2_area_figures",
+], defaults=(0,))
+# IDs printed before the area figures carry 14 knobs and parse with none, which
+# is exactly the sheet they were printed from.
+
+def default_profile():
+    # the knobs as currently set in this module
+    return Profile(
+        ADD_TERMS, ADD_MIN_DIGITS, ADD_MAX_DIGITS,
+        SUB_MIN_DIGITS, SUB_MAX_DIGITS,
+        MULT_TOP_DIGITS, MULT_BOTTOM_DIGITS,
+        DIV_PROBLEMS, SIMPLIFY_FRACTIONS, FRACTION_SUMS, PRIME_FACTS,
+        PAGE2_MIXED_TO_IMPROPER, PAGE2_IMPROPER_TO_MIXED, PAGE2_HCF_LCM_PAIRS,
+        PAGE2_AREA_FIGURES,
+    )
 
 # -----------------------
 # RNG
 # -----------------------
+# Every generator takes an optional rng so a batch can give each worksheet its
+# own random.Random(seed); plain calls keep using the module-level one.
 rng = random.Random(SEED)
-def rand_pm():
+def rand_pm(rng=rng):
     return rng.choice(["+", "-"])
 
-def rand_ndigit(n_digits: int) -> int:
+def rand_ndigit(n_digits: int, rng=rng) -> int:
     lo = 10 ** (n_digits - 1)
     hi = (10 ** n_digits) - 1
     return rng.randint(lo, hi)
@@ -50,70 +119,67 @@ def rand_ndigit(n_digits: int) -> int:
 def gcd(a, b):
     return math.gcd(a, b)
 
-def make_addition():
+def make_addition(rng=rng, profile=None):
+    p = profile or default_profile()
     nums = []
-    for _ in range(ADD_TERMS):
-        d = rng.randint(ADD_MIN_DIGITS, ADD_MAX_DIGITS)
-        nums.append(rand_ndigit(d))
+    for _ in range(p.add_terms):
+        d = rng.randint(p.add_min_digits, p.add_max_digits)
+        nums.append(rand_ndigit(d, rng))
     return nums
 
-def make_subtraction():
+def make_subtraction(rng=rng, profile=None):
     # ensure non-negative result and nice borrowing sometimes
-    a = rand_ndigit(rng.randint(SUB_MIN_DIGITS, SUB_MAX_DIGITS))
-    b = rand_ndigit(rng.randint(SUB_MIN_DIGITS, min(SUB_MAX_DIGITS, len(str(a)))))
+    p = profile or default_profile()
+    a = rand_ndigit(rng.randint(p.sub_min_digits, p.sub_max_digits), rng)
+    b = rand_ndigit(rng.randint(p.sub_min_digits, min(p.sub_max_digits, len(str(a)))), rng)
     if b > a:
         a, b = b, a
     return a, b
 
-def make_multiplication():
-    top = rand_ndigit(MULT_TOP_DIGITS)
-    bottom = rand_ndigit(MULT_BOTTOM_DIGITS)
+def make_multiplication(rng=rng, profile=None):
+    p = profile or default_profile()
+    top = rand_ndigit(p.mult_top_digits, rng)
+    bottom = rand_ndigit(p.mult_bottom_digits, rng)
     return top, bottom
 
-def make_division_exact():
+def make_division_exact(rng=rng):
     # pick divisor and quotient, then multiply to get dividend (so it divides evenly)
-    divisor = rng.choice([6, 8, 9, 10, 12, 15, 16, 18, 20, 24])
+    divisor = rng.choice(DIV_DIVISORS)
     quotient = rng.randint(12, 98)
     dividend = divisor * quotient
     return dividend, divisor
 
-def make_simplify_fraction():
+def make_simplify_fraction(rng=rng):
     # produce a reducible fraction, not already simplest
     base = rng.randint(2, 12)
     a = rng.randint(2, 25) * base
     b = rng.randint(2, 25) * base
     return a, b
 
-def make_fraction_sum():
+def make_fraction_sum(rng=rng):
     # keep denominators modest
-    d1 = rng.choice([3, 4, 5, 6, 8, 10, 12])
-    d2 = rng.choice([3, 4, 5, 6, 8, 10, 12])
+    d1 = rng.choice(FRACTION_DENOMS)
+    d2 = rng.choice(FRACTION_DENOMS)
     n1 = rng.randint(1, d1 - 1)
     n2 = rng.randint(1, d2 - 1)
-    return n1, d1, n2, d2
-
-def make_fraction_sum():
-    # keep denominators modest
-    d1 = rng.choice([3, 4, 5, 6, 8, 10, 12])
-    d2 = rng.choice([3, 4, 5, 6, 8, 10, 12])
-    n1 = rng.randint(1, d1 - 1)
-    n2 = rng.randint(1, d2 - 1)
-    op = rand_pm()
+    op = rand_pm(rng)
     return n1, d1, op, n2, d2
 
 
 
 
-def make_prime_factor_targets(k=PRIME_FACTS):
+def make_prime_factor_targets(k=None, rng=rng):
+    if k is None:
+        k = PRIME_FACTS
     # pick numbers with non-trivial factorization but not too huge
-    pool = [120, 144, 180, 210, 240, 252, 270, 280, 300, 315, 336, 360, 420, 504]
+    pool = list(PRIME_POOL)
     rng.shuffle(pool)
     return pool[:k]
 
 
 # Add these helpers (do NOT remove anything else)
-def make_mixed_number():
-    d = rng.choice([2, 3, 4, 5, 6, 8, 10, 12])
+def make_mixed_number(rng=rng):
+    d = rng.choice(MIXED_DENOMS)
     whole = rng.randint(1, 9)
     num = rng.randint(1, d - 1)
     return whole, num, d
@@ -121,9 +187,9 @@ def make_mixed_number():
 def mixed_to_improper(whole, num, den):
     return whole * den + num, den
 
-def make_improper_fraction():
+def make_improper_fraction(rng=rng):
     # make an improper fraction (not whole)
-    den = rng.choice([2, 3, 4, 5, 6, 8, 10, 12])
+    den = rng.choice(MIXED_DENOMS)
     whole = rng.randint(1, 9)
     num = rng.randint(1, den - 1)
     n, d = mixed_to_improper(whole, num, den)
@@ -132,9 +198,9 @@ def make_improper_fraction():
 def lcm(a, b):
     return abs(a*b) // math.gcd(a, b)
 
-def make_hcf_lcm_pair():
+def make_hcf_lcm_pair(rng=rng):
     # Keep values <= 3 digits, with shared factors (so not always trivial)
-    base = rng.choice([2, 3, 4, 5, 6, 7, 8, 9, 10, 12])
+    base = rng.choice(HCF_BASES)
     a = base * rng.randint(2, 20)
     b = base * rng.randint(2, 20)
     a = min(a, 999)
@@ -143,32 +209,208 @@ def make_hcf_lcm_pair():
     if b < 10: b += base
     return a, b
 
+def make_area_figure(kind, rng=rng):
+    # (kind, unit, dims...) with whole-number areas:
+    #   rectangle (w, h), l_shape (w, h, cut_w, cut_h) with the top-right
+    #   corner cut away, triangle (base, height), trapezoid (top, bottom, height)
+    unit = rng.choice(AREA_UNITS)
+    if kind == "rectangle":
+        w = rng.randint(4, 20)
+        return kind, unit, w, rng.choice([h for h in range(3, 16) if h != w])
+    if kind == "l_shape":
+        w, h = rng.randint(8, 20), rng.randint(6, 16)
+        return kind, unit, w, h, rng.randint(2, w - 3), rng.randint(2, h - 3)
+    if kind == "triangle":
+        return kind, unit, 2 * rng.randint(2, 10), rng.randint(3, 15)
+    if kind == "trapezoid":
+        top = rng.randint(3, 12)
+        bottom = top + 2 * rng.randint(1, 5)
+        return kind, unit, top, bottom, rng.randint(3, 12)
+    raise ValueError(f"unknown figure kind: {kind!r}")
+
 
 
 
 # -----------------------
-# Generate randomized problems
+# Problem sets
 # -----------------------
-add_nums = make_addition()
-sub_a, sub_b = make_subtraction()
+class ProblemSet:
+    # All the numbers on one worksheet, kept as small tuples of ints so sets are
+    # cheap to hold in bulk and to pickle between processes. Drawing reads
+    # these fields and nothing else.
+    __slots__ = (
+        "add_nums",        # (n, ...)                    add_terms terms
+        "sub",             # (a, b)
+        "mults",           # ((top, bottom), (top, bottom))
+        "divs",            # ((dividend, divisor), ...)
+        "simp_fracs",      # ((a, b), ...)
+        "frac_sums",       # ((n1, d1, op, n2, d2), ...)
+        "prime_targets",   # (n, ...)
+        "mixed",           # (dec1, op1, dec2, op2, frac_num, frac_den)
+        "mixed_numbers",   # ((whole, num, den), ...)    page 2
+        "improper_fracs",  # ((num, den), ...)           page 2
+        "pairs",           # ((a, b), ...)               page 2
+        "areas",           # ((kind, unit, dim, ...), ...)  page 2, see make_area_figure
+    )
+
+    def __init__(self, add_nums, sub, mults, divs, simp_fracs, frac_sums,
+                 prime_targets, mixed, mixed_numbers, improper_fracs, pairs, areas=()):
+        self.add_nums = tuple(add_nums)
+        self.sub = tuple(sub)
+        self.mults = tuple(mults)
+        self.divs = tuple(divs)
+        self.simp_fracs = tuple(simp_fracs)
+        self.frac_sums = tuple(frac_sums)
+        self.prime_targets = tuple(prime_targets)
+        self.mixed = tuple(mixed)
+        self.mixed_numbers = tuple(mixed_numbers)
+        self.improper_fracs = tuple(improper_fracs)
+        self.pairs = tuple(pairs)
+        self.areas = tuple(areas)
+
+    def fields(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __reduce__(self):
+        # positional tuple instead of a per-instance state dict
+        return (ProblemSet, self.fields())
+
+    def __eq__(self, other):
+        return isinstance(other, ProblemSet) and self.fields() == other.fields()
+
+    def __hash__(self):
+        return hash(self.fields())
+
+    def __repr__(self):
+        return "ProblemSet(" + ", ".join(f"{n}={getattr(self, n)!r}" for n in self.__slots__) + ")"
 
-m1_top, m1_bottom = make_multiplication()
-m2_top, m2_bottom = make_multiplication()
-
-divs = [make_division_exact() for _ in range(DIV_PROBLEMS)]
-simp_fracs = [make_simplify_fraction() for _ in range(SIMPLIFY_FRACTIONS)]
-frac_sums = [make_fraction_sum() for _ in range(FRACTION_SUMS)]
-
-prime_targets = make_prime_factor_targets(PRIME_FACTS)
+# -----------------------
+# Generate randomized problems
+# -----------------------
+def make_mixed_expression(rng=rng):
+    # Mixed decimal & fraction example (randomized but still friendly)
+    # keep it simple: 1 decimal + 1 small decimal + 1/2 or 1/4 or 3/4
+    dec1 = rng.choice([0.1, 0.2, 0.3, 0.4, 0.5])
+    dec2 = rng.choice([0.001, 0.002, 0.005, 0.01, 0.02])
+    frac_choice = rng.choice([(1, 2), (1, 4), (3, 4)])
+    op1 = rand_pm(rng)
+    op2 = rand_pm(rng)
+    return (dec1, op1, dec2, op2) + frac_choice
+
+def fresh(draw, kind, seen):
+    # draw(), redrawn while `seen` (a problemhistory.HistoryView) says the
+    # student had the item recently; seen=None is the plain single draw
+    item = draw()
+    if seen is not None:
+        for _ in range(MAX_RESAMPLES):
+            if not seen.seen(kind, item):
+                break
+            item = draw()
+        seen.add(kind, item)
+    return item
+
+def make_problem_set(rng=rng, profile=None, seen=None):
+    # Draw order matches the page order, so a given seed always yields the same
+    # test. With seen, recently issued items are redrawn (see fresh()), so the
+    # result also depends on the student's history before the print date.
+    p = profile or default_profile()
+    add_nums = fresh(lambda: make_addition(rng, p), "add", seen)
+    sub = fresh(lambda: make_subtraction(rng, p), "sub", seen)
+
+    mults = tuple(fresh(lambda: make_multiplication(rng, p), "mult", seen) for _ in range(2))
+
+    divs = [fresh(lambda: make_division_exact(rng), "div", seen) for _ in range(p.div_problems)]
+    simp_fracs = [fresh(lambda: make_simplify_fraction(rng), "simp", seen) for _ in range(p.simplify_fractions)]
+    frac_sums = [fresh(lambda: make_fraction_sum(rng), "frac", seen) for _ in range(p.fraction_sums)]
+
+    if seen is None:
+        prime_targets = make_prime_factor_targets(p.prime_facts, rng)
+    else:
+        prime_targets = [fresh(lambda: rng.choice(PRIME_POOL_WIDE), "prime", seen) for _ in range(p.prime_facts)]
+
+    mixed = fresh(lambda: make_mixed_expression(rng), "mixed", seen)
+
+    # Page 2
+    mixed_numbers = [fresh(lambda: make_mixed_number(rng), "mixnum", seen) for _ in range(p.page2_mixed_to_improper)]
+    improper_fracs = [fresh(lambda: make_improper_fraction(rng), "improper", seen)
+                      for _ in range(p.page2_improper_to_mixed)]
+    pairs = [fresh(lambda: make_hcf_lcm_pair(rng), "pair", seen) for _ in range(p.page2_hcf_lcm_pairs)]
+    # drawn last, so profiles without figures keep every earlier draw
+    kinds = rng.sample(AREA_KINDS, min(p.page2_area_figures, len(AREA_KINDS))) if p.page2_area_figures else ()
+    areas = [fresh(lambda: make_area_figure(kind, rng), "area", seen) for kind in kinds]
+
+    return ProblemSet(add_nums, sub, mults, divs, simp_fracs, frac_sums,
+                      prime_targets, mixed, mixed_numbers, improper_fracs, pairs, areas)
+
+def make_problem_sets(seeds, profile=None):
+    # in-memory generation only; nothing here touches reportlab
+    profile = profile or default_profile()
+    return [make_problem_set(random.Random(seed), profile) for seed in seeds]
 
-# Mixed decimal & fraction example (randomized but still friendly)
-# keep it simple: 1 decimal + 1 small decimal + 1/2 or 1/4 or 3/4
-dec1 = rng.choice([0.1, 0.2, 0.3, 0.4, 0.5])
-dec2 = rng.choice([0.001, 0.002, 0.005, 0.01, 0.02])
-frac_choice = rng.choice([(1, 2), (1, 4), (3, 4)])
-op1 = rand_pm()
-op2 = rand_pm()
-mixed_expr = f"{dec1:g}  {op1}  {dec2:g}  {op2}  {frac_choice[0]}/{frac_choice[1]}"
+# -----------------------
+# Worksheet IDs
+# -----------------------
+# A worksheet ID holds everything needed to rebuild a test: generator version,
+# difficulty profile, seed and print date, e.g. "M1-4453442223554-7YA2P1-2F9K".
+# Each profile knob is one base-36 digit; the last character is a check digit
+# that catches most typos when an ID is typed in from paper. A trailing "H" on
+# the version ("M1H-...") marks a sheet drawn against a student's problem
+# history, which has to be supplied again to rebuild it.
+_B36 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+_EPOCH = date(2000, 1, 1)
+
+def _to_b36(n):
+    out = ""
+    while True:
+        n, r = divmod(n, 36)
+        out = _B36[r] + out
+        if n == 0:
+            return out
+
+def _check_digit(body):
+    total = sum((i + 1) * _B36.index(ch) for i, ch in enumerate(body.replace("-", "")))
+    return _B36[total % 36]
+
+def _day_of(today_str):
+    return datetime.strptime(today_str, "%B %d, %Y").date()
+
+def worksheet_id(seed, profile=None, today_str=today_str, history=False):
+    profile = profile or default_profile()
+    if any(not 0 <= v < 36 for v in profile):
+        raise ValueError(f"profile values must be 0..35 to fit an ID: {profile}")
+    days = (_day_of(today_str) - _EPOCH).days
+    version = f"M{GENERATOR_VERSION}" + ("H" if history else "")
+    body = f"{version}-{''.join(_B36[v] for v in profile)}-{_to_b36(seed)}-{_to_b36(days)}"
+    return body + _check_digit(body)
+
+def parse_worksheet_id(ws_id):
+    # -> (seed, profile, today_str)
+    ws_id = ws_id.strip().upper()
+    body, check = ws_id[:-1], ws_id[-1:]
+    try:
+        version, prof, seed, days = body.split("-")
+        if _check_digit(body) != check:
+            raise ValueError("check digit mismatch")
+        profile = Profile(*(_B36.index(ch) for ch in prof))
+        seed = int(seed, 36)
+        day = date.fromordinal(_EPOCH.toordinal() + int(days, 36))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"not a valid worksheet ID: {ws_id!r} ({e})") from None
+    if version.rstrip("H") != f"M{GENERATOR_VERSION}":
+        raise ValueError(f"worksheet ID {ws_id!r} is from generator {version}, this is M{GENERATOR_VERSION}")
+    return seed, profile, day.strftime("%B %d, %Y")
+
+def uses_history(ws_id):
+    return ws_id.strip().upper().split("-", 1)[0].endswith("H")
+
+def regenerate(ws_id, seen=None):
+    # the exact ProblemSet printed under this ID; history sheets need a fresh
+    # view of the same student's history for the printed date
+    seed, profile, _ = parse_worksheet_id(ws_id)
+    if uses_history(ws_id) and seen is None:
+        raise ValueError(f"worksheet {ws_id} was drawn against a student's problem history; "
+                         "it needs a view of that history (seen=, or --student)")
+    return make_problem_set(random.Random(seed), profile, seen if uses_history(ws_id) else None)
 
 # -----------------------
 # PDF setup
@@ -176,32 +418,193 @@ mixed_expr = f"{dec1:g}  {op1}  {dec2:g}  {op2}  {frac_choice[0]}/{frac_choice[1
 W, H = letter
 margin = 0.6 * inch
 
-c = canvas.Canvas(pdf_path, pagesize=letter)
-c.setTitle("Math Test")
-
-today_str = date.today().strftime("%B %d, %Y")
-
-# Header
-c.setFont("Helvetica-Bold", 18)
-c.drawString(margin, H - margin, f"Math Test — {today_str}")
-c.setFont("Helvetica", 11)
-c.drawString(margin, H - margin - 20, "Name: ________________________________")
-c.drawString(W - margin - 160, H - margin - 20, "Score: ______ / ______")
-c.setStrokeColor(colors.black)
-c.setLineWidth(1)
-
-y = H - margin - 55
-
-def draw_section(title, y):
+@functools.lru_cache(maxsize=None)
+def text_width(text, font, size):
+    # font metrics lookups are shared by every document in a batch
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    return stringWidth(text, font, size)
+
+def draw_header(c, title):
+    c.setFont("Helvetica-Bold", 18)
+    c.drawString(margin, H - margin, title)
+    c.setFont("Helvetica", 11)
+    c.drawString(margin, H - margin - 20, "Name: ________________________________")
+    c.drawString(W - margin - 160, H - margin - 20, "Score: ______ / ______")
+    from reportlab.lib.colors import black
+    c.setStrokeColor(black)
+    c.setLineWidth(1)
+
+def draw_footer(c):
+    c.setFont("Helvetica-Oblique", 9)
+    c.drawString(margin, 0.30 * inch, "Tip: Work neatly and double-check your answers.")
+
+@functools.lru_cache(maxsize=8)
+def page_templates(today_str):
+    # headers and footer are the same on every worksheet of a batch
+    t = PageTemplates("math")
+    t.add("header1", lambda c: draw_header(c, f"Math Test — {today_str}"))
+    t.add("header2", lambda c: draw_header(c, f"Math Test — {today_str}  (Page 2)"))
+    t.add("answer_header", lambda c: draw_answer_header(c, today_str))
+    t.add("footer", draw_footer)
+    return t
+
+# Section titles are drawn at y=0 inside their form and placed by translation
+SECTION_TEMPLATES = PageTemplates("sec")
+SECTION_BBOX = (0, -10, W, 20)
+
+def _draw_section_rule(c, title, y):
     c.setFont("Helvetica-Bold", 12)
     c.drawString(margin, y, title)
     c.setLineWidth(0.8)
     c.line(margin, y - 3, W - margin, y - 3)
+
+def draw_section(c, title, y, boxes=None):
+    if title not in SECTION_TEMPLATES:
+        SECTION_TEMPLATES.add(title, lambda c: _draw_section_rule(c, title, 0), SECTION_BBOX)
+    SECTION_TEMPLATES.place(c, title, 0, y)
+    if boxes is not None:
+        boxes.rule(y - 3)
     return y - 20
 
+# -----------------------
+# Answer boxes
+# -----------------------
+# Where the answers go, recorded while a worksheet is drawn so a scan of the
+# filled sheet can be cropped field by field (scangrade.py). Coordinates are
+# PDF points, origin at the lower left of the page.
+class AnswerBoxes:
+    __slots__ = ("page", "fields", "rules")
+
+    def __init__(self):
+        self.page = 1
+        self.fields = []               # (page, label, x0, y0, x1, y1); a label's fields in writing order
+        self.rules = []                # (page, y) of the full-width section rules, for registration
+
+    def add(self, label, x0, y0, x1, y1):
+        self.fields.append((self.page, label, x0, y0, x1, y1))
+
+    def rule(self, y):
+        self.rules.append((self.page, y))
+
+    def blanks(self, label, x, y, text, font, size):
+        # one field per run of underscores in a line drawn at (x, y)
+        start = text.find("_")
+        while start >= 0:
+            end = start
+            while end < len(text) and text[end] == "_":
+                end += 1
+            x0 = x + text_width(text[:start], font, size)
+            self.add(label, x0, y - 3, x0 + text_width(text[start:end], font, size), y + size + 2)
+            start = text.find("_", end)
+
+    def to_json(self):
+        return {"fields": [list(f) for f in self.fields], "rules": [list(r) for r in self.rules]}
+
+class _NullCanvas:
+    # swallows every drawing call (text objects included), for answer_boxes()
+    def __getattr__(self, name):
+        return self._ignore
+
+    def _ignore(self, *args, **kwargs):
+        return self
+
+def answer_boxes(ps, today_str=today_str, ws_id=None):
+    # the answer fields of a worksheet without rendering it
+    boxes = AnswerBoxes()
+    draw_test(_NullCanvas(), ps, today_str, ws_id=ws_id, boxes=boxes)
+    return boxes
+
+# -----------------------
+# Area figures
+# -----------------------
+# Every figure of a kind has the same outline (the sheets say "not drawn to
+# scale"); only the dimension labels change. The outline is one path built on
+# first use and restamped from FIGURE_TEMPLATES, so on a forms canvas (a class
+# PDF) each kind is a single Form XObject and every figure costs a "Do" plus
+# its labels.
+FIG_W, FIG_H = 96, 60             # outline box, points; origin at its lower left
+FIGURE_CELL_W = (W - 2 * margin) / 4
+FIGURE_ROW_H = 118                # prompt baseline to the bottom of the answer line
+FIGURE_ROW_DEPTH = 123            # ... and to the bottom of its answer fields
+
+# kind -> (outline points, height line (x, y_top) or None)
+FIGURE_SHAPES = {
+    "rectangle": ([(0, 0), (FIG_W, 0), (FIG_W, FIG_H), (0, FIG_H)], None),
+    "l_shape": ([(0, 0), (FIG_W, 0), (FIG_W, 28), (52, 28), (52, FIG_H), (0, FIG_H)], None),
+    "triangle": ([(0, 0), (FIG_W, 0), (30, FIG_H)], (30, FIG_H)),
+    "trapezoid": ([(0, 0), (FIG_W, 0), (74, FIG_H), (20, FIG_H)], (20, FIG_H)),
+}
+# kind -> label anchors (x, y, align) in the order of the figure's dims
+FIGURE_LABELS = {
+    "rectangle": [(FIG_W / 2, -11, "c"), (-4, FIG_H / 2 - 3, "r")],
+    "l_shape": [(FIG_W / 2, -11, "c"), (-4, FIG_H / 2 - 3, "r"), (26, FIG_H + 4, "c"), (FIG_W + 4, 11, "l")],
+    "triangle": [(FIG_W / 2, -11, "c"), (34, 24, "l")],
+    "trapezoid": [(47, FIG_H + 4, "c"), (FIG_W / 2, -11, "c"), (24, 24, "l")],
+}
+FIGURE_TEMPLATES = PageTemplates("fig")
+FIGURE_BBOX = (-2, -2, FIG_W + 2, FIG_H + 2)
+
+@functools.lru_cache(maxsize=None)
+def figure_path(kind):
+    # built once per process and shared by every canvas
+    from reportlab.pdfgen.pathobject import PDFPathObject
+    points, _ = FIGURE_SHAPES[kind]
+    p = PDFPathObject()
+    p.moveTo(*points[0])
+    for pt in points[1:]:
+        p.lineTo(*pt)
+    p.close()
+    return p
+
+def _draw_figure_outline(c, kind):
+    c.setLineWidth(1.2)
+    c.drawPath(figure_path(kind), stroke=1, fill=0)
+    height = FIGURE_SHAPES[kind][1]
+    if height:
+        # dashed height with a right-angle mark at its foot
+        x, top = height
+        c.setLineWidth(0.6)
+        c.setDash(3, 2)
+        c.line(x, 0, x, top)
+        c.setDash()
+        c.rect(x, 0, 5, 5, stroke=1, fill=0)
+
+def draw_area_figures(c, y, areas, boxes=None, label="p2-4"):
+    # one row of figures below the prompt at baseline y; returns the next y.
+    # The outlines are stamped first, then every label goes into one text
+    # object rather than a drawString (and its own text object) per label.
+    c.setFont("Helvetica", 9)
+    c.drawRightString(W - margin, y, "Figures are not drawn to scale.")
+    box_y = y - 16 - 12 - FIG_H
+    t = c.beginText()
+    t.setFont("Helvetica", 9)
+    for i, (kind, unit, *dims) in enumerate(areas):
+        x = margin + 24 + i * FIGURE_CELL_W
+        if kind not in FIGURE_TEMPLATES:
+            FIGURE_TEMPLATES.add(kind, functools.partial(_draw_figure_outline, kind=kind), FIGURE_BBOX)
+        FIGURE_TEMPLATES.place(c, kind, x, box_y)
+        if kind == "l_shape":
+            # label the sides that remain: top w - cut_w, right h - cut_h
+            w, h, cut_w, cut_h = dims
+            dims = (w, h, w - cut_w, h - cut_h)
+        for (lx, ly, align), d in zip(FIGURE_LABELS[kind], dims):
+            text = f"{d} {unit}"
+            shift = {"c": text_width(text, "Helvetica", 9) / 2, "r": text_width(text, "Helvetica", 9)}.get(align, 0)
+            t.setTextOrigin(x + lx - shift, box_y + ly)
+            t.textOut(text)
+    t.setFont("Helvetica", 11)
+    for i in range(len(areas)):
+        line = f"{row_letter(i)})  Area = ________"
+        t.setTextOrigin(margin + 8 + i * FIGURE_CELL_W, box_y - 32)
+        t.textOut(line)
+        if boxes is not None:
+            boxes.blanks(label + row_letter(i), margin + 8 + i * FIGURE_CELL_W, box_y - 32, line, "Helvetica", 11)
+    c.drawText(t)
+    return y - FIGURE_ROW_H
+
 def draw_vertical_arithmetic(
-    x, y_top, numbers, op=None, result_blanks=True,
-    cell_h=18, mono_font="Courier", font_size=16
+    c, x, y_top, numbers, op=None, result_blanks=True,
+    cell_h=18, mono_font="Courier", font_size=16, boxes=None, label=None
 ):
     max_len = max(max(len(str(n)) for n in numbers), ARITH_COL_CHARS)
 
@@ -215,20 +618,23 @@ def draw_vertical_arithmetic(
         c.drawString(x, y, s)
         y -= cell_h
 
-    underline_w = c.stringWidth("0" * max_len, mono_font, font_size)
+    underline_w = text_width("0" * max_len, mono_font, font_size)
     c.setLineWidth(1.2)
     c.line(x - 2, y + 8, x + underline_w + 2, y + 8)
 
     y -= 10
     if result_blanks:
         #c.drawString(x, y, "_" * max_len)
+        if boxes is not None:
+            # the result is written under the rule, in the digit columns
+            boxes.add(label, x - 2, y - 6, x + underline_w + 2, y + 15)
         y -= cell_h
 
     return y
 
 def draw_long_multiplication_template(
-    x, y_top, top, bottom,
-    bottom_prefix="x", mono_font="Courier", font_size=16, cell_h=18
+    c, x, y_top, top, bottom,
+    bottom_prefix="x", mono_font="Courier", font_size=16, cell_h=18, boxes=None, label=None
 ):
     max_len = max(len(str(top)), len(str(bottom)), ARITH_COL_CHARS)
 
@@ -238,7 +644,7 @@ def draw_long_multiplication_template(
     c.drawString(x - 18, y_top - cell_h, bottom_prefix)
     c.drawString(x, y_top - cell_h, str(bottom).rjust(max_len))
 
-    underline_w = c.stringWidth("0" * max_len, mono_font, font_size)
+    underline_w = text_width("0" * max_len, mono_font, font_size)
     c.setLineWidth(1.2)
     c.line(x - 2, y_top - cell_h - 6, x + underline_w + 2, y_top - cell_h - 6)
 
@@ -254,180 +660,657 @@ def draw_long_multiplication_template(
     c.line(x - 2, y + 10, x + underline_w + 2, y + 10)
     y -= 10
     #c.drawString(x, y, "_" * (max_len + 2))
+    if boxes is not None:
+        # the product goes under the final rule; allow one digit to its left
+        boxes.add(label, x - 2 - underline_w / ARITH_COL_CHARS, y - 6, x + underline_w + 2, y + 15)
 
     return y - cell_h
 
 # -------------------------
-# A) Addition & Subtraction
+# Worksheet layout
 # -------------------------
-y = draw_section("A) Addition & Subtraction", y)
-c.setFont("Helvetica", 11)
-c.drawString(margin, y, "1) Add:")
-y -= 14
-
-y_after = draw_vertical_arithmetic(
-    margin + 55, y,
-    add_nums,
-    op="+",
-    result_blanks=True
+# The worksheet is declared once, as data: pages of sections, each a run of
+# parts. worksheet_layout() turns the spec plus the number of items in every
+# part into draw ops per printed page -- question numbers, answer labels,
+# column packing and page breaks are all settled there -- and caches them per
+# shape, so a batch works the layout out once per profile and each seed only
+# formats its numbers into fixed positions (draw_layout_page).
+#
+# Part kinds (y runs down from the part's first baseline):
+#   "columns"     its parts side by side, one per half page, tops or bottoms aligned
+#   "arith"       prompt, then the vertical sum or difference of `field` at x
+#   "longmult"    prompt, then the long multiplication field[index] at x
+#   "numbered"    one numbered line per item of `field`
+#   "lettered"    a numbered prompt, then one lettered line per item
+#   "expression"  a numbered prompt, then one line for the value of `field`
+#   "figures"     a numbered prompt with the area figures of `field` below it
+# In text and prompt, {n} is the question number and {l} the row letter, both
+# fixed by the layout; {0}, {1}, ... are the item's numbers, filled in on
+# every draw.
+Page = namedtuple("Page", ["sections", "labels", "footer"], defaults=("", False))
+Section = namedtuple("Section", ["title", "parts", "after"], defaults=(0,))
+Part = namedtuple("Part", [
+    "kind", "field", "text", "prompt",
+    "x", "gap",                    # offset of the drawing from the column, and below the prompt
+    "before", "after",             # extra space around the part
+    "op", "index", "count",        # sign; item of `field`; fixed item count (else its length)
+    "parts", "align",              # columns only
+], defaults=(None, None, None, 0, 0, 0, 0, None, 0, None, (), "top"))
+
+WORKSHEET_SPEC = (
+    Page((
+        Section("A) Addition & Subtraction", (
+            Part("columns", align="bottom", parts=(
+                Part("arith", "add_nums", prompt="{n}) Add:", x=55, gap=14, op="+"),
+                Part("arith", "sub", prompt="{n}) Subtract:", x=75, gap=16, after=10, op="-", count=2),
+            )),
+        ), after=20),
+        Section("B) Long Multiplication", (
+            Part("columns", parts=(
+                Part("longmult", "mults", prompt="{n}) Multiply:", x=70, gap=20, index=0),
+                Part("longmult", "mults", prompt="{n}) Multiply:", x=70, gap=20, index=1),
+            )),
+        ), after=40),
+        Section("C) Division & Fractions", (
+            Part("numbered", "divs", "{n}) {0} ÷ {1} = __________"),
+            Part("numbered", "simp_fracs", "{n}) {0}/{1} (simplify) = __________"),
+            Part("lettered", "frac_sums", "{l})  {0}/{1}  {2}  {3}/{4}  =  ____________________________",
+                 "{n}) Add the fractions (show your work):", before=4),
+            Part("expression", "mixed", "{0:g}  {1}  {2:g}  {3}  {4}/{5}  =  ____________________________",
+                 "{n}) Mixed decimal & fraction:", before=2, count=1),
+        ), after=17),
+        Section("D) Prime Factorization", (
+            Part("lettered", "prime_targets", "{l}) {0} = __________________________________________",
+                 "{n}) Write each number as a product of prime factors:"),
+        )),
+    ), footer=True),
+    Page((
+        Section("A) Mixed Fractions and Improper Fractions", (
+            Part("lettered", "mixed_numbers", "{l})  {0} {1}/{2}  =  __________ / __________",
+                 "{n}) Convert mixed numbers to improper fractions:"),
+            Part("lettered", "improper_fracs", "{l})  {0}/{1}  =  ______  ______/______",
+                 "{n}) Convert improper fractions to mixed numbers:", before=6),
+        ), after=10),
+        Section("B) HCF (GCD) and LCM", (
+            Part("lettered", "pairs", "{l})  {0} and {1}    HCF: __________    LCM: __________",
+                 "{n}) For each pair, find BOTH HCF and LCM:"),
+        ), after=10),
+        Section("C) Area", (
+            Part("figures", "areas", prompt="{n}) Find the area of each shape (show your work):"),
+        )),
+    ), labels="p2-"),      # answer labels on page 2 carry this prefix (see mathanswers.py)
 )
-y = y_after + 30
-
-c.setFont("Helvetica", 11)
-c.drawString(W/2, y + 60, "2) Subtract:")
-draw_vertical_arithmetic(
-    W/2 + 75, y + 44,
-    [sub_a, sub_b],
-    op="-",
-    result_blanks=True
-)
-y -= 50
-
-# -------------------------
-# B) Long Multiplication
-# -------------------------
-y = draw_section("B) Long Multiplication", y)
-c.setFont("Helvetica", 11)
-c.drawString(margin, y, "3) Multiply:")
-c.drawString(W/2, y, "4) Multiply:")
-y -= 16
 
-draw_long_multiplication_template(margin + 70, y - 4, m1_top, m1_bottom)
-draw_long_multiplication_template(W/2 + 70, y - 4, m2_top, m2_bottom)
-y -= 150
+# ProblemSet fields whose length changes the layout, and the Profile knob that sets it
+COUNTED = {
+    "add_nums": "add_terms",
+    "divs": "div_problems",
+    "simp_fracs": "simplify_fractions",
+    "frac_sums": "fraction_sums",
+    "prime_targets": "prime_facts",
+    "mixed_numbers": "page2_mixed_to_improper",
+    "improper_fracs": "page2_improper_to_mixed",
+    "pairs": "page2_hcf_lcm_pairs",
+    "areas": "page2_area_figures",
+}
+
+LAYOUT_TOP = H - margin - 55      # first baseline under the header
+LAYOUT_BOTTOM = margin            # nothing is laid out below this line
+COLUMN_W = W / 2 - margin         # column i starts at margin + i * COLUMN_W
+SECTION_STEP = 20                 # section title to its first line
+PROMPT_STEP = 16                  # prompt or numbered line to the next line
+ROW_STEP = 18                     # between lettered lines
+ROW_INDENT = 15
+FIELD_DEPTH = 3                   # answer fields reach this far below a baseline (AnswerBoxes.blanks)
+# draw_vertical_arithmetic / draw_long_multiplication_template, from the top
+# line: bottom of the answer field, and the y they return
+ARITH_DEPTH, ARITH_END = 16, 28   # plus cell_h per number
+LONGMULT_DEPTH, LONGMULT_END = 94, 106
+
+Layout = namedtuple("Layout", ["pages", "sheets", "questions"])
+# pages: draw ops per printed page, in absolute coordinates:
+#   ("template", name) | ("string", x, y, font, size, text) | ("section", x, y, title)
+#   ("row", x, y, font, size, text, field, index, label)
+#   ("arith", x, y, field, op, label) | ("longmult", x, y, field, index, label)
+#   ("figures", x, y, field, label)
+# sheets: the spec page each printed page belongs to
+# questions: (label, field, index) of every answer in print order, index None
+#   where the whole field is one answer; mathanswers solves these, so the key
+#   and the answer boxes always carry the labels printed on the sheet
+
+def row_letter(i):
+    # letter of the i-th lettered line: a .. z, then aa, ab, ...
+    i, s = i + 1, ""
+    while i:
+        i, r = divmod(i - 1, 26)
+        s = chr(ord('a') + r) + s
+    return s
+
+def _shift(ops, dy):
+    return [op[:2] + (op[2] + dy,) + op[3:] for op in ops]
+
+def _join(a, b):
+    # block b directly after block a, as one block that is never split
+    ops, depth, advance = a
+    return ops + _shift(b[0], -advance), max(depth, advance + b[1]), advance + b[2]
+
+def _blocks(part, n, counts, labels, asked, x=margin):
+    # part laid out at y=0 as (ops, depth, advance) blocks, each kept on one
+    # page: depth is how far its ink and answer fields reach below y=0, advance
+    # where the next block starts. Appends its questions to `asked`; returns
+    # the blocks and the next number.
+    kind = part.kind
+    count = part.count if part.count is not None else counts.get(part.field, 0)
+    prompt = [("string", x, 0, "Helvetica", 11, part.prompt.replace("{n}", str(n)))] if part.prompt else []
+    label = labels + str(n)
+    if kind == "columns":
+        cols = []
+        for i, p in enumerate(part.parts):
+            (col,), n = _blocks(p, n, counts, labels, asked, margin + i * COLUMN_W)
+            cols.append(col)
+        advance = max(col[2] for col in cols)
+        ops, depth = [], 0
+        for col_ops, col_depth, col_advance in cols:
+            dy = col_advance - advance if part.align == "bottom" else 0
+            ops += _shift(col_ops, dy)
+            depth = max(depth, col_depth - dy)
+        blocks = [(ops, depth, advance)]
+    elif kind == "arith":
+        ops = prompt + [("arith", x + part.x, -part.gap, part.field, part.op, label)]
+        asked.append((label, part.field, None))
+        rows = part.gap + 18 * count
+        blocks, n = [(ops, rows + ARITH_DEPTH, rows + ARITH_END)], n + 1
+    elif kind == "longmult":
+        ops = prompt + [("longmult", x + part.x, -part.gap, part.field, part.index, label)]
+        asked.append((label, part.field, part.index))
+        blocks, n = [(ops, part.gap + LONGMULT_DEPTH, part.gap + LONGMULT_END)], n + 1
+    elif kind == "numbered":
+        blocks = []
+        for i in range(count):
+            row = ("row", x, 0, "Helvetica", 11, part.text.replace("{n}", str(n)), part.field, i, labels + str(n))
+            asked.append((labels + str(n), part.field, i))
+            blocks.append(([row], FIELD_DEPTH, PROMPT_STEP))
+            n += 1
+    elif kind in ("lettered", "expression"):
+        blocks = [(prompt, FIELD_DEPTH, PROMPT_STEP)]
+        for i in range(count):
+            letter = row_letter(i) if kind == "lettered" else ""
+            row = ("row", x + ROW_INDENT, 0, "Helvetica", 12, part.text.replace("{l}", letter),
+                   part.field, i if letter else None, label + letter)
+            asked.append((label + letter, part.field, i if letter else None))
+            blocks.append(([row], FIELD_DEPTH, ROW_STEP))
+        if count:
+            # the prompt stays with its first line
+            blocks[:2] = [_join(blocks[0], blocks[1])]
+        n += 1
+    elif kind == "figures":
+        ops = prompt + ([("figures", x, 0, part.field, label)] if count else [])
+        asked += [(label + row_letter(i), part.field, i) for i in range(count)]
+        blocks, n = [(ops, FIGURE_ROW_DEPTH if count else FIELD_DEPTH, FIGURE_ROW_H)], n + 1
+    else:
+        raise ValueError(f"unknown part kind: {kind!r}")
+    ops, depth, advance = blocks[-1]
+    blocks[-1] = (ops, depth, advance + part.after)
+    return blocks, n
+
+@functools.lru_cache(maxsize=256)
+def _layout(spec, shape):
+    counts = dict(zip(COUNTED, shape))
+    pages, sheets, asked = [], [], []
+    for sheet, page in enumerate(spec):
+        fresh = True                  # nothing placed on the current printed page yet
+        n = 1                         # question numbers restart on every spec page
+        for section in page.sections:
+            for i, part in enumerate(section.parts):
+                blocks, n = _blocks(part, n, counts, page.labels, asked)
+                if i == 0:
+                    # a title is never left at the bottom of a page
+                    title = [("section", margin, 0, section.title)]
+                    blocks[0] = _join((title, FIELD_DEPTH, SECTION_STEP + part.before), blocks[0])
+                elif not fresh:
+                    y -= part.before
+                for ops, depth, advance in blocks:
+                    if fresh or y - depth < LAYOUT_BOTTOM:
+                        # a new printed page; the header carries the spec page's
+                        # number, the one the labels and answer key use
+                        pages.append([("template", f"header{sheet + 1}" + ("" if fresh else "c"))]
+                                     + ([("template", "footer")] if page.footer else []))
+                        sheets.append(sheet)
+                        y, fresh = LAYOUT_TOP, False
+                    pages[-1] += _shift(ops, y)
+                    y -= advance
+            y -= section.after
+    return Layout(tuple(tuple(ops) for ops in pages), tuple(sheets), tuple(asked))
+
+def worksheet_shape(src):
+    # item counts in COUNTED order, of a ProblemSet or of the sets a Profile makes
+    if isinstance(src, ProblemSet):
+        return tuple(len(getattr(src, field)) for field in COUNTED)
+    counts = {field: getattr(src, knob) for field, knob in COUNTED.items()}
+    counts["areas"] = min(counts["areas"], len(AREA_KINDS))   # one figure per kind (make_problem_set)
+    return tuple(counts.values())
+
+def worksheet_layout(src, spec=WORKSHEET_SPEC):
+    # the Layout of a ProblemSet, or of every set drawn from a Profile; cached
+    # per (spec, item counts)
+    return _layout(spec, worksheet_shape(src))
+
+def page_template(today_str, name):
+    # page_templates() holding `name`; the headers of overflow pages
+    # ("header<n>c", page n continued) are added on first use
+    t = page_templates(today_str)
+    if name not in t:
+        title = f"Math Test — {today_str}  (Page {name[6:].rstrip('c')}" + (", cont.)" if name.endswith("c") else ")")
+        t.add(name, functools.partial(draw_header, title=title))
+    return t
+
+def draw_layout_page(c, ops, ps, today_str, boxes=None):
+    # one printed page of a Layout with the numbers of ps filled in; setFont
+    # is only issued when a line's font differs from the last line's
+    font = None
+    for op in ops:
+        kind = op[0]
+        if kind == "string":
+            _, x, y, name, size, text = op
+        elif kind == "row":
+            _, x, y, name, size, text, field, index, label = op
+            item = getattr(ps, field)
+            if index is not None:
+                item = item[index]
+            text = text.format(*item) if isinstance(item, tuple) else text.format(item)
+            if boxes is not None:
+                boxes.blanks(label, x, y, text, name, size)
+        else:
+            font = None               # the other ops set their own fonts
+            if kind == "template":
+                page_template(today_str, op[1]).place(c, op[1])
+            elif kind == "section":
+                draw_section(c, op[3], op[2], boxes)
+            elif kind == "arith":
+                _, x, y, field, sign, label = op
+                draw_vertical_arithmetic(c, x, y, getattr(ps, field), op=sign, boxes=boxes, label=label)
+            elif kind == "longmult":
+                _, x, y, field, index, label = op
+                draw_long_multiplication_template(c, x, y, *getattr(ps, field)[index], boxes=boxes, label=label)
+            elif kind == "figures":
+                draw_area_figures(c, op[2], getattr(ps, op[3]), boxes, op[4])
+            continue
+        if font != (name, size):
+            c.setFont(name, size)
+            font = (name, size)
+        c.drawString(x, y, text)
 
 # -------------------------
-# C) Division & Fractions
+# Answer key
 # -------------------------
-y = draw_section("C) Division & Fractions", y)
-c.setFont("Helvetica", 11)
-
-qnum = 5
-for dividend, divisor in divs:
-    c.drawString(margin, y, f"{qnum}) {dividend} ÷ {divisor} = __________")
-    y -= 16
-    qnum += 1
-
-for a, b in simp_fracs:
-    c.drawString(margin, y, f"{qnum}) {a}/{b} (simplify) = __________")
-    y -= 16
-    qnum += 1
-
-y -= 4
-c.setFont("Helvetica", 11)
-c.drawString(margin, y, f"{qnum}) Add the fractions (show your work):")
-y -= 16
-qnum += 1
-
-c.setFont("Helvetica", 12)
-labels = ["a", "b", "c", "d"]
-for i, (n1, d1, op, n2, d2) in enumerate(frac_sums):
-    c.drawString(margin + 15, y, f"{labels[i]})  {n1}/{d1}  {op}  {n2}/{d2}  =  ____________________________")
-    y -= 18
-
-y -= 2
-c.setFont("Helvetica", 11)
-c.drawString(margin, y, f"{qnum}) Mixed decimal & fraction:")
-y -= 16
-c.setFont("Helvetica", 12)
-c.drawString(margin + 15, y, f"{mixed_expr}  =  ____________________________")
-y -= 35
-
-# -------------------------
-# D) Prime Factorization
-# -------------------------
-y = draw_section("D) Prime Factorization", y)
-c.setFont("Helvetica", 11)
-c.drawString(margin, y, f"{qnum+1}) Write each number as a product of prime factors:")
-y -= 16
-c.setFont("Helvetica", 12)
-
-for i, n in enumerate(prime_targets):
-    c.drawString(margin + 15, y, f"{labels[i]}) {n} = __________________________________________")
-    y -= 18
-
-# Footer
-c.setFont("Helvetica-Oblique", 9)
-c.drawString(margin, 0.30 * inch, "Tip: Work neatly and double-check your answers.")
-
-
-
-# After you finish your existing Page 1 content but BEFORE:
-# c.showPage(); c.save()
-# insert this entire Page 2 block.
-
-# -------------------------
-# PAGE 2
-# -------------------------
-c.showPage()  # start a new page
-
-# Header for page 2
-c.setFont("Helvetica-Bold", 18)
-c.drawString(margin, H - margin, f"Math Test — {today_str}  (Page 2)")
-c.setFont("Helvetica", 11)
-c.drawString(margin, H - margin - 20, "Name: ________________________________")
-c.drawString(W - margin - 160, H - margin - 20, "Score: ______ / ______")
-c.setStrokeColor(colors.black)
-c.setLineWidth(1)
-
-y = H - margin - 55
-
-def draw_page2_section(title, y):
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(margin, y, title)
-    c.setLineWidth(0.8)
-    c.line(margin, y - 3, W - margin, y - 3)
-    return y - 20
-
-# A2) Mixed <-> Improper
-y = draw_page2_section("A) Mixed Fractions and Improper Fractions", y)
-c.setFont("Helvetica", 11)
-
-# 1) Mixed -> Improper (5)
-c.drawString(margin, y, "1) Convert mixed numbers to improper fractions:")
-y -= 16
-c.setFont("Helvetica", 12)
-for i in range(PAGE2_MIXED_TO_IMPROPER):
-    w, n, d = make_mixed_number()
-    c.drawString(margin + 15, y, f"{chr(ord('a')+i)})  {w} {n}/{d}  =  __________ / __________")
-    y -= 18
-
-y -= 6
-c.setFont("Helvetica", 11)
-
-# 2) Improper -> Mixed (5)
-c.drawString(margin, y, "2) Convert improper fractions to mixed numbers:")
-y -= 16
-c.setFont("Helvetica", 12)
-for i in range(PAGE2_IMPROPER_TO_MIXED):
-    n, d = make_improper_fraction()
-    c.drawString(margin + 15, y, f"{chr(ord('a')+i)})  {n}/{d}  =  ______  ______/______")
-    y -= 18
-
-y -= 10
-
-# B2) HCF/LCM
-y = draw_page2_section("B) HCF (GCD) and LCM", y)
-c.setFont("Helvetica", 11)
-c.drawString(margin, y, "3) For each pair, find BOTH HCF and LCM:")
-y -= 16
-c.setFont("Helvetica", 12)
-
-pairs = [make_hcf_lcm_pair() for _ in range(PAGE2_HCF_LCM_PAIRS)]
-for i, (a, b) in enumerate(pairs):
-    c.drawString(margin + 15, y, f"{chr(ord('a')+i)})  {a} and {b}    HCF: __________    LCM: __________")
-    y -= 18
-
-y -= 10
-
-# C2) Area problems with drawings
-y = draw_page2_section("C) Area", y)
-c.setFont("Helvetica", 11)
-c.drawString(margin, y, "4) Find the area of each shape (show your work):")
-
-
+ANSWER_MODES = ("none", "json", "page", "both")
+
+def draw_answer_header(c, today_str):
+    c.setFont("Helvetica-Bold", 16)
+    c.drawString(margin, H - margin, f"Answer Key — {today_str}")
+
+def draw_answer_key(c, answers, today_str):
+    page_templates(today_str).place(c, "answer_header")
+    y = H - margin - 30
+    page2 = False
+    for label, ans in answers.items():
+        if label.startswith("p2-"):
+            label = label[3:]
+            if not page2:
+                page2 = True
+                y -= 8
+                c.setFont("Helvetica-Bold", 12)
+                c.drawString(margin, y, "Page 2")
+                y -= 16
+        c.setFont("Helvetica", 11)
+        c.drawString(margin, y, f"{label}) {ans}")
+        y -= 14
+
+def answers_path(out_pdf):
+    return os.path.splitext(out_pdf)[0] + ".answers.json"
+
+def render_test(out_pdf, ps, today_str=today_str, invariant=False, answers="none", forms=False,
+                ws_id=None):
+    # invariant=True pins the creation date and document ID so the same seed
+    # always produces the same bytes (with the same code).
+    # answers: "json" writes <name>.answers.json next to the PDF, "page" adds
+    # an answer-key page, "both" does both.
+    # forms=True stores the static layers as Form XObjects (see pagetemplates.py).
+    # ws_id is printed at the bottom right of every page.
+    from reportlab.pdfgen.canvas import Canvas
+    c = instrument.count_draw_calls(Canvas(out_pdf, pagesize=letter, invariant=invariant))
+    if forms:
+        use_forms(c)
+    c.setTitle("Math Test")
+    key = draw_test(c, ps, today_str, answers, ws_id)
+    if answers in ("json", "both") and isinstance(out_pdf, str):
+        with open(answers_path(out_pdf), "w") as f:
+            json.dump(key, f, indent=1, ensure_ascii=False)
+    with span("save"):
+        c.save()
+    if instrument.enabled:
+        instrument.observe("pdf_bytes", os.path.getsize(out_pdf) if isinstance(out_pdf, str) else out_pdf.tell())
+    return key
+
+def draw_worksheet_id(c, ws_id):
+    if ws_id:
+        c.setFont("Helvetica", 8)
+        c.drawRightString(W - margin, 0.30 * inch, f"ID {ws_id}")
+
+def draw_test(c, ps, today_str, answers="none", ws_id=None, boxes=None):
+    # all pages of one worksheet; returns the answer key (or None). An
+    # AnswerBoxes passed as boxes collects the answer fields as they are drawn.
+    for page, ops in enumerate(worksheet_layout(ps).pages, 1):
+        with span(f"draw.page{page}"):
+            if boxes is not None:
+                boxes.page = page
+            draw_layout_page(c, ops, ps, today_str, boxes)
+            draw_worksheet_id(c, ws_id)
+            c.showPage()
+    if answers == "none":
+        return None
+    with span("answers.solve"):
+        key = solve_problem_set(ps)
+    if answers in ("page", "both"):
+        with span("draw.answers"):
+            draw_answer_key(c, key, today_str)
+            draw_worksheet_id(c, ws_id)
+            c.showPage()
+    return key
+
+def render_seed(out_pdf, seed, today_str=today_str, answers="none", profile=None, seen=None, ws_id=None):
+    # one worksheet fully determined by (seed, profile, date[, history view]),
+    # tagged with its ID (ws_id reprints an ID as given, e.g. an older format)
+    profile = profile or default_profile()
+    with span("render_seed", seed=seed):
+        with span("generate"):
+            ps = make_problem_set(random.Random(seed), profile, seen)
+        return render_test(out_pdf, ps, today_str, invariant=True, answers=answers,
+                           ws_id=ws_id or worksheet_id(seed, profile, today_str, history=seen is not None))
+
+def regenerate_pdf(ws_id, out_pdf, answers="none", seen=None):
+    # rebuild a printed PDF from its ID: the same problems, each at the same
+    # position, which is all grading and answer keys rely on. The bytes match
+    # only when the code that printed it is the code rebuilding it (the
+    # declarative layout changed the page streams of older sheets).
+    seed, profile, day_str = parse_worksheet_id(ws_id)
+    if uses_history(ws_id) and seen is None:
+        raise ValueError(f"worksheet {ws_id} was drawn against a student's problem history; "
+                         "it needs a view of that history (seen=, or --student)")
+    return render_seed(out_pdf, seed, day_str, answers, profile, seen if uses_history(ws_id) else None,
+                       ws_id=ws_id.strip().upper())
+
+def regenerate_answers(ws_id, seen=None):
+    # the answer key of a printed worksheet, without rendering (no reportlab)
+    return solve_problem_set(regenerate(ws_id, seen))
 
+# -----------------------
+# Batch generation
+# -----------------------
+def batch_pdf_name(seed, today_str=today_str):
+    return "test-" + today_str.replace(" ", '').replace(',', '-') + f"-s{seed}.pdf"
+
+def _render_seeds(seeds, out_dir, today_str, answers="none", profile=None):
+    paths = []
+    for seed in seeds:
+        out = os.path.join(out_dir, batch_pdf_name(seed, today_str))
+        render_seed(out, seed, today_str, answers, profile)
+        paths.append(out)
+    return paths
+
+def _warm_worker():
+    # pay reportlab's lazy font/encoding setup once per worker, not in the first task
+    from reportlab.pdfbase.pdfmetrics import getFont
+    for font in ("Helvetica", "Helvetica-Bold", "Helvetica-Oblique", "Courier"):
+        getFont(font)
+    render_test(io.BytesIO(), make_problem_set(random.Random(0)), today_str, invariant=True)
+
+def _chunks(seq, size):
+    return [seq[i:i + size] for i in range(0, len(seq), size)]
+
+def pick_seeds(n, seeds=None):
+    if seeds is None:
+        seeds = random.Random(SEED).sample(range(10 ** 9), n)
+    seeds = list(seeds)[:n]
+    if len(set(seeds)) != len(seeds):
+        raise ValueError("seeds must be distinct")
+    return seeds
+
+def generate_batch(n, seeds=None, out_dir=".", today_str=today_str, verbose=False,
+                   workers=1, chunksize=None, answers="none", profile=None):
+    # One process, many worksheets: reportlab, its font metrics and the
+    # text_width cache are loaded once and reused for every document.
+    # With workers > 1 the seeds are sharded over a process pool; every seed
+    # gets its own random.Random and a pinned PDF header, so the files are
+    # byte-identical to a serial run.
+    seeds = pick_seeds(n, seeds)
+    os.makedirs(out_dir, exist_ok=True)
+    if not workers or workers < 1:
+        workers = os.cpu_count() or 1
+
+    t0 = time.perf_counter()
+    if workers == 1 or len(seeds) < 2:
+        paths = _render_seeds(seeds, out_dir, today_str, answers, profile)
+    else:
+        if chunksize is None:
+            # a few chunks per worker keeps the pool busy without flooding it with tiny tasks
+            chunksize = max(1, min(64, len(seeds) // (workers * 4)))
+        chunks = _chunks(seeds, chunksize)
+        paths = []
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), initializer=_warm_worker) as ex:
+            for chunk_paths in ex.map(_render_seeds, chunks,
+                                      [out_dir] * len(chunks), [today_str] * len(chunks),
+                                      [answers] * len(chunks), [profile] * len(chunks)):
+                paths.extend(chunk_paths)
+    dt = time.perf_counter() - t0
+
+    if verbose:
+        rate = len(paths) / dt if dt > 0 else float("inf")
+        print(f"Wrote {len(paths)} PDFs to {out_dir} in {dt:.2f}s ({rate:.1f} docs/s, {workers} worker(s))")
+    return paths
 
+# -----------------------
+# Whole class in one PDF
+# -----------------------
+def render_class(out_pdf, seeds, today_str=today_str, names=None, answers="none", verbose=False,
+                 profile=None):
+    # Every student's pages go into one canvas. Fonts are embedded once and the
+    # static layers become Form XObjects shared by all pages; each student gets
+    # an outline entry pointing at their first page.
+    seeds = list(seeds)
+    names = list(names) if names is not None else [f"Student {i + 1}" for i in range(len(seeds))]
+    profile = profile or default_profile()
+    t0 = time.perf_counter()
+    from reportlab.pdfgen.canvas import Canvas
+    c = use_forms(instrument.count_draw_calls(Canvas(out_pdf, pagesize=letter, invariant=True)))
+    c.setTitle("Math Tests")
+    c.showOutline()
+    keys = {}
+    for name, seed in zip(names, seeds):
+        bookmark = f"s{seed}"
+        c.bookmarkPage(bookmark)
+        c.addOutlineEntry(f"{name} (seed {seed})", bookmark, level=0)
+        ws_id = worksheet_id(seed, profile, today_str)
+        with span("generate"):
+            ps = make_problem_set(random.Random(seed), profile)
+        key = draw_test(c, ps, today_str, answers, ws_id)
+        if key is not None:
+            keys[ws_id] = key
+    with span("save", students=len(seeds)):
+        c.save()
+    if answers in ("json", "both") and isinstance(out_pdf, str):
+        with open(answers_path(out_pdf), "w") as f:
+            json.dump(keys, f, indent=1, ensure_ascii=False)
+    dt = time.perf_counter() - t0
+
+    if verbose:
+        size = os.path.getsize(out_pdf) if isinstance(out_pdf, str) else len(out_pdf.getvalue())
+        rate = len(seeds) / dt if dt > 0 else float("inf")
+        print(f"Wrote: {out_pdf}  ({len(seeds)} students, {size / len(seeds):,.0f} bytes/student, "
+              f"{dt:.2f}s, {rate:.1f} students/s)")
+    return keys
+
+def compare_output_modes(n=500, out_dir="mode_compare", seed=0):
+    # same n seeds written one file per student vs one class PDF
+    seeds = random.Random(seed).sample(range(10 ** 9), n)
+    per_file_dir = os.path.join(out_dir, "per_file")
+    os.makedirs(per_file_dir, exist_ok=True)
+
+    t0 = time.perf_counter()
+    paths = generate_batch(n, seeds=seeds, out_dir=per_file_dir)
+    t_files = time.perf_counter() - t0
+    b_files = sum(os.path.getsize(p) for p in paths)
+
+    class_pdf = os.path.join(out_dir, "class.pdf")
+    t0 = time.perf_counter()
+    render_class(class_pdf, seeds)
+    t_class = time.perf_counter() - t0
+    b_class = os.path.getsize(class_pdf)
+
+    print(f"{'mode':<10} {'seconds':>8} {'students/s':>11} {'bytes':>12} {'bytes/student':>14}")
+    for mode, t, b in (("per-file", t_files, b_files), ("class", t_class, b_class)):
+        print(f"{mode:<10} {t:>8.2f} {n / t:>11.1f} {b:>12,} {b / n:>14,.0f}")
+    return {"per_file": (t_files, b_files), "class": (t_class, b_class)}
 
-c.showPage()
-c.save()
+# -----------------------
+# Streaming output
+# -----------------------
+def stream_batch(n, sink, seeds=None, today_str=today_str, answers="none",
+                 class_size=None, verbose=False, profile=None):
+    # Render into memory one document at a time and hand the bytes straight to
+    # a PdfSink (tar/zip stream, pipe or folder), so peak memory does not grow
+    # with n. reportlab holds a whole document until save(), so class mode is
+    # cut into PDFs of class_size students each to stay bounded.
+    seeds = pick_seeds(n, seeds)
+    t0 = time.perf_counter()
+    step = class_size or 1
+    for i in range(0, len(seeds), step):
+        group = seeds[i:i + step]
+        buf = io.BytesIO()
+        if class_size:
+            name = os.path.splitext(batch_pdf_name(group[0], today_str))[0] + f"-class{i // step + 1:04d}.pdf"
+            key = render_class(buf, group, today_str, answers=answers, profile=profile)
+        else:
+            name = batch_pdf_name(group[0], today_str)
+            key = render_seed(buf, group[0], today_str, answers, profile)
+        with span("sink.add"):
+            sink.add(name, buf.getvalue())
+        if answers in ("json", "both"):
+            sink.add(answers_path(name), json.dumps(key, indent=1, ensure_ascii=False).encode("utf-8"))
+    dt = time.perf_counter() - t0
+
+    if verbose:
+        rate = len(seeds) / dt if dt > 0 else float("inf")
+        print(f"Streamed {len(seeds)} tests ({sink.bytes:,} bytes) in {dt:.2f}s "
+              f"({rate:.1f} docs/s, peak RSS {peak_rss_mb():.1f} MB)", file=sys.stderr)
+    return sink.count
+
+def memory_benchmark(counts=(10, 1000, 10000), fmt="tar", class_size=None):
+    # peak RSS of a fresh process streaming each batch size to /dev/null
+    rows = []
+    for n in counts:
+        cmd = [sys.executable, os.path.abspath(__file__), "--batch", str(n),
+               "--stream", os.devnull, "--stream-format", fmt]
+        if class_size:
+            cmd += ["--class-size", str(class_size)]
+        import subprocess
+        out = subprocess.run(cmd, capture_output=True, text=True, check=True).stderr
+        rss = float(out.rsplit("peak RSS ", 1)[1].split()[0])
+        rows.append((n, rss))
+        print(f"{n:>8} tests  peak RSS {rss:6.1f} MB")
+    return rows
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Generate randomized math test PDFs.")
+    ap.add_argument("--batch", type=int, metavar="N", help="write N seed-tagged tests instead of one")
+    ap.add_argument("--seeds", type=int, nargs="+", help="explicit seeds for --batch")
+    ap.add_argument("--out-dir", default=".", help="output folder for --batch")
+    ap.add_argument("--workers", type=int, default=1, help="processes for --batch (0 = all cores)")
+    ap.add_argument("--chunksize", type=int, help="seeds per worker task (default: auto)")
+    ap.add_argument("--answers", choices=ANSWER_MODES, default="none",
+                    help="answer key as a JSON file next to each PDF, an extra page, or both")
+    ap.add_argument("--class-pdf", metavar="PATH", help="write the whole batch into one PDF with an outline")
+    ap.add_argument("--compare", type=int, metavar="N",
+                    help="time and size N students per-file vs --class-pdf, then exit")
+    ap.add_argument("--stream", metavar="PATH", help="stream the batch into one archive (- for stdout)")
+    ap.add_argument("--stream-format", choices=SINK_FORMATS, default="tar")
+    ap.add_argument("--class-size", type=int, help="with --stream, students per class PDF")
+    ap.add_argument("--mem-bench", action="store_true",
+                    help="peak RSS of --stream at 10/1000/10000 tests, then exit")
+    ap.add_argument("--regenerate", metavar="ID", help="rebuild the test printed with this worksheet ID")
+    ap.add_argument("--out", metavar="PATH", help="output PDF for --regenerate")
+    ap.add_argument("--key-only", action="store_true",
+                    help="with --regenerate, print the answer key as JSON instead of writing the PDF")
+    ap.add_argument("--student", help="avoid problems this student had recently (see problemhistory.py)")
+    ap.add_argument("--store", help="score store whose problem history --student uses (default: scorestore's)")
+    ap.add_argument("--trace", metavar="PATH",
+                    help="record stage timings; *.trace.json for Chrome trace format, else a JSON summary")
+    args = ap.parse_args(argv)
+
+    if args.trace:
+        instrument.enable()
+        atexit.register(instrument.export, args.trace)
+        atexit.register(instrument.print_summary, sys.stderr)
+    else:
+        instrument.from_env()
+
+    if args.regenerate:
+        try:
+            _, _, day_str = parse_worksheet_id(args.regenerate)
+        except ValueError as e:
+            ap.error(str(e))
+        if uses_history(args.regenerate) and not args.student:
+            ap.error(f"{args.regenerate.strip().upper()} was drawn against a student's history; pass --student")
+        out = args.out or f"test-{args.regenerate.strip().upper()}.pdf"
+        seen = None
+        if args.student:
+            from problemhistory import ProblemHistory, history_path
+            seen = ProblemHistory(history_path(args.store)).view(args.student, _day_of(day_str))
+        if args.key_only:
+            json.dump(regenerate_answers(args.regenerate, seen), sys.stdout, indent=1, ensure_ascii=False)
+            print()
+            return
+        t0 = time.perf_counter()
+        regenerate_pdf(args.regenerate, out, answers=args.answers, seen=seen)
+        print(f"Wrote: {out}  ({(time.perf_counter() - t0) * 1000:.1f} ms)")
+        return
+
+    if args.mem_bench:
+        memory_benchmark(fmt=args.stream_format, class_size=args.class_size)
+        return
+
+    if args.compare:
+        compare_output_modes(args.compare, out_dir=os.path.join(args.out_dir, "mode_compare"))
+        return
+
+    if args.batch is None and args.seeds is None:
+        seed = SEED if SEED is not None else random.randrange(10 ** 9)
+        if args.student:
+            from problemhistory import ProblemHistory, format_stats, history_path
+            history = ProblemHistory(history_path(args.store))
+            seen = history.view(args.student, _day_of(today_str))
+            render_seed(pdf_path, seed, today_str, answers=args.answers, seen=seen)
+            history.commit(seen)
+            history.save()
+            print(f"Wrote: {pdf_path}  (ID {worksheet_id(seed, history=True)}; {format_stats(history.stats)})")
+            return
+        render_seed(pdf_path, seed, today_str, answers=args.answers)
+        print(f"Wrote: {pdf_path}  (ID {worksheet_id(seed)})")
+        return
+
+    n = args.batch if args.batch is not None else len(args.seeds)
+    if args.class_pdf:
+        render_class(args.class_pdf, pick_seeds(n, args.seeds), answers=args.answers, verbose=True)
+        return
+    if args.stream:
+        with PdfSink(args.stream, args.stream_format) as sink:
+            stream_batch(n, sink, seeds=args.seeds, answers=args.answers,
+                         class_size=args.class_size, verbose=True)
+        return
+    generate_batch(n, seeds=args.seeds, out_dir=args.out_dir, verbose=True,
+                   workers=args.workers, chunksize=args.chunksize, answers=args.answers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# Static page layers (headers, section rules, footers) shared by every page of
+# a batch, drawn from recipes that are built once and optionally stored as
+# reportlab Form XObjects.
+#
+# A PageTemplates object holds the drawing recipes. On a canvas registered with
+# use_forms(), the first place() turns a recipe into a form and every later
+# place() is a single "Do" operator. Each form costs a few hundred bytes of
+# object overhead, so this only pays off when a layer repeats many times in one
+# PDF (a whole class in one file); on other canvases place() draws inline.
+
+import re
+import weakref
+
+_form_canvases = weakref.WeakSet()
+
+
+def use_forms(c):
+    _form_canvases.add(c)
+    return c
+
+
+class PageTemplates:
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self._recipes = {}            # name -> (draw(c), bbox)
+        self._form_names = {}
+
+    def add(self, name, draw, bbox=None):
+        # draw(c) paints the layer in template coordinates; bbox is
+        # (lowerx, lowery, upperx, uppery), default the whole page
+        self._recipes[name] = (draw, bbox)
+        self._form_names[name] = self.prefix + "_" + re.sub(r"[^A-Za-z0-9]+", "_", name)
+        return self
+
+    def __contains__(self, name):
+        return name in self._recipes
+
+    def place(self, c, name, x=0, y=0):
+        draw, bbox = self._recipes[name]
+        if c not in _form_canvases:
+            if x or y:
+                c.saveState()
+                c.translate(x, y)
+                draw(c)
+                c.restoreState()
+            else:
+                draw(c)
+            return
+
+        form = self._form_names[name]
+        if not c.hasForm(form):
+            if bbox:
+                c.beginForm(form, *bbox)
+            else:
+                c.beginForm(form)
+            draw(c)
+            c.endForm()
+        if x or y:
+            c.saveState()
+            c.translate(x, y)
+            c.doForm(form)
+            c.restoreState()
+        else:
+            c.doForm(form)
@@ -0,0 +1,90 @@
+# Write finished PDFs into one archive stream as they are produced.
+#
+# PdfSink takes (name, bytes) pairs and appends them to a tar or zip stream on
+# any writable file object (a file, a pipe, sys.stdout.buffer) or to a folder.
+# Nothing is kept after add() returns, so memory stays flat however many
+# documents pass through (zip keeps one small directory entry per file, which
+# it must write at the end; tar keeps nothing).
+
+import os
+import sys
+import time
+
+SINK_FORMATS = ("tar", "zip", "dir")
+
+
+class PdfSink:
+    def __init__(self, target, fmt="tar"):
+        # target: path, "-" for stdout, or a writable binary file object
+        if fmt not in SINK_FORMATS:
+            raise ValueError(f"unknown sink format: {fmt!r}")
+        self.fmt = fmt
+        self.count = 0
+        self.bytes = 0
+        self._own = None
+        if fmt == "dir":
+            os.makedirs(target, exist_ok=True)
+            self._dir = target
+            return
+
+        if target == "-":
+            fileobj = sys.stdout.buffer
+        elif isinstance(target, (str, os.PathLike)):
+            fileobj = self._own = open(target, "wb")
+        else:
+            fileobj = target
+        if fmt == "tar":
+            import tarfile
+            # "w|" never seeks, so pipes work
+            self._archive = tarfile.open(fileobj=fileobj, mode="w|")
+        else:
+            import zipfile
+            # PDF streams are already deflated; store them as-is
+            self._archive = zipfile.ZipFile(fileobj, mode="w", compression=zipfile.ZIP_STORED)
+
+    def add(self, name, data: bytes):
+        if self.fmt == "dir":
+            with open(os.path.join(self._dir, name), "wb") as f:
+                f.write(data)
+        elif self.fmt == "tar":
+            info = self._archive.tarinfo(name)
+            info.size = len(data)
+            info.mtime = int(time.time())
+            self._archive.addfile(info, _BytesReader(data))
+            self._archive.members.clear()     # only needed for reading back
+        else:
+            self._archive.writestr(name, data)
+        self.count += 1
+        self.bytes += len(data)
+
+    def close(self):
+        if self.fmt != "dir":
+            self._archive.close()
+        if self._own is not None:
+            self._own.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _BytesReader:
+    # minimal read() view for tarfile.addfile without copying into BytesIO
+    def __init__(self, data):
+        self._view = memoryview(data)
+        self._pos = 0
+
+    def read(self, n=-1):
+        end = len(self._view) if n < 0 else self._pos + n
+        chunk = self._view[self._pos:end]
+        self._pos += len(chunk)
+        return bytes(chunk)
+
+
+def peak_rss_mb():
+    # peak resident set size of this process so far, in MB
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
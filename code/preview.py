@@ -0,0 +1,520 @@
+# PNG page previews for parents and teachers, without a PDF round trip.
+# Requires: pip install pillow reportlab
+#
+# PreviewCanvas implements the part of reportlab's Canvas that mathtest.py and
+# langtest.py draw with, and paints each page onto a grayscale PIL image
+# instead of writing PDF operators. The drawing code is shared, so a preview
+# shows what the PDF prints, and text uses the same Type 1 Helvetica and
+# Courier outlines reportlab embeds metrics for.
+#
+# PreviewCache keeps the PNGs on disk under "<worksheet ID>-<content hash>",
+# one directory per worksheet, and drops the least recently used worksheets
+# once the folder outgrows max_bytes. The hash covers the problems on the
+# sheet, the scale and PREVIEW_VERSION, so a preview is never served for
+# different content. preview_batch renders the misses of a batch in a process
+# pool; a hit is a directory listing.
+#
+#   python preview.py M1-445344222235543-1-7C3K ...      # paths of the page PNGs
+#   python preview.py M1H-... --student Ava              # history sheets need the student
+#   python preview.py --bench 40 --workers 4             # cold render vs cache hit
+
+import argparse
+import functools
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import time
+
+from reportlab.lib.pagesizes import letter
+
+PREVIEW_VERSION = 1               # bump when a drawing change alters previews
+PREVIEW_SCALE = 0.5               # pixels per point: letter pages are 306 x 396
+DEFAULT_PREVIEW_DIR = os.environ.get(
+    "HOMESCHOOL_PREVIEW_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "homeschool", "previews"),
+)
+
+
+# -----------------------
+# Canvas
+# -----------------------
+@functools.lru_cache(maxsize=None)
+def _font(name, px):
+    # reportlab ships the standard fonts as Type 1 files; FreeType reads them
+    from PIL import ImageFont
+    from reportlab.pdfbase._fontdata import findT1File
+    return ImageFont.truetype(findT1File(name) or findT1File("Helvetica"), px)
+
+
+@functools.lru_cache(maxsize=None)
+def _glyph(name, px, ch):
+    # (mask, dx, dy) for one character, relative to its baseline origin.
+    # FreeType takes ~1 ms per Type 1 string, so each glyph is rasterized
+    # once per process and text is stamped glyph by glyph.
+    from PIL import Image, ImageDraw
+    font = _font(name, px)
+    left, top, right, bottom = font.getbbox(ch, anchor="ls")
+    mask = Image.new("L", (max(1, right - left), max(1, bottom - top)), 0)
+    ImageDraw.Draw(mask).text((-left, -top), ch, font=font, anchor="ls", fill=255)
+    return mask, left, top
+
+
+@functools.lru_cache(maxsize=None)
+def _advance(name, ch):
+    # PDF advance width per point of font size, so glyphs land where the PDF puts them
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    return stringWidth(ch, name, 1000) / 1000
+
+
+class PreviewCanvas:
+    """
+    Canvas(pagesize=...) stand-in that rasterizes: showPage() closes the
+    current page into self.pages (PIL "L" images). Colors are ignored and
+    everything is drawn black, as on the printed sheets.
+    """
+
+    def __init__(self, pagesize=letter, scale=PREVIEW_SCALE):
+        self.pagesize = pagesize
+        self.scale = scale
+        self.pages = []
+        self._stack = []
+        self._start_page()
+
+    def _start_page(self):
+        from PIL import Image, ImageDraw
+        w, h = self.pagesize
+        self._image = Image.new("L", (round(w * self.scale), round(h * self.scale)), 255)
+        self._draw = ImageDraw.Draw(self._image)
+        # graphics state, reset on every page like a PDF page's
+        self._origin = (0.0, 0.0)
+        self._font_name, self._font_size = "Helvetica", 12
+        self._line_width = 1.0
+        self._dash = None
+
+    def _xy(self, x, y):
+        ox, oy = self._origin
+        return (x + ox) * self.scale, (self.pagesize[1] - y - oy) * self.scale
+
+    def _width(self):
+        return max(1, round(self._line_width * self.scale))
+
+    # state
+    def saveState(self):
+        self._stack.append((self._origin, self._font_name, self._font_size, self._line_width, self._dash))
+
+    def restoreState(self):
+        self._origin, self._font_name, self._font_size, self._line_width, self._dash = self._stack.pop()
+
+    def translate(self, dx, dy):
+        self._origin = (self._origin[0] + dx, self._origin[1] + dy)
+
+    def setFont(self, name, size, leading=None):
+        self._font_name, self._font_size = name, size
+
+    def setLineWidth(self, width):
+        self._line_width = width
+
+    def setDash(self, array=(), phase=0):
+        # setDash(3, 2) or setDash([3, 2]); setDash() is solid
+        if isinstance(array, (int, float)):
+            array = (array, phase)
+        self._dash = tuple(array) or None
+
+    def setStrokeColor(self, color):
+        pass
+
+    def setTitle(self, title):
+        pass
+
+    # text
+    def _text(self, x, y, text, name, size, align=0.0):
+        # align: 0 left, 0.5 centred, 1 right of x
+        if align:
+            x -= align * size * sum(_advance(name, ch) for ch in text)
+        px, py = self._xy(x, y)
+        step = size * self.scale
+        for ch in text:
+            if ch != " ":
+                mask, dx, dy = _glyph(name, step, ch)
+                left, top = round(px) + dx, round(py) + dy
+                self._image.paste(0, (left, top, left + mask.width, top + mask.height), mask)
+            px += _advance(name, ch) * step
+
+    def drawString(self, x, y, text):
+        self._text(x, y, text, self._font_name, self._font_size)
+
+    def drawRightString(self, x, y, text):
+        self._text(x, y, text, self._font_name, self._font_size, 1.0)
+
+    def drawCentredString(self, x, y, text):
+        self._text(x, y, text, self._font_name, self._font_size, 0.5)
+
+    def beginText(self, x=0, y=0):
+        return _PreviewText(self, x, y)
+
+    def drawText(self, t):
+        for x, y, name, size, text in t.runs:
+            self._text(x, y, text, name, size)
+
+    # lines and shapes
+    def line(self, x1, y1, x2, y2):
+        (a, b), (c, d) = self._xy(x1, y1), self._xy(x2, y2)
+        if not self._dash:
+            self._draw.line([(a, b), (c, d)], fill=0, width=self._width())
+            return
+        length = ((c - a) ** 2 + (d - b) ** 2) ** 0.5
+        on, off = (self._dash * 2)[:2]
+        pos, step = 0.0, (on + off) * self.scale
+        while length and pos < length:
+            end = min(pos + on * self.scale, length)
+            self._draw.line([(a + (c - a) * pos / length, b + (d - b) * pos / length),
+                             (a + (c - a) * end / length, b + (d - b) * end / length)],
+                            fill=0, width=self._width())
+            pos += step
+
+    def rect(self, x, y, w, h, stroke=1, fill=0):
+        (a, b), (c, d) = self._xy(x, y), self._xy(x + w, y + h)
+        self._draw.rectangle([min(a, c), min(b, d), max(a, c), max(b, d)], outline=0 if stroke else None,
+                             fill=0 if fill else None, width=self._width())
+
+    def drawPath(self, path, stroke=1, fill=0):
+        # straight segments only (m / l / h), which is all figure_path emits
+        points, closed, nums = [], False, []
+        for tok in path.getCode().split():
+            if tok in ("m", "l"):
+                points.append(self._xy(float(nums[-2]), float(nums[-1])))
+                nums = []
+            elif tok == "h":
+                closed = True
+            elif tok != "n":
+                nums.append(tok)
+        if closed and points:
+            points.append(points[0])
+        if fill:
+            self._draw.polygon(points, fill=0)
+        if stroke:
+            self._draw.line(points, fill=0, width=self._width(), joint="curve")
+
+    # pages
+    def showPage(self):
+        self.pages.append(self._image)
+        self._start_page()
+
+    def save(self):
+        pass
+
+
+class _PreviewText:
+    # the PDFTextObject calls textlayout.draw_block and the figure labels use;
+    # every piece of text becomes a run (x, y, font, size, text)
+    def __init__(self, canvas, x, y):
+        self.runs = []
+        self._font = (canvas._font_name, canvas._font_size)
+        self._leading = canvas._font_size * 1.2
+        self.setTextOrigin(x, y)
+
+    def setTextOrigin(self, x, y):
+        self._x0 = self._x = x
+        self._y0 = y
+
+    def setFont(self, name, size, leading=None):
+        self._font = (name, size)
+        self._leading = leading if leading is not None else size * 1.2
+
+    def textOut(self, text):
+        self.runs.append((self._x, self._y0, *self._font, text))
+        self._x += self._font[1] * sum(_advance(self._font[0], ch) for ch in text)
+
+    def textLine(self, text=""):
+        self.runs.append((self._x, self._y0, *self._font, text))
+        self._x = self._x0
+        self._y0 -= self._leading
+
+    def moveCursor(self, dx, dy):
+        # relative to the start of the current line; positive dy moves down
+        self._x0 += dx
+        self._x = self._x0
+        self._y0 -= dy
+
+
+def to_png(image):
+    buf = io.BytesIO()
+    image.save(buf, "PNG")
+    return buf.getvalue()
+
+
+# -----------------------
+# Pages
+# -----------------------
+def math_pages(ps, today_str, ws_id=None, answers="none", scale=PREVIEW_SCALE):
+    import mathtest as mt
+    c = PreviewCanvas(letter, scale)
+    mt.draw_test(c, ps, today_str, "page" if answers in ("page", "both") else "none", ws_id)
+    return c.pages
+
+
+def reading_pages(test, today, answer_key=True, scale=PREVIEW_SCALE):
+    import langtest
+    c = PreviewCanvas(letter, scale)
+    pages = langtest.plan_pages(test)
+    if answer_key:
+        pages += langtest.plan_answer_pages(test)
+    langtest.draw_pages(c, pages, langtest.page_templates(today.strftime("%B %d, %Y")))
+    return c.pages
+
+
+def content_hash(*parts):
+    h = hashlib.sha256()
+    for part in (PREVIEW_VERSION,) + parts:
+        h.update(repr(part).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+# -----------------------
+# Disk cache
+# -----------------------
+class PreviewCache:
+    def __init__(self, root=DEFAULT_PREVIEW_DIR, max_bytes=256 * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+    def path(self, key):
+        # key is "<name>-<hash>"; shard on the hash
+        return os.path.join(self.root, key.rsplit("-", 1)[-1][:2], key)
+
+    def get(self, key):
+        # -> page PNG paths in page order, or None
+        d = self.path(key)
+        try:
+            names = sorted(os.listdir(d), key=lambda n: int(n.split(".")[0]))
+        except FileNotFoundError:
+            self.stats["misses"] += 1
+            return None
+        os.utime(d)                               # last use, for eviction
+        self.stats["hits"] += 1
+        return [os.path.join(d, n) for n in names]
+
+    def put(self, key, pngs, evict=True):
+        # pages are written to a scratch directory and renamed into place, so
+        # a reader (or another worker) never sees half an entry
+        d = self.path(key)
+        tmp = f"{d}.{os.getpid()}.tmp"
+        os.makedirs(tmp, exist_ok=True)
+        for i, png in enumerate(pngs, 1):
+            with open(os.path.join(tmp, f"{i}.png"), "wb") as f:
+                f.write(png)
+        try:
+            os.replace(tmp, d)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)   # another process got there first
+        self.stats["writes"] += 1
+        if evict:
+            self.evict()
+        return [os.path.join(d, f"{i}.png") for i in range(1, len(pngs) + 1)]
+
+    def evict(self):
+        # least recently used worksheets go first until under max_bytes
+        entries, total = [], 0
+        for shard in _listdir(self.root):
+            for key in _listdir(os.path.join(self.root, shard)):
+                d = os.path.join(self.root, shard, key)
+                if key.endswith(".tmp"):
+                    continue
+                try:
+                    size = sum(os.path.getsize(os.path.join(d, n)) for n in os.listdir(d))
+                    used = os.stat(d).st_mtime
+                except FileNotFoundError:
+                    continue
+                entries.append((used, size, d))
+                total += size
+        entries.sort()
+        for _, size, d in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(d, ignore_errors=True)
+            self.stats["evictions"] += 1
+            total -= size
+
+    def clear(self):
+        for shard in _listdir(self.root):
+            shutil.rmtree(os.path.join(self.root, shard), ignore_errors=True)
+
+
+def _listdir(path):
+    try:
+        return os.listdir(path)
+    except FileNotFoundError:
+        return []
+
+
+# -----------------------
+# Previews
+# -----------------------
+def math_preview_key(ws_id, ps, scale=PREVIEW_SCALE, answers="none"):
+    return f"{ws_id}-{content_hash(ws_id, ps, scale, answers)[:16]}"
+
+
+def math_preview(ws_id, cache=None, scale=PREVIEW_SCALE, answers="none", seen=None, evict=True, ps=None):
+    # page PNG paths for a printed worksheet, rendered on a cache miss. History
+    # sheets need seen (mathschedule.history_view); ps skips regenerating a
+    # set the caller already has.
+    import mathtest as mt
+    cache = cache or PreviewCache()
+    ws_id = ws_id.strip().upper()
+    if ps is None:
+        ps = mt.regenerate(ws_id, seen)
+    key = math_preview_key(ws_id, ps, scale, answers)
+    paths = cache.get(key)
+    if paths is None:
+        paths = _render_math(ws_id, ps, key, cache, scale, answers, evict)
+    return paths
+
+
+def _render_math(ws_id, ps, key, cache, scale, answers, evict=True):
+    # a miss already looked up under key: render and store it
+    import mathtest as mt
+    _, _, day_str = mt.parse_worksheet_id(ws_id)
+    pages = math_pages(ps, day_str, ws_id, answers, scale)
+    return cache.put(key, [to_png(p) for p in pages], evict=evict)
+
+
+def reading_preview(test, today, cache=None, scale=PREVIEW_SCALE, answer_key=True):
+    # reading tests have no worksheet ID; the title stands in for one
+    cache = cache or PreviewCache()
+    name = re.sub(r"[^A-Za-z0-9]+", "_", test["title"]).strip("_")[:40] or "reading"
+    key = f"R-{name}-{content_hash(json.dumps(test, sort_keys=True), today.isoformat(), scale, answer_key)[:16]}"
+    paths = cache.get(key)
+    if paths is None:
+        paths = cache.put(key, [to_png(p) for p in reading_pages(test, today, answer_key, scale)])
+    return paths
+
+
+def _preview_chunk(sheets, root, scale, answers):
+    # sheets: [(ws_id, ProblemSet, key)], misses preview_batch has already
+    # built and looked up once
+    cache = PreviewCache(root)
+    return [_render_math(ws_id, ps, key, cache, scale, answers, evict=False) for ws_id, ps, key in sheets]
+
+
+def preview_batch(ws_ids, cache=None, workers=1, scale=PREVIEW_SCALE, answers="none", chunksize=None,
+                  seen=None):
+    # {ws_id: page paths}. Hits are answered here; misses are rendered by
+    # `workers` processes writing into the same cache directory, and the
+    # cache is trimmed once at the end rather than after every worksheet.
+    # seen maps the ID of each history sheet to its view of the student's
+    # history (mathschedule.history_view).
+    import mathtest as mt
+    cache = cache or PreviewCache()
+    seen = seen or {}
+    out, misses = {}, []
+    for ws_id in ws_ids:
+        ws_id = ws_id.strip().upper()
+        ps = mt.regenerate(ws_id, seen.get(ws_id))
+        key = math_preview_key(ws_id, ps, scale, answers)
+        paths = cache.get(key)
+        if paths is None:
+            misses.append((ws_id, ps, key))
+        else:
+            out[ws_id] = paths
+    if not workers or workers < 1:
+        workers = os.cpu_count() or 1
+    if workers == 1 or len(misses) < 2:
+        results = [_preview_chunk(misses, cache.root, scale, answers)]
+        chunks = [misses]
+    else:
+        chunksize = chunksize or max(1, min(16, len(misses) // (workers * 4)))
+        chunks = [misses[i:i + chunksize] for i in range(0, len(misses), chunksize)]
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as ex:
+            results = list(ex.map(_preview_chunk, chunks, [cache.root] * len(chunks),
+                                  [scale] * len(chunks), [answers] * len(chunks)))
+    for chunk, paths in zip(chunks, results):
+        out.update(zip((ws_id for ws_id, _, _ in chunk), paths))
+    cache.stats["writes"] += len(misses)
+    if misses:
+        cache.evict()
+    return {ws_id.strip().upper(): out[ws_id.strip().upper()] for ws_id in ws_ids}
+
+
+def benchmark(n=40, workers=1, scale=PREVIEW_SCALE, root=None):
+    # n fresh worksheet IDs: render everything, then ask again (all hits);
+    # without a root the previews go to a temporary folder that is removed
+    import tempfile
+
+    if root is None:
+        with tempfile.TemporaryDirectory(prefix="previews-") as tmp:
+            return benchmark(n, workers, scale, tmp)
+    import random
+    import mathtest as mt
+
+    workers = workers if workers and workers > 0 else os.cpu_count() or 1
+    cache = PreviewCache(root)
+    ids = [mt.worksheet_id(seed, today_str="January 11, 2026") for seed in random.Random(0).sample(range(10 ** 9), n)]
+    t0 = time.perf_counter()
+    preview_batch(ids, cache, workers, scale)
+    cold = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    preview_batch(ids, cache, workers, scale)
+    warm = time.perf_counter() - t0
+    print(f"{n} worksheets, {workers} worker(s), scale {scale}: cold {cold / n * 1000:.1f} ms/sheet, "
+          f"cached {warm / n * 1000:.2f} ms/sheet  ({root})")
+    return cold, warm
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="PNG previews of worksheets, cached on disk.")
+    ap.add_argument("ids", nargs="*", metavar="ID", help="worksheet IDs printed on math tests")
+    ap.add_argument("--reading", metavar="JSON", help="preview a reading test saved as JSON")
+    ap.add_argument("--workers", type=int, default=1, help="processes for cache misses (0 = all cores)")
+    ap.add_argument("--scale", type=float, default=PREVIEW_SCALE, help="pixels per point")
+    ap.add_argument("--answers", choices=("none", "page"), default="none", help="include the answer key page")
+    ap.add_argument("--dir", default=DEFAULT_PREVIEW_DIR, help="cache folder")
+    ap.add_argument("--student", help="student the history sheets (IDs starting M1H-) were drawn for")
+    ap.add_argument("--store", default=None, help="score store with the problem history (default: scorestore's)")
+    ap.add_argument("--bench", type=int, metavar="N", help="time N uncached and then cached previews")
+    args = ap.parse_args(argv)
+
+    if args.bench:
+        benchmark(args.bench, args.workers, args.scale)
+        return
+    cache = PreviewCache(args.dir)
+    if args.reading:
+        from datetime import date
+        with open(args.reading, encoding="utf-8") as f:
+            test = json.load(f)
+        print("\n".join(reading_preview(test, date.today(), cache, args.scale, args.answers == "page")))
+    if not args.ids and not args.reading:
+        ap.error("give worksheet IDs, --reading or --bench")
+    import mathtest as mt
+    for ws_id in args.ids:
+        try:
+            mt.parse_worksheet_id(ws_id)
+        except ValueError as e:
+            ap.error(str(e))
+    seen = {}
+    history_ids = [ws_id.strip().upper() for ws_id in args.ids if mt.uses_history(ws_id)]
+    if history_ids:
+        if not args.student:
+            ap.error(f"{history_ids[0]} was drawn against a student's history; pass --student")
+        import mathschedule
+        from problemhistory import ProblemHistory, history_path
+        from scorestore import DEFAULT_STORE, ScoreStore
+        store = ScoreStore(args.store or DEFAULT_STORE)
+        history = ProblemHistory(history_path(store.root))
+        seen = {ws_id: mathschedule.history_view(store, args.student, ws_id, history) for ws_id in history_ids}
+    t0 = time.perf_counter()
+    for ws_id, paths in preview_batch(args.ids, cache, args.workers, args.scale, args.answers,
+                                      seen=seen).items():
+        print(ws_id, *paths)
+    if args.ids:
+        print(f"{len(args.ids)} preview(s) in {(time.perf_counter() - t0) * 1000:.1f} ms "
+              f"({cache.stats['hits']} cached)")
+
+
+if __name__ == "__main__":
+    main()
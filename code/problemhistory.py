@@ -0,0 +1,208 @@
+# Recently issued problems, per student, for duplicate avoidance.
+# Requires: pip install numpy
+#
+# Every issued item is kept as a 64-bit fingerprint under its student and print
+# day. A HistoryView gathers the fingerprints of the window_days before a print
+# date into one set, so checking a candidate problem is a hash and a set
+# lookup, and the generators in mathtest.py redraw items the student has seen
+# recently (make_problem_set(seen=view)). At ~30 items a sheet that is about
+# 240 bytes per student per day; a Bloom filter of the same size would be
+# saturated by a two-week window.
+#
+# Only days strictly before the print date are consulted, and past days never
+# change, so a worksheet built from a view can be rebuilt later from a view for
+# the same student and date (mathtest.regenerate(ws_id, seen=...)). Pruned days
+# are remembered, and asking for a window that reaches into them is an error
+# rather than a silently different worksheet.
+#
+#   python problemhistory.py --bench --students 50 --days 60
+
+import argparse
+import hashlib
+import os
+import random
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+from scorestore import DEFAULT_STORE
+
+
+
+def history_path(root=None):
+    # the history kept with the score store at root (None: the default one);
+    # mathtest, mathschedule, preview and scangrade all resolve it here so they
+    # share one history. PROBLEM_HISTORY moves the default store's history.
+    root = root or DEFAULT_STORE
+    if root == DEFAULT_STORE and os.environ.get("PROBLEM_HISTORY"):
+        return os.environ["PROBLEM_HISTORY"]
+    return os.path.join(root, "problem_history.npz")
+
+
+DEFAULT_HISTORY = history_path()
+
+WINDOW_DAYS = 14          # how far back a problem counts as recently issued
+RETAIN_DAYS = 180         # fingerprints older than this are pruned
+
+
+def fingerprint(kind, item):
+    return int.from_bytes(hashlib.blake2b(f"{kind}:{item!r}".encode(), digest_size=8).digest(), "little")
+
+
+class HistoryView:
+    # A student's recent problems as of one print date. Items added while a
+    # worksheet is generated go into the view too (no repeats within a sheet)
+    # and are kept in `new` for ProblemHistory.commit().
+    __slots__ = ("student", "day", "recent", "new", "stats", "_fp", "_hit")
+
+    def __init__(self, student, day, recent, stats=None):
+        self.student = student
+        self.day = day
+        self.recent = recent
+        self.new = []
+        self.stats = stats if stats is not None else new_stats()
+        self._fp = None
+        self._hit = False
+
+    def seen(self, kind, item):
+        # True if the student had this item in the window (or earlier on this sheet)
+        self._fp = fingerprint(kind, item)
+        self._hit = self._fp in self.recent
+        self.stats["checks"] += 1
+        self.stats["collisions"] += self._hit
+        return self._hit
+
+    def add(self, kind, item):
+        # the item was issued; reuses the fingerprint from the seen() before it
+        fp = self._fp if not self._hit else fingerprint(kind, item)
+        self.stats["items"] += 1
+        self.stats["capped"] += self._hit       # gave up redrawing; may repeat
+        self.recent.add(fp)
+        self.new.append(fp)
+        self._hit = False
+
+
+def new_stats():
+    return {"items": 0, "checks": 0, "collisions": 0, "capped": 0}
+
+
+def format_stats(stats):
+    items, checks = max(stats["items"], 1), max(stats["checks"], 1)
+    return (f"{stats['items']} items, {stats['collisions']} resamples "
+            f"({stats['collisions'] / items:.2%} of items; {stats['collisions'] / checks:.2%} of checks "
+            f"collided), {stats['capped']} kept after the resample cap")
+
+
+class ProblemHistory:
+    def __init__(self, path=DEFAULT_HISTORY, window_days=WINDOW_DAYS, retain_days=RETAIN_DAYS):
+        self.path = path
+        self.window = window_days
+        self.retain = retain_days
+        self.days = {}                     # student -> {day ordinal: {fingerprint, ...}}
+        self.pruned_before = 0             # day ordinal; fingerprints before it are gone
+        self.stats = new_stats()
+        if path and os.path.exists(path):
+            with np.load(path) as f:
+                self.pruned_before = int(f["pruned_before"])
+                names = f["students"].tolist()
+                for owner, day, fp in zip(f["owner"].tolist(), f["day"].tolist(), f["fp"].tolist()):
+                    self.days.setdefault(names[owner], {}).setdefault(day, set()).add(fp)
+
+    def view(self, student, day):
+        # fingerprints from the window_days before `day` (a date)
+        d = day.toordinal()
+        if d - self.window < self.pruned_before:
+            raise LookupError(f"problem history before {date.fromordinal(self.pruned_before)} was pruned; "
+                              f"a {self.window}-day window for {day} reaches into it")
+        recent = set()
+        for fday, fps in self.days.get(student, {}).items():
+            if d - self.window <= fday < d:
+                recent.update(fps)
+        return HistoryView(student, day, recent, self.stats)
+
+    def commit(self, view):
+        # remember what the view's worksheet issued, under its print date
+        if view.new:
+            # a set, so re-running a day's batch does not grow it
+            self.days.setdefault(view.student, {}).setdefault(view.day.toordinal(), set()).update(view.new)
+            view.new = []
+
+    def prune(self, today):
+        cutoff = today.toordinal() - self.retain
+        for days in self.days.values():
+            for d in [d for d in days if d < cutoff]:
+                del days[d]
+        self.pruned_before = max(self.pruned_before, cutoff)
+
+    def save(self, path=None):
+        path = path or self.path
+        names = list(self.days)
+        owner, day, fp = [], [], []
+        for i, s in enumerate(names):
+            for d, fps in self.days[s].items():
+                owner += [i] * len(fps)
+                day += [d] * len(fps)
+                fp += sorted(fps)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp, students=np.array(names, dtype=str), owner=np.array(owner, dtype=np.int32),
+                 day=np.array(day, dtype=np.int32), fp=np.array(fp, dtype=np.uint64),
+                 pruned_before=self.pruned_before)
+        os.replace(tmp, path)
+
+
+def benchmark(students=50, days=60, seed=0):
+    # one worksheet per student per day, with and without the history
+    import mathtest as mt
+
+    start = date(2026, 1, 1)
+    seeds = random.Random(seed)
+    plan = [(f"student{s}", start + timedelta(days=d), seeds.randrange(10 ** 9))
+            for d in range(days) for s in range(students)]
+
+    t0 = time.perf_counter()
+    for _, _, sd in plan:
+        mt.make_problem_set(random.Random(sd))
+    t_plain = time.perf_counter() - t0
+
+    hist = ProblemHistory(path=None)
+    t0 = time.perf_counter()
+    for student, day, sd in plan:
+        view = hist.view(student, day)
+        mt.make_problem_set(random.Random(sd), seen=view)
+        hist.commit(view)
+    t_hist = time.perf_counter() - t0
+
+    n = len(plan)
+    print(f"{n:,} worksheets ({students} students x {days} days, {hist.window}-day window)")
+    print(f"plain:        {t_plain / n * 1e6:8.1f} us/sheet")
+    print(f"with history: {t_hist / n * 1e6:8.1f} us/sheet")
+    print(format_stats(hist.stats))
+    return hist.stats
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Per-student problem history.")
+    ap.add_argument("--bench", action="store_true", help="time generation with and without the history")
+    ap.add_argument("--students", type=int, default=50)
+    ap.add_argument("--days", type=int, default=60)
+    ap.add_argument("--prune", action="store_true", help=f"drop fingerprints older than {RETAIN_DAYS} days")
+    ap.add_argument("--path", default=DEFAULT_HISTORY)
+    args = ap.parse_args(argv)
+
+    if args.bench:
+        benchmark(args.students, args.days)
+        return
+    hist = ProblemHistory(args.path)
+    if args.prune:
+        hist.prune(date.today())
+        hist.save()
+    n = sum(len(fps) for days in hist.days.values() for fps in days.values())
+    pruned = date.fromordinal(hist.pruned_before).isoformat() if hist.pruned_before else "never"
+    print(f"{args.path}: {len(hist.days)} student(s), {n} issued item(s), "
+          f"window {hist.window} days, pruned before: {pruned}")
+
+
+if __name__ == "__main__":
+    main()
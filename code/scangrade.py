@@ -0,0 +1,554 @@
+# Automatic marking of scanned mathtest.py worksheets.
+# Requires: pip install numpy pillow
+#
+# A scan is matched to its worksheet by ID: pages are named <key>-p1.png and
+# <key>-p2.png, where the key is the worksheet ID or, with a nightly
+# manifest.json, the student. The worksheet is rebuilt from its ID,
+# mathtest.answer_boxes() says where every answer field is and
+# mathanswers.answer_fields() what belongs in it, so nothing is stored at
+# print time.
+#
+# Each page is thresholded once into an ink array and registered against the
+# section rules (row ink profile). Every field is cropped, its printed
+# underline removed, and split into characters (connected strokes). All characters
+# of a sheet are scaled to GLYPH x GLYPH and classified in one matrix product
+# against digit templates: the standard PDF fonts, rendered on first use,
+# plus handwriting samples collected with `train` from sheets filled in with
+# the right answers. Items that read back as the key are right, others wrong;
+# prime factorizations and fields with an unreadable character go to review
+# and are left out of the score (mathschedule.grade(skip=...)).
+#
+#   python scangrade.py grade --manifest tonight/manifest.json scans/*.png
+#   python scangrade.py grade --student Ava M1-...-p1.png M1-...-p2.png --dry-run
+#   python scangrade.py train --id M1-... filled-p1.png filled-p2.png
+#   python scangrade.py bench -n 200 --workers 0     # synthetic scans, accuracy and sheets/s
+
+import argparse
+import functools
+import json
+import os
+import random
+import re
+import tempfile
+import time
+from collections import defaultdict
+
+import numpy as np
+
+import mathtest as mt
+from mathanswers import answer_fields, answer_sections, fields_match, solve_problem_set
+from scorestore import DEFAULT_STORE, ScoreStore
+
+GLYPH = 20                        # characters are compared as GLYPH x GLYPH
+CLASSES = "0123456789/"
+INK_LEVEL = 160                   # gray values below this are ink
+MIN_SCORE = 0.55                  # correlation below this leaves a character unread
+MAX_SHIFT = 0.25                  # registration search, inches each way
+TEMPLATE_FONTS = ("Helvetica", "Helvetica-Bold", "Helvetica-Oblique", "Courier", "Courier-Bold",
+                  "Times-Roman", "Times-Bold", "Times-Italic")
+SCAN_DPI = 150                    # synthetic scans for bench
+DEFAULT_SAMPLES = os.path.join(DEFAULT_STORE, "digit_samples.npz")
+
+
+# -----------------------
+# Characters
+# -----------------------
+def normalize(glyphs):
+    # boolean character crops -> (n, GLYPH * GLYPH) rows of zero mean and unit
+    # length, so a dot product is a correlation. Each crop is centred on a
+    # square canvas first, keeping its aspect ratio (a "1" stays thin).
+    # A light blur afterwards makes stroke weight and a pixel of shift matter less.
+    from PIL import Image
+    out = np.zeros((len(glyphs), GLYPH, GLYPH), dtype=np.float32)
+    for i, g in enumerate(glyphs):
+        h, w = g.shape
+        side = max(h, w) + 2
+        sq = np.zeros((side, side), dtype=np.float32)
+        sq[(side - h) // 2:(side - h) // 2 + h, (side - w) // 2:(side - w) // 2 + w] = g
+        out[i] = np.asarray(Image.fromarray(sq).resize((GLYPH, GLYPH), Image.BOX if side > GLYPH else Image.BILINEAR))
+    for axis in (1, 2):
+        out = (np.roll(out, 1, axis) + 2 * out + np.roll(out, -1, axis)) / 4
+    out = out.reshape(len(glyphs), GLYPH * GLYPH)
+    out -= out.mean(1, keepdims=True)
+    out /= np.linalg.norm(out, axis=1, keepdims=True) + 1e-6
+    return out
+
+
+def _crop(ink):
+    rows, cols = np.flatnonzero(ink.any(1)), np.flatnonzero(ink.any(0))
+    return ink[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+
+
+@functools.lru_cache(maxsize=None)
+def font_templates():
+    # CLASSES in every TEMPLATE_FONTS face, as rendered by FreeType
+    from PIL import Image, ImageDraw, ImageFont
+    from reportlab.pdfbase._fontdata import findT1File
+    glyphs, labels = [], []
+    for name in TEMPLATE_FONTS:
+        font = ImageFont.truetype(findT1File(name), 48)
+        for ch in CLASSES:
+            img = Image.new("L", (64, 64), 255)
+            ImageDraw.Draw(img).text((8, 56), ch, font=font, anchor="ls", fill=0)
+            glyphs.append(_crop(np.asarray(img) < INK_LEVEL))
+            labels.append(ch)
+    return normalize(glyphs), np.array(labels)
+
+
+@functools.lru_cache(maxsize=4)
+def templates(samples=DEFAULT_SAMPLES):
+    # (matrix, labels, class of each column) with font templates and any trained samples
+    mat, labels = font_templates()
+    if samples and os.path.exists(samples):
+        with np.load(samples) as f:
+            mat = np.vstack([mat, f["glyphs"]])
+            labels = np.concatenate([labels, f["labels"]])
+    return mat, labels, np.array([CLASSES.index(ch) for ch in labels])
+
+
+def classify(vectors, samples=DEFAULT_SAMPLES):
+    # (n, GLYPH * GLYPH) -> (characters, scores); one matrix product for the lot
+    if not len(vectors):
+        return [], np.zeros(0, dtype=np.float32)
+    mat, _, cls = templates(samples)
+    sims = vectors @ mat.T
+    best = np.full((len(vectors), len(CLASSES)), -1.0, dtype=np.float32)
+    for k in range(len(CLASSES)):
+        best[:, k] = sims[:, cls == k].max(1)
+    pick = best.argmax(1)
+    score = best[np.arange(len(vectors)), pick]
+    return [CLASSES[k] if s >= MIN_SCORE else "?" for k, s in zip(pick, score)], score
+
+
+# -----------------------
+# Pages and fields
+# -----------------------
+def load_ink(page):
+    # a path or PIL image -> boolean ink array
+    from PIL import Image
+    img = page if isinstance(page, Image.Image) else Image.open(page)
+    return np.asarray(img.convert("L")) < INK_LEVEL
+
+
+def register(ink, rules, sx, sy):
+    # pixel offset (dx, dy) of the scan from the page: the rows where the
+    # section rules should be are slid over the row ink profile, then the
+    # left end of the best-placed rule gives dx
+    if not rules:
+        return 0, 0
+    profile = ink.sum(1)
+    rows = np.array([round((mt.H - y) * sy) for y in rules])
+    r = int(MAX_SHIFT * 72 * sy)
+    shifts = np.arange(-r, r + 1)
+    idx = np.clip(rows[None, :] + shifts[:, None], 0, len(profile) - 1)
+    dy = int(shifts[profile[idx].sum(1).argmax()])
+    row = min(max(rows[0] + dy, 1), ink.shape[0] - 2)
+    left = round(mt.margin * sx)
+    r = int(MAX_SHIFT * 72 * sx)
+    start = max(left - r, 0)
+    line = ink[row - 1:row + 2, start:left + r + 1].any(0).astype(np.int32)
+    # where a solid run of ink (the rule, not a speck) starts
+    k = max(int(0.1 * 72 * sx), 2)
+    hits = np.flatnonzero(np.convolve(line, np.ones(k, dtype=np.int32), "valid") == k)
+    dx = int(hits[0]) + start - left if len(hits) else 0
+    return dx, dy
+
+
+def components(sub):
+    # 8-connected ink components as (row array, column array) pairs. Runs of
+    # ink along each row are joined to the runs they touch in the row above
+    # (union-find), which is a few hundred steps per field, not one per pixel.
+    d = np.diff(np.pad(sub, ((0, 0), (1, 1))).view(np.int8), axis=1)
+    rs, cs = np.nonzero(d == 1)
+    ce = np.nonzero(d == -1)[1]              # runs are [cs, ce), in row order
+    parent = list(range(len(rs)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    bounds = np.searchsorted(rs, np.arange(sub.shape[0] + 1)).tolist()
+    cs_l, ce_l = cs.tolist(), ce.tolist()
+    for r in range(1, sub.shape[0]):
+        for i in range(bounds[r], bounds[r + 1]):
+            for j in range(bounds[r - 1], bounds[r]):
+                if cs_l[i] <= ce_l[j] and cs_l[j] <= ce_l[i]:
+                    parent[find(i)] = find(j)
+    runs = defaultdict(list)
+    for i in range(len(rs)):
+        runs[find(i)].append(i)
+    comps = []
+    for members in runs.values():
+        lengths = ce[members] - cs[members]
+        rows = np.repeat(rs[members], lengths)
+        cols = np.concatenate([np.arange(cs_l[i], ce_l[i]) for i in members])
+        comps.append((rows, cols))
+    return comps
+
+
+def cut_field(ink, box, sx, sy, dx, dy):
+    # character crops in a field, left to right, as (x, crop). The printed
+    # underline (rows mostly ink) and specks go first; the rest is split into
+    # connected components, and pieces stacked in the same columns (a stroke
+    # broken by the threshold) are put back together. A leaning "/" overlaps
+    # its neighbours' columns only a little and a "." sits beside a digit, so
+    # both stay characters of their own.
+    x0, y0, x1, y1 = box
+    c0, c1 = max(round(x0 * sx) + dx, 0), round(x1 * sx) + dx
+    r0, r1 = max(round((mt.H - y1) * sy) + dy, 0), round((mt.H - y0) * sy) + dy
+    sub = ink[r0:r1, c0:c1].copy()
+    if not sub.size:
+        return []
+    sub[sub.mean(1) > 0.5] = False
+    groups = []                              # [first col, last col, rows, cols]
+    for rows, cols in sorted(components(sub), key=lambda rc: rc[1].min()):
+        if len(rows) < 2:                    # scanner specks
+            continue
+        lo, hi = cols.min(), cols.max()
+        if groups:
+            g = groups[-1]
+            overlap = min(hi, g[1]) - max(lo, g[0]) + 1
+            beside = min(rows.max(), g[2].max()) - max(rows.min(), g[2].min()) + 1
+            if (overlap >= 0.7 * min(hi - lo + 1, g[1] - g[0] + 1)
+                    and beside < 0.5 * min(np.ptp(rows), np.ptp(g[2])) + 1):
+                g[0], g[1] = min(lo, g[0]), max(hi, g[1])
+                g[2], g[3] = np.concatenate([g[2], rows]), np.concatenate([g[3], cols])
+                continue
+        groups.append([lo, hi, rows, cols])
+
+    chars = []
+    for lo, hi, rows, cols in groups:
+        if (rows.min() == 0 or rows.max() == sub.shape[0] - 1) and np.ptp(rows) < 0.25 * sub.shape[0]:
+            continue                         # a sliver of the lines above or below
+        g = np.zeros((sub.shape[0], hi - lo + 1), dtype=bool)
+        g[rows, cols - lo] = True
+        # keep the tallest band of rows: a mark above or below sharing these
+        # columns is not part of the character
+        band = np.flatnonzero(np.diff(np.concatenate(([0], g.any(1).view(np.int8), [0])))).reshape(-1, 2)
+        top, bottom = band[(band[:, 1] - band[:, 0]).argmax()]
+        chars.append((int(lo), g[top:bottom]))
+    if chars:
+        # a sliver cut off at either edge is print from next door
+        ref = max(g.shape[0] for _, g in chars)
+        chars = [(x, g) for x, g in chars
+                 if not ((x == 0 or x + g.shape[1] == sub.shape[1]) and g.shape[1] < 0.5 * ref)]
+    return chars
+
+
+def read_field(chars):
+    # split chars into (small marks, glyphs to classify); returns a list of
+    # slots: a character or an index into the glyph list, with word gaps
+    if not chars:
+        return [], []
+    ref = max(g.shape[0] for _, g in chars)
+    slots, glyphs, prev_end = [], [], None
+    for x, g in chars:
+        h, w = g.shape
+        if prev_end is not None and x - prev_end > 0.6 * ref:
+            slots.append(" ")
+        prev_end = x + w
+        if h < 0.35 * ref:
+            slots.append("-" if w > 1.5 * h else ".")
+            continue
+        n = max(1, round(w / (0.75 * h))) if w > 1.1 * h else 1   # touching digits
+        step = w / n
+        for k in range(n):
+            piece = g[:, round(k * step):round((k + 1) * step)]
+            if piece.any():
+                slots.append(len(glyphs))
+                glyphs.append(_crop(piece))
+    return slots, glyphs
+
+
+def grade_sheet(ws_id, pages, seen=None, samples=DEFAULT_SAMPLES):
+    # pages: paths or images of page 1 and 2 -> {"id", "wrong", "review", "reads"}
+    t0 = time.perf_counter()
+    ws_id = ws_id.strip().upper()
+    _, _, day_str = mt.parse_worksheet_id(ws_id)
+    ps = mt.regenerate(ws_id, seen)
+    boxes = mt.answer_boxes(ps, day_str, ws_id)
+    expected = answer_fields(ps)
+    sections = answer_sections(ps)
+
+    fields = defaultdict(list)              # label -> [slots per field]
+    glyphs = []
+    for page_no, page in enumerate(pages, 1):
+        ink = load_ink(page)
+        sy, sx = ink.shape[0] / mt.H, ink.shape[1] / mt.W
+        dx, dy = register(ink, [y for p, y in boxes.rules if p == page_no], sx, sy)
+        for p, label, *box in boxes.fields:
+            if p != page_no or expected.get(label) is None:
+                continue
+            slots, gl = read_field(cut_field(ink, box, sx, sy, dx, dy))
+            fields[label].append([s + len(glyphs) if isinstance(s, int) else s for s in slots])
+            glyphs += gl
+    chars, _ = classify(normalize(glyphs), samples)
+
+    reads, wrong, review = {}, [], []
+    for label, want in expected.items():
+        if want is None or label not in fields:
+            review.append(label)
+            continue
+        got = ["".join(chars[s] if isinstance(s, int) else s for s in slots).strip() for slots in fields[label]]
+        # an area may carry its unit after the number; elsewhere spacing is ignored
+        got = [g.split(" ")[0] if label.startswith("p2-4") else g.replace(" ", "") for g in got]
+        reads[label] = got
+        if fields_match(sections[label], got, want):
+            continue
+        (review if any("?" in g for g in got) else wrong).append(label)
+    return {"id": ws_id, "wrong": wrong, "review": review, "reads": reads, "chars": len(glyphs),
+            "seconds": time.perf_counter() - t0}
+
+
+def _grade_chunk(jobs, samples):
+    return [grade_sheet(ws_id, pages, seen[0] if seen else None, samples) for ws_id, pages, *seen in jobs]
+
+
+def grade_scans(jobs, workers=1, chunksize=None, samples=DEFAULT_SAMPLES):
+    # jobs: [(ws_id, [page1, page2]) or (ws_id, pages, seen), ...] -> results
+    # in the same order; seen is the history view for history sheets.
+    # Sheets are independent, so they are sharded over a process pool.
+    if not workers or workers < 1:
+        workers = os.cpu_count() or 1
+    if workers == 1 or len(jobs) < 2:
+        return _grade_chunk(jobs, samples)
+    chunksize = chunksize or max(1, min(32, len(jobs) // (workers * 4)))
+    chunks = [jobs[i:i + chunksize] for i in range(0, len(jobs), chunksize)]
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as ex:
+        return [r for part in ex.map(_grade_chunk, chunks, [samples] * len(chunks)) for r in part]
+
+
+def record(store, student, result, minutes=0.0):
+    # append a graded scan to the score store; review items do not count
+    import mathschedule
+    return mathschedule.grade(store, student, result["id"], result["wrong"], minutes, skip=result["review"])
+
+
+# -----------------------
+# Training
+# -----------------------
+def train(ws_id, pages, samples=DEFAULT_SAMPLES, seen=None):
+    # pages filled in with the correct answers (in the student's hand): every
+    # field whose characters split cleanly becomes labelled samples. History
+    # sheets need seen, as in grade_sheet.
+    ws_id = ws_id.strip().upper()
+    _, _, day_str = mt.parse_worksheet_id(ws_id)
+    ps = mt.regenerate(ws_id, seen)
+    boxes = mt.answer_boxes(ps, day_str, ws_id)
+    expected = answer_fields(ps)
+    seen = defaultdict(int)
+    new_glyphs, new_labels = [], []
+    for page_no, page in enumerate(pages, 1):
+        ink = load_ink(page)
+        sy, sx = ink.shape[0] / mt.H, ink.shape[1] / mt.W
+        dx, dy = register(ink, [y for p, y in boxes.rules if p == page_no], sx, sy)
+        for p, label, *box in boxes.fields:
+            if p != page_no or expected.get(label) is None:
+                continue
+            want = expected[label][seen[label]]
+            seen[label] += 1
+            _, gl = read_field(cut_field(ink, box, sx, sy, dx, dy))
+            text = [ch for ch in want if ch in CLASSES]
+            if len(gl) != len(text):
+                continue
+            new_glyphs += gl
+            new_labels += text
+    mat = normalize(new_glyphs)
+    labels = np.array(new_labels)
+    if os.path.exists(samples):
+        with np.load(samples) as f:
+            mat, labels = np.vstack([f["glyphs"], mat]), np.concatenate([f["labels"], labels])
+    os.makedirs(os.path.dirname(os.path.abspath(samples)), exist_ok=True)
+    tmp = f"{samples}.{os.getpid()}.tmp.npz"
+    np.savez(tmp, glyphs=mat, labels=labels)
+    os.replace(tmp, samples)
+    templates.cache_clear()
+    return len(new_labels)
+
+
+# -----------------------
+# Synthetic scans
+# -----------------------
+def synthetic_scan(ws_id, wrong=(), dpi=SCAN_DPI, seed=0, seen=None):
+    # every page as a scanner would return it, filled in: the key in every
+    # field (one digit off for labels in `wrong`), a little jitter, a page
+    # offset and some speckle; seen as in grade_sheet
+    from PIL import Image, ImageDraw, ImageFont
+    import preview
+
+    rng = random.Random(seed)
+    ws_id = ws_id.strip().upper()
+    _, _, day_str = mt.parse_worksheet_id(ws_id)
+    ps = mt.regenerate(ws_id, seen)
+    scale = dpi / 72
+    c = preview.PreviewCanvas(scale=scale)
+    boxes = mt.AnswerBoxes()
+    mt.draw_test(c, ps, day_str, ws_id=ws_id, boxes=boxes)
+    expected = answer_fields(ps)
+    key = solve_problem_set(ps)
+
+    draws = [ImageDraw.Draw(img) for img in c.pages]
+    seen = defaultdict(int)
+    for page, label, x0, y0, x1, y1 in boxes.fields:
+        want = expected[label]
+        text = key[label] if want is None else want[seen[label]]
+        seen[label] += 1
+        if label in wrong and want is not None and seen[label] == 1:
+            i = max(k for k, ch in enumerate(text) if ch.isdigit())
+            text = text[:i] + str((int(text[i]) + rng.randint(1, 9)) % 10) + text[i + 1:]
+        size = (y1 - y0) * scale * rng.uniform(0.6, 0.75)
+        font = ImageFont.load_default(size)      # Pillow's own face: a "hand" no template was made from
+        x = (x0 + rng.uniform(1, 6)) * scale
+        y = (mt.H - y0 - 4 + rng.uniform(-1, 1)) * scale
+        draws[page - 1].text((x, y), text, font=font, anchor="ls", fill=rng.randint(0, 60))
+
+    pages = []
+    for img in c.pages:
+        dx, dy = rng.randint(-6, 6), rng.randint(-6, 6)
+        moved = Image.new("L", img.size, 255)
+        moved.paste(img, (dx, dy))
+        arr = np.array(moved)
+        speckle = np.random.default_rng(rng.randrange(2 ** 32)).random(arr.shape) < 0.0005
+        arr[speckle] = 0
+        pages.append(Image.fromarray(arr))
+    return pages
+
+
+def benchmark(n=100, workers=1, dpi=SCAN_DPI, wrong_rate=0.15, seed=0, train_sheets=2):
+    # n synthetic sheets written to PNG, then graded from disk, after learning
+    # the "handwriting" from train_sheets correctly filled ones
+    out_dir = tempfile.mkdtemp(prefix="scans-")
+    rng = random.Random(seed)
+    samples = os.path.join(out_dir, "samples.npz") if train_sheets else None
+    for i in range(train_sheets):
+        ws_id = mt.worksheet_id(rng.randrange(10 ** 9), today_str="January 11, 2026")
+        train(ws_id, synthetic_scan(ws_id, dpi=dpi, seed=n + i), samples)
+    jobs, truth = [], []
+    for i in range(n):
+        ws_id = mt.worksheet_id(rng.randrange(10 ** 9), today_str="January 11, 2026")
+        labels = list(answer_fields(mt.regenerate(ws_id)))
+        wrong = {label for label in labels if rng.random() < wrong_rate}
+        paths = []
+        for p, img in enumerate(synthetic_scan(ws_id, wrong, dpi, seed=i), 1):
+            paths.append(os.path.join(out_dir, f"{ws_id}-p{p}.png"))
+            img.save(paths[-1])
+        jobs.append((ws_id, paths))
+        truth.append(wrong)
+    if not workers or workers < 1:
+        workers = os.cpu_count() or 1
+
+    t0 = time.perf_counter()
+    results = grade_scans(jobs, workers, samples=samples)
+    dt = time.perf_counter() - t0
+
+    items = agree = reviewed = 0
+    for res, wrong in zip(results, truth):
+        for label in set(res["reads"]) - set(res["review"]):
+            items += 1
+            agree += (label in res["wrong"]) == (label in wrong)
+        reviewed += len(res["review"])
+    print(f"{n} sheets at {dpi} dpi, {workers} worker(s): {dt:.2f}s ({n / dt:.1f} sheets/s)")
+    print(f"{items} items marked, {agree / max(items, 1):.1%} agree with the truth; "
+          f"{reviewed} left for review ({out_dir}, {train_sheets} sheet(s) trained)")
+    return results
+
+
+def scan_groups(paths):
+    # {key: [page paths in order]} from <key>-p<N>.<ext> names
+    groups = defaultdict(dict)
+    for path in paths:
+        m = re.match(r"(.+)-p(\d+)\.\w+$", os.path.basename(path))
+        if not m:
+            raise ValueError(f"scan name should end in -p1/-p2: {path}")
+        groups[m.group(1)][int(m.group(2))] = path
+    return {key: [pages[p] for p in sorted(pages)] for key, pages in groups.items()}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Mark scanned math worksheets.")
+    ap.add_argument("--store", default=DEFAULT_STORE)
+    ap.add_argument("--samples", default=DEFAULT_SAMPLES, help="handwriting samples from `train`")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    g = sub.add_parser("grade", help="mark scans and append the scores")
+    g.add_argument("scans", nargs="+", help="<ID or student>-p1.png, <ID or student>-p2.png, ...")
+    g.add_argument("--manifest", help="nightly manifest.json: scans are named by student")
+    g.add_argument("--student", help="student for scans named by worksheet ID")
+    g.add_argument("--workers", type=int, default=1, help="processes (0 = all cores)")
+    g.add_argument("--dry-run", action="store_true", help="print the marks, record nothing")
+
+    t = sub.add_parser("train", help="learn handwriting from a sheet filled in with the right answers")
+    t.add_argument("--id", required=True)
+    t.add_argument("--student", help="whose sheet it is; needed for history sheets (IDs starting M1H-)")
+    t.add_argument("scans", nargs="+", help="page 1 and page 2")
+
+    b = sub.add_parser("bench", help="grade synthetic scans")
+    b.add_argument("-n", type=int, default=100)
+    b.add_argument("--workers", type=int, default=1)
+    b.add_argument("--dpi", type=int, default=SCAN_DPI)
+    b.add_argument("--train", type=int, default=2, help="correctly filled sheets to learn from first")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "bench":
+        benchmark(args.n, args.workers, args.dpi, train_sheets=args.train)
+        return
+    if args.cmd == "train":
+        try:
+            mt.parse_worksheet_id(args.id)
+        except ValueError as e:
+            ap.error(str(e))
+        seen = None
+        if mt.uses_history(args.id):
+            if not args.student:
+                ap.error(f"{args.id} was drawn against a student's history; pass --student")
+            import mathschedule
+            seen = mathschedule.history_view(ScoreStore(args.store), args.student, args.id)
+        n = train(args.id, args.scans, args.samples, seen)
+        print(f"Added {n} handwriting sample(s) to {args.samples}")
+        return
+
+    import mathschedule
+    store = ScoreStore(args.store)
+    try:
+        groups = scan_groups(args.scans)
+    except ValueError as e:
+        ap.error(str(e))
+    manifest = None
+    if args.manifest:
+        with open(args.manifest, encoding="utf-8") as f:
+            manifest = json.load(f)
+    elif not args.student and not args.dry_run:
+        ap.error("--student or --manifest is needed to record scores")
+    jobs, students = [], []
+    for key, pages in groups.items():
+        if manifest is not None:
+            if key not in manifest:
+                ap.error(f"{key!r} is not in {args.manifest}")
+            ws_id, student = manifest[key]["id"], key
+        else:
+            ws_id, student = key, args.student
+        try:
+            mt.parse_worksheet_id(ws_id)
+        except ValueError as e:
+            hint = "" if manifest is not None else "; scans named by student need --manifest"
+            ap.error(f"{e}{hint}")
+        if mt.uses_history(ws_id) and not student:
+            ap.error(f"{ws_id} was drawn against a student's history; pass --student")
+        jobs.append((ws_id, pages, mathschedule.history_view(store, student, ws_id)))
+        students.append(student)
+
+    t0 = time.perf_counter()
+    results = grade_scans(jobs, args.workers, samples=args.samples)
+    for student, res in zip(students, results):
+        line = f"{res['id']}: wrong {' '.join(res['wrong']) or '-'}; review {' '.join(res['review']) or '-'}"
+        if not args.dry_run:
+            line = f"{student} {record(store, student, res):.1f}%  " + line
+        print(line)
+    print(f"Graded {len(results)} sheet(s) in {time.perf_counter() - t0:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
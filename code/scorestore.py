@@ -0,0 +1,357 @@
+# Score history store and vectorized reports.
+# Requires: pip install numpy
+#
+# Scores live in an append-only columnar store: one raw binary file per column
+# (day, student, subject, score, minutes) plus meta.json with the row count and
+# the student/subject name tables. Appends write the column bytes first and
+# bump the row count last, so a crash mid-append leaves at most a tail that the
+# next open ignores. Reports memory-map the columns and aggregate with
+# bincount/cumsum, so millions of rows take milliseconds.
+#
+#   python scorestore.py import ../scores/score.md --student Ava
+#   python scorestore.py add --student Ava --subject Math --score 92 --time 55
+#   python scorestore.py report --window 5
+#   python scorestore.py bench -n 5000000
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from datetime import date, datetime
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_STORE = os.environ.get("SCORES_STORE", os.path.join(HERE, os.pardir, "scores", "store"))
+DEFAULT_MARKDOWN = os.path.join(HERE, os.pardir, "scores", "score.md")
+
+COLUMNS = {
+    "day": np.int32,          # days since 1970-01-01 (numpy datetime64[D])
+    "student": np.int32,      # index into meta["students"]
+    "subject": np.int32,      # index into meta["subjects"]
+    "score": np.float32,
+    "minutes": np.float32,
+}
+
+
+def to_day(d):
+    # date, "YYYY-MM-DD" or "MM/DD/YYYY" -> days since epoch
+    if isinstance(d, str):
+        fmt = "%m/%d/%Y" if "/" in d else "%Y-%m-%d"
+        d = datetime.strptime(d, fmt).date()
+    return d.toordinal() - date(1970, 1, 1).toordinal()
+
+
+def from_day(day):
+    return date.fromordinal(int(day) + date(1970, 1, 1).toordinal())
+
+
+class ScoreStore:
+    def __init__(self, root=DEFAULT_STORE):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.meta = {"version": 1, "rows": 0, "students": [], "subjects": [], "imported": []}
+        try:
+            with open(self._path("meta.json"), encoding="utf-8") as f:
+                self.meta.update(json.load(f))
+        except FileNotFoundError:
+            pass
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def __len__(self):
+        return self.meta["rows"]
+
+    def _code(self, table, name):
+        names = self.meta[table]
+        try:
+            return names.index(name)
+        except ValueError:
+            names.append(name)
+            return len(names) - 1
+
+    def _save_meta(self):
+        tmp = self._path(f"meta.json.{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, indent=1)
+        os.replace(tmp, self._path("meta.json"))
+
+    def append(self, days, students, subjects, scores, minutes):
+        # names (students, subjects) are strings; the rest array-like, same length
+        cols = {
+            "day": np.asarray([to_day(d) if not isinstance(d, (int, np.integer)) else d for d in days]),
+            "student": np.asarray([self._code("students", s) for s in students]),
+            "subject": np.asarray([self._code("subjects", s) for s in subjects]),
+            "score": np.asarray(scores),
+            "minutes": np.asarray(minutes),
+        }
+        self.append_columns(cols)
+
+    def append_columns(self, cols):
+        # cols: {column: array} with student/subject already coded
+        n = len(cols["day"])
+        rows = self.meta["rows"]
+        for name, dtype in COLUMNS.items():
+            arr = np.ascontiguousarray(cols[name], dtype=dtype)
+            if len(arr) != n:
+                raise ValueError(f"column {name!r} has {len(arr)} rows, expected {n}")
+            with open(self._path(name + ".bin"), "ab") as f:
+                f.truncate(rows * arr.itemsize)      # drop any half-written tail
+                f.write(arr.tobytes())
+        self.meta["rows"] = rows + n
+        self._save_meta()
+
+    def columns(self):
+        # read-only memory maps of every column, trimmed to the committed rows
+        n = self.meta["rows"]
+        if n == 0:
+            return {name: np.empty(0, dtype) for name, dtype in COLUMNS.items()}
+        return {name: np.memmap(self._path(name + ".bin"), dtype=dtype, mode="r", shape=(n,))
+                for name, dtype in COLUMNS.items()}
+
+    def select(self, student=None, subject=None):
+        cols = self.columns()
+        mask = None
+        for col, table, name in (("student", "students", student), ("subject", "subjects", subject)):
+            if name is None:
+                continue
+            code = self.meta[table].index(name) if name in self.meta[table] else -1
+            m = cols[col] == code
+            mask = m if mask is None else mask & m
+        if mask is None:
+            return cols
+        return {name: col[mask] for name, col in cols.items()}
+
+
+# -----------------------
+# Markdown import
+# -----------------------
+def parse_markdown(path, student="default"):
+    # rows of the hand-edited table: "Date Sub score time", optionally with a
+    # Student column; returns lists ready for ScoreStore.append
+    out = {"days": [], "students": [], "subjects": [], "scores": [], "minutes": []}
+    header = None
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            parts = line.split()
+            if not parts or parts[0].startswith(("#", "```")):
+                continue
+            if header is None and parts[0].lower() == "date":
+                header = [p.lower() for p in parts]
+                continue
+            row = dict(zip(header or ["date", "sub", "score", "time"], parts))
+            out["days"].append(to_day(row["date"]))
+            out["students"].append(row.get("student", student))
+            out["subjects"].append(row["sub"])
+            out["scores"].append(float(row["score"]))
+            out["minutes"].append(float(row["time"]))
+    return out
+
+
+def import_markdown(store, path=DEFAULT_MARKDOWN, student="default", force=False):
+    # one-time import: the file's hash is recorded so a second run is a no-op
+    with open(path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    if digest in store.meta["imported"] and not force:
+        return 0
+    rows = parse_markdown(path, student)
+    store.meta["imported"].append(digest)
+    store.append(**rows)
+    return len(rows["days"])
+
+
+# -----------------------
+# Reports (vectorized)
+# -----------------------
+def _group_keys(cols, n_subjects):
+    return cols["student"].astype(np.int64) * n_subjects + cols["subject"]
+
+
+def _group_order(key, day):
+    # rows sorted by (group, day). Appends are normally chronological, and then
+    # a stable sort on a 16-bit group key (a radix sort in numpy) is enough and
+    # about ten times faster than a general two-key sort.
+    if len(key) and key.max() < 1 << 16 and np.all(day[1:] >= day[:-1]):
+        return np.argsort(key.astype(np.uint16), kind="stable")
+    return np.lexsort((day, key))
+
+
+def rolling_average(cols, window=5, n_subjects=None):
+    # mean of the last `window` scores per (student, subject), for every row in
+    # (group, day) order; returns (order, rolling) with order indexing cols
+    n_subjects = n_subjects or int(cols["subject"].max(initial=-1)) + 1
+    key = _group_keys(cols, n_subjects)
+    order = _group_order(key, cols["day"])
+    k = key[order]
+    csum = np.concatenate(([0.0], np.cumsum(cols["score"][order], dtype=np.float64)))
+    idx = np.arange(len(k))
+    starts = np.concatenate(([True], k[1:] != k[:-1]))
+    group_start = np.maximum.accumulate(np.where(starts, idx, 0))
+    lo = np.maximum(idx - window + 1, group_start)
+    return order, (csum[idx + 1] - csum[lo]) / (idx + 1 - lo)
+
+
+def latest_rolling(cols, window=5):
+    # [(student, subject, last day, rolling average)] per group; only the last
+    # `window` rows of each group are gathered, not the whole sorted table
+    if len(cols["day"]) == 0:
+        return []
+    n_subjects = int(cols["subject"].max()) + 1
+    key = _group_keys(cols, n_subjects)
+    order = _group_order(key, cols["day"])
+    k = key[order]
+    ends = np.flatnonzero(np.concatenate((k[1:] != k[:-1], [True])))
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    lo = np.maximum(starts, ends - window + 1)
+    counts = ends - lo + 1
+    pos = np.repeat(lo - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+    sums = np.bincount(np.repeat(np.arange(len(ends)), counts), weights=cols["score"][order[pos]])
+    g = k[ends]
+    return list(zip((g // n_subjects).tolist(), (g % n_subjects).tolist(),
+                    cols["day"][order[ends]].tolist(), (sums / counts).tolist()))
+
+
+def time_per_point(cols):
+    # {(student, subject): minutes per score point}
+    n_subjects = int(cols["subject"].max(initial=-1)) + 1
+    key = _group_keys(cols, n_subjects)
+    minutes = np.bincount(key, weights=cols["minutes"])
+    points = np.bincount(key, weights=cols["score"])
+    used = np.flatnonzero(points > 0)
+    return {(int(g // n_subjects), int(g % n_subjects)): float(minutes[g] / points[g]) for g in used}
+
+
+def weekly_trend(cols):
+    # Weekly mean score per (student, subject), Monday-based weeks, plus the
+    # least-squares slope in points per week over all of a group's rows.
+    # Returns ({(student, subject): [(week_start_day, mean, count)]}, {(student, subject): slope})
+    if len(cols["day"]) == 0:
+        return {}, {}
+    n_subjects = int(cols["subject"].max()) + 1
+    group = _group_keys(cols, n_subjects)
+    week = (cols["day"].astype(np.int64) + 3) // 7          # 1970-01-01 was a Thursday
+    w0 = week.min()
+    n_weeks = int(week.max() - w0) + 1
+    cell = group * n_weeks + (week - w0)
+    y = cols["score"].astype(np.float64)
+
+    cnt = np.bincount(cell)
+    tot = np.bincount(cell, weights=y)
+    weekly = {}
+    for c in np.flatnonzero(cnt):
+        g, w = divmod(int(c), n_weeks)
+        weekly.setdefault((g // n_subjects, g % n_subjects), []).append(
+            ((w + w0) * 7 - 3, tot[c] / cnt[c], int(cnt[c])))
+
+    x = (week - w0).astype(np.float64)
+    n = np.bincount(group).astype(np.float64)
+    sx, sy = np.bincount(group, weights=x), np.bincount(group, weights=y)
+    sxx, sxy = np.bincount(group, weights=x * x), np.bincount(group, weights=x * y)
+    den = n * sxx - sx * sx
+    slope = np.divide(n * sxy - sx * sy, den, out=np.zeros_like(den), where=den > 0)
+    slopes = {(int(g // n_subjects), int(g % n_subjects)): float(slope[g]) for g in np.flatnonzero(n)}
+    return weekly, slopes
+
+
+def report(store, student=None, subject=None, window=5, weeks=4):
+    cols = store.select(student, subject)
+    if len(cols["day"]) == 0:
+        print("No scores recorded.")
+        return
+    students, subjects = store.meta["students"], store.meta["subjects"]
+    tpp = time_per_point(cols)
+    weekly, slopes = weekly_trend(cols)
+    sw = max(10, *(len(s) for s in subjects))
+    print(f"{'student':<12} {'subject':<{sw}} {'last':>10} {'avg' + str(window):>7} {'min/pt':>7} {'pts/wk':>7}")
+    for st, sb, day, avg in latest_rolling(cols, window):
+        g = (st, sb)
+        print(f"{students[st]:<12} {subjects[sb]:<{sw}} {from_day(day).isoformat():>10} {avg:>7.1f} "
+              f"{tpp.get(g, float('nan')):>7.2f} {slopes.get(g, 0.0):>+7.2f}")
+        for wday, mean, n in weekly[g][-weeks:]:
+            print(f"{'':<12} {'week of ' + from_day(wday).isoformat():<{sw + 11}} {mean:>7.1f}  ({n} test(s))")
+
+
+def synthetic_columns(n, students=50, subjects=4, seed=0):
+    # n random rows over two years, for benchmarking
+    gen = np.random.default_rng(seed)
+    start = to_day(date(2024, 1, 1))
+    return {
+        "day": np.sort(gen.integers(start, start + 730, n)),
+        "student": gen.integers(0, students, n),
+        "subject": gen.integers(0, subjects, n),
+        "score": gen.normal(80, 10, n).clip(0, 100),
+        "minutes": gen.normal(55, 12, n).clip(5, 120),
+    }
+
+
+def benchmark(n=5_000_000, root=None):
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ScoreStore(root or tmp)
+        store.meta["students"] = [f"student{i}" for i in range(50)]
+        store.meta["subjects"] = ["Math", "Reading", "Science", "Writing"]
+        t0 = time.perf_counter()
+        store.append_columns(synthetic_columns(n))
+        t_write = time.perf_counter() - t0
+
+        store = ScoreStore(store.root)
+        timings = []
+        for name, fn in (("rolling average", lambda c: latest_rolling(c, 5)),
+                         ("time per point", time_per_point),
+                         ("weekly trend", weekly_trend)):
+            cols = store.columns()
+            t0 = time.perf_counter()
+            fn(cols)
+            timings.append((name, time.perf_counter() - t0))
+        print(f"{n:,} rows appended in {t_write:.2f}s")
+        for name, dt in timings:
+            print(f"{name:<16} {dt * 1000:>8.1f} ms")
+    return timings
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Score history store and reports.")
+    ap.add_argument("--store", default=DEFAULT_STORE)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    i = sub.add_parser("import", help="one-time import of the markdown score table")
+    i.add_argument("path", nargs="?", default=DEFAULT_MARKDOWN)
+    i.add_argument("--student", default="default", help="student for rows without a Student column")
+    i.add_argument("--force", action="store_true", help="import even if this file was imported before")
+
+    a = sub.add_parser("add", help="record one test result")
+    a.add_argument("--student", default="default")
+    a.add_argument("--subject", required=True)
+    a.add_argument("--score", type=float, required=True)
+    a.add_argument("--time", type=float, required=True, help="minutes taken")
+    a.add_argument("--date", default=date.today().isoformat())
+
+    r = sub.add_parser("report", help="rolling averages, time per point and weekly trend")
+    r.add_argument("--student")
+    r.add_argument("--subject")
+    r.add_argument("--window", type=int, default=5, help="tests in the rolling average")
+    r.add_argument("--weeks", type=int, default=4, help="recent weeks to list")
+
+    b = sub.add_parser("bench", help="time the reports on synthetic rows")
+    b.add_argument("-n", type=int, default=5_000_000)
+    args = ap.parse_args(argv)
+
+    if args.cmd == "bench":
+        benchmark(args.n)
+        return
+    store = ScoreStore(args.store)
+    if args.cmd == "import":
+        n = import_markdown(store, args.path, args.student, args.force)
+        print(f"Imported {n} row(s) into {store.root}" if n else f"{args.path} was already imported")
+    elif args.cmd == "add":
+        store.append([args.date], [args.student], [args.subject], [args.score], [args.time])
+        print(f"Recorded: {args.student} {args.subject} {args.score:g} in {args.time:g} min")
+    else:
+        report(store, args.student, args.subject, args.window, args.weeks)
+
+
+if __name__ == "__main__":
+    main()
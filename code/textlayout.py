@@ -0,0 +1,117 @@
+# Paragraph layout with real glyph widths for the reading test.
+#
+# Words are measured once per (font, size) and cached, lines are broken either
+# greedily or by a minimum-raggedness pass, and whole layouts are memoized so
+# repeated strings (choice labels, answer blanks) cost one dict lookup. A laid
+# out Block knows its height before anything is drawn, which lets render_pdf
+# paginate up front, and draw_block() emits it as a single text object.
+
+from functools import lru_cache
+from typing import List, Tuple
+
+
+@lru_cache(maxsize=65536)
+def word_width(word: str, font: str, size: float) -> float:
+    # reportlab is imported on the first measurement, not with the module
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    return stringWidth(word, font, size)
+
+
+def break_greedy(words: Tuple[str, ...], max_width: float, font: str, size: float) -> List[str]:
+    space = word_width(" ", font, size)
+    lines, cur, cur_w = [], [], 0.0
+    for w in words:
+        ww = word_width(w, font, size)
+        if cur and cur_w + space + ww > max_width:
+            lines.append(" ".join(cur))
+            cur, cur_w = [w], ww
+        else:
+            cur_w = cur_w + space + ww if cur else ww
+            cur.append(w)
+    if cur:
+        lines.append(" ".join(cur))
+    return lines
+
+
+def break_balanced(words: Tuple[str, ...], max_width: float, font: str, size: float) -> List[str]:
+    # minimum raggedness: minimize the sum of squared slack on every line but
+    # the last (O(n * words per line) dynamic program)
+    n = len(words)
+    if n == 0:
+        return []
+    space = word_width(" ", font, size)
+    widths = [word_width(w, font, size) for w in words]
+    best = [0.0] * (n + 1)             # best[i]: cost of laying out words[i:]
+    nxt = [n] * (n + 1)
+    for i in range(n - 1, -1, -1):
+        best[i] = float("inf")
+        line_w = -space
+        for j in range(i, n):
+            line_w += space + widths[j]
+            if line_w > max_width and j > i:
+                break
+            cost = 0.0 if j == n - 1 else (max_width - line_w) ** 2 + best[j + 1]
+            if cost < best[i]:
+                best[i] = cost
+                nxt[i] = j + 1
+    lines, i = [], 0
+    while i < n:
+        lines.append(" ".join(words[i:nxt[i]]))
+        i = nxt[i]
+    return lines
+
+
+class Block:
+    # laid-out text: lines plus the gap (in points) to leave after each one
+    __slots__ = ("lines", "gaps", "font", "size", "leading", "height")
+
+    def __init__(self, lines, gaps, font, size, leading):
+        self.lines = lines
+        self.gaps = gaps
+        self.font = font
+        self.size = size
+        self.leading = leading
+        self.height = sum(gaps)
+
+
+@lru_cache(maxsize=4096)
+def layout(text: str, max_width: float, *, font: str = "Helvetica", size: float = 11,
+           leading: float = 14, method: str = "greedy") -> Block:
+    # Same spacing rules as the old draw_wrapped: a blank line is one leading,
+    # every paragraph is followed by half a leading.
+    breaker = break_balanced if method == "balanced" else break_greedy
+    lines, gaps = [], []
+    for para in text.split("\n"):
+        if not para.strip():
+            lines.append("")
+            gaps.append(leading)
+            continue
+        para_lines = breaker(tuple(para.split()), max_width, font, size)
+        lines.extend(para_lines)
+        gaps.extend([leading] * len(para_lines))
+        gaps[-1] += leading * 0.5
+    return Block(tuple(lines), tuple(gaps), font, size, leading)
+
+
+def split_block(block: Block, max_height: float) -> Tuple[Block, Block]:
+    # first part fits in max_height (at least one line), second part is the rest
+    used, k = 0.0, 0
+    while k < len(block.lines) and used + block.gaps[k] <= max_height:
+        used += block.gaps[k]
+        k += 1
+    k = max(k, 1)
+    head = Block(block.lines[:k], block.gaps[:k], block.font, block.size, block.leading)
+    tail = Block(block.lines[k:], block.gaps[k:], block.font, block.size, block.leading)
+    return head, tail
+
+
+def draw_block(c, x: float, y: float, block: Block) -> float:
+    # one BT/ET text object for the whole block; returns the y below it
+    t = c.beginText(x, y)
+    t.setFont(block.font, block.size, block.leading)
+    for line, gap in zip(block.lines, block.gaps):
+        t.textLine(line)
+        if gap != block.leading:
+            t.moveCursor(0, gap - block.leading)
+    c.drawText(t)
+    return y - block.height